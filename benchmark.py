@@ -0,0 +1,383 @@
+# Benchmarks for the randomizer. Results are written as JSON so that runs on
+# different commits can be compared:
+#
+#   python3 benchmark.py --output before.json
+#   (change something)
+#   python3 benchmark.py --compare before.json --threshold 0.1
+#
+# With --compare the exit status is 1 when any result is worse than the
+# baseline by more than the threshold (a fraction, 0.1 = 10%).
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+# Set selections for single-call latency: the plain path, everything, lots of
+# landscapes, and the Bane and Potion rules
+Selections = {
+    "base": ["Base"],
+    "all-sets": None,
+    "landscapes": ["Adventures", "Empires", "Renaissance", "Menagerie"],
+    "alchemy-cornucopia": ["Alchemy", "Cornucopia"],
+}
+
+Directory = os.path.dirname(os.path.abspath(__file__))
+
+_ColdStart = """
+import time
+started = time.perf_counter()
+import randomizer
+imported = time.perf_counter()
+randomizer.RandomizeDominion()
+print(imported - started, time.perf_counter() - started)
+"""
+
+
+def _Result(value, unit, better="lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def _PerCall(function, number, repeat):
+    # Best time per call in microseconds. The minimum is the least noisy
+    # estimate of what the code itself costs.
+    function()
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+
+def ImportTime(runs):
+    # Fresh interpreters, so nothing is cached in the process
+    imports = []
+    firsts = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _ColdStart], cwd=Directory, text=True
+        )
+        imported, first = map(float, output.split())
+        imports.append(imported * 1e3)
+        firsts.append(first * 1e3)
+    return {
+        "import": _Result(statistics.median(imports), "ms"),
+        "import-and-first-call": _Result(statistics.median(firsts), "ms"),
+    }
+
+
+def Latency(randomizer, repeat):
+    results = {}
+    for name, setNames in Selections.items():
+        results["latency/" + name] = _Result(
+            _PerCall(lambda: randomizer.RandomizeDominion(setNames), 200, repeat),
+            "us",
+        )
+    return results
+
+
+def Throughput(randomizer, repeat):
+    results = {}
+    for name in ("base", "all-sets"):
+        setNames = Selections[name]
+        perCall = _PerCall(
+            lambda: randomizer.RandomizeDominionBatch(setNames, count=1000), 1, repeat
+        )
+        results["batch/" + name] = _Result(1000 / perCall * 1e6, "kingdoms/s", "higher")
+    return results
+
+
+def Memory(randomizer, calls):
+    # Peak memory allocated while making one call
+    results = {}
+    for name, setNames in Selections.items():
+        randomizer.RandomizeDominion(setNames)
+        tracemalloc.start()
+        peaks = []
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            randomizer.RandomizeDominion(setNames)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        results["memory/" + name] = _Result(statistics.median(peaks), "bytes")
+    return results
+
+
+def CardOperations(randomizer, repeat):
+    catalog = randomizer.LoadCatalog()
+    base = catalog.Base.cards
+    landscapes = catalog.LandscapeCards
+    cards = list(randomizer.AllCards)
+    return {
+        "cardlist/union": _Result(
+            _PerCall(lambda: base | landscapes, 10000, repeat), "us"
+        ),
+        "cardlist/intersection": _Result(
+            _PerCall(lambda: catalog.BaneCards & base, 10000, repeat), "us"
+        ),
+        "cardlist/contains": _Result(
+            _PerCall(lambda: cards[0] in landscapes, 10000, repeat), "us"
+        ),
+        "cardlist/names": _Result(
+            _PerCall(lambda: base("Chapel", "Witch"), 10000, repeat), "us"
+        ),
+        "card/hash-set": _Result(_PerCall(lambda: set(cards), 1000, repeat), "us"),
+        "card/str": _Result(
+            _PerCall(lambda: [str(card) for card in cards], 1000, repeat), "us"
+        ),
+    }
+
+
+def Probabilities(randomizer, repeat):
+    # Worked out from scratch each time, without the cache
+    results = {}
+    for name, setNames in Selections.items():
+        pools, options = randomizer._Pools(setNames, None, None)
+        results["probabilities/" + name] = _Result(
+            _PerCall(
+                lambda: randomizer.KingdomProbabilities(pools, options).Probabilities(),
+                5,
+                repeat,
+            ),
+            "us",
+        )
+    return results
+
+
+# Restrictive constraints that an unconstrained draw rarely meets, to compare
+# the constraint sampler with rerolling until a kingdom fits
+ConstraintSets = [
+    "Base",
+    "Intrigue",
+    "Seaside",
+    "Prosperity",
+    "Antiquities",
+    "Adventures",
+]
+Constraints = [{"set": "Antiquities", "min": 4}, {"type": "Event", "max": 0}]
+
+
+def _RejectionDraw(randomizer, pools, options, constraints, rng):
+    # Unconstrained draws until one meets every constraint
+    while True:
+        resultMask, landscapeList = randomizer._DrawCards(
+            pools, options, randomizer._ShuffledCards(pools, rng), rng
+        )
+        mask = resultMask | randomizer._Mask(landscapeList)
+        if all(
+            min(cap, randomizer._PopCount(mask & constraintMask)) in allowed
+            for _, constraintMask, cap, allowed in constraints.constraints
+        ):
+            return resultMask, landscapeList
+
+
+def ConstraintSampling(randomizer, repeat):
+    # The same constraints drawn by construction and by rejection sampling.
+    # The speedup is gated too, so the sampler can't fall behind rerolling.
+    pools, options = randomizer._Pools(ConstraintSets, None, None)
+    constraints = randomizer.GetConstraints(pools, options, Constraints)
+    rng = randomizer._Random(0)
+    sampler = _PerCall(lambda: constraints.Draw(rng), 200, repeat)
+    rejection = _PerCall(
+        lambda: _RejectionDraw(randomizer, pools, options, constraints, rng),
+        20,
+        repeat,
+    )
+    return {
+        "constraints/sampler": _Result(sampler, "us"),
+        "constraints/rejection": _Result(rejection, "us"),
+        "constraints/speedup": _Result(rejection / sampler, "x", "higher"),
+    }
+
+
+def History(randomizer, repeat):
+    # Draws weighted by a play history of 50 games, and recording one more
+    import history
+
+    plays = [randomizer.RandomizeDominion(seed=seed) for seed in range(50)]
+    playHistory = history.PlayHistory()
+    for kingdom in plays:
+        playHistory.Add(kingdom)
+    return {
+        "history/draw": _Result(
+            _PerCall(
+                lambda: randomizer.RandomizeDominion(history=playHistory), 200, repeat
+            ),
+            "us",
+        ),
+        "history/add": _Result(
+            _PerCall(lambda: playHistory.Add(plays[0]), 20, repeat), "us"
+        ),
+    }
+
+
+def Weights(randomizer, repeat):
+    # Draws with static weights, from their cached alias table
+    weights = {"sets": {"Antiquities": 2}, "cards": {"Alchemy: Possession": 0.1}}
+    return {
+        "weights/draw": _Result(
+            _PerCall(
+                lambda: randomizer.RandomizeDominion(weights=weights), 200, repeat
+            ),
+            "us",
+        ),
+    }
+
+
+def Balance(randomizer, repeat):
+    # Draws with every balance option on, to compare with latency/*
+    options = dict.fromkeys(randomizer.BalanceOptions, True)
+    results = {}
+    for name in ("base", "all-sets"):
+        setNames = Selections[name]
+        results["balance/" + name] = _Result(
+            _PerCall(
+                lambda: randomizer.RandomizeDominion(setNames, options), 200, repeat
+            ),
+            "us",
+        )
+    return results
+
+
+def Quality(randomizer, repeat):
+    # Best-of-N selection over all sets, and its 99th percentile over many
+    # seeds at the most candidates the Lambda handler allows
+    results = {}
+    for candidates in (100, 500):
+        results["quality/{}".format(candidates)] = _Result(
+            _PerCall(
+                lambda: randomizer.RandomizeDominion(candidates=candidates), 20, repeat
+            )
+            / 1e3,
+            "ms",
+        )
+    times = []
+    for seed in range(100 * repeat):
+        started = time.perf_counter()
+        randomizer.RandomizeDominion(seed=seed, candidates=500)
+        times.append((time.perf_counter() - started) * 1e3)
+    results["quality/500-p99"] = _Result(statistics.quantiles(times, n=100)[98], "ms")
+    return results
+
+
+def CardInfo(randomizer, repeat):
+    # Loading cardinfo.txt once, and an indexed query over a selection
+    import cardinfo
+
+    def Load():
+        with open(cardinfo.CardInfoPath, encoding="utf-8") as infoFile:
+            return cardinfo.CardIndex(infoFile.read().splitlines())
+
+    return {
+        "cardinfo/load": _Result(_PerCall(Load, 5, repeat) / 1e3, "ms"),
+        "cardinfo/query": _Result(
+            _PerCall(
+                lambda: cardinfo.FindCards(
+                    ["Base", "Intrigue"], minCost=2, maxCost=3, types=["Attack"]
+                ),
+                1000,
+                repeat,
+            ),
+            "us",
+        ),
+    }
+
+
+def RunBenchmarks(quick=False):
+    repeat = 3 if quick else 7
+    results = ImportTime(3 if quick else 10)
+
+    sys.path.insert(0, Directory)
+    import randomizer
+
+    results.update(Latency(randomizer, repeat))
+    results.update(Throughput(randomizer, repeat))
+    results.update(Memory(randomizer, 20 if quick else 100))
+    results.update(Probabilities(randomizer, repeat))
+    results.update(ConstraintSampling(randomizer, repeat))
+    results.update(History(randomizer, repeat))
+    results.update(Weights(randomizer, repeat))
+    results.update(CardOperations(randomizer, repeat))
+    results.update(CardInfo(randomizer, repeat))
+    results.update(Balance(randomizer, repeat))
+    results.update(Quality(randomizer, repeat))
+    return results
+
+
+def _Commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Directory,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def Compare(results, baseline, threshold):
+    # Returns (name, baseline value, value, change) for every result that got
+    # worse by more than threshold. Changes are positive when worse.
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous or not previous["value"]:
+            continue
+        change = (result["value"] - previous["value"]) / previous["value"]
+        if result["better"] == "higher":
+            change = -change
+        if change > threshold:
+            regressions.append((name, previous["value"], result["value"], change))
+    return regressions
+
+
+def _Main():
+    parser = argparse.ArgumentParser(description="Benchmark the randomizer")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier JSON results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("RANDOMIZER_BENCHMARK_THRESHOLD", 0.1)),
+        help="allowed slowdown as a fraction of the baseline (default 0.1)",
+    )
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions")
+    args = parser.parse_args()
+
+    results = RunBenchmarks(args.quick)
+    for name, result in sorted(results.items()):
+        print("{:32} {:>14,.2f} {}".format(name, result["value"], result["unit"]))
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(
+                {
+                    "commit": _Commit(),
+                    "python": platform.python_version(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "results": results,
+                },
+                outputFile,
+                indent=2,
+                sort_keys=True,
+            )
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)["results"]
+        regressions = Compare(results, baseline, args.threshold)
+        for name, previous, value, change in regressions:
+            print(
+                "REGRESSION {}: {:,.2f} -> {:,.2f} ({:+.0%})".format(
+                    name, previous, value, change
+                )
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    _Main()
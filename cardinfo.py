@@ -0,0 +1,203 @@
+# Card metadata: the cost, types and keywords of every card in the catalog,
+# read from cardinfo.txt on first use so that cold starts that only randomize
+# never load it. It is indexed as card masks, so a query such as "the $2 to $3
+# Attacks in these sets" is a handful of integer operations.
+#
+# Each line of cardinfo.txt is "name | cost | types | keywords", with the name
+# formatted as in kingdoms. A cost is coins, then P for a Potion and +nD for
+# debt ("3", "2P", "4+3D", "8D"), or "-" for landscapes without one. Types and
+# keywords are comma-separated. Keywords are what the card can do for the
+# player beyond its types: +Card, +Action, +Buy and +Coin for Actions, Events
+# and the like that give them, Village for +2 Actions or Villagers, Trasher,
+# Gainer, and Curser for cards that give other players Curses.
+import os
+import re
+import threading
+from randomizer import AllCards, CardList, GetCardPools, LoadCatalog
+
+CardInfoPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cardinfo.txt")
+
+Keywords = (
+    "+Card",
+    "+Action",
+    "+Buy",
+    "+Coin",
+    "Village",
+    "Trasher",
+    "Gainer",
+    "Curser",
+)
+
+_CostPattern = re.compile(r"^(\d+)?(P)?(?:\+?(\d+)D)?$")
+
+
+class CardInfo(object):
+    __slots__ = ("card", "coins", "potion", "debt", "types", "keywords")
+
+    def __init__(self, card, coins, potion, debt, types, keywords):
+        # coins is None for cards without a cost
+        self.card = card
+        self.coins = coins
+        self.potion = potion
+        self.debt = debt
+        self.types = types
+        self.keywords = keywords
+
+    def __repr__(self):
+        return "<cardinfo.CardInfo: {}>".format(self.card)
+
+
+def _Cost(text):
+    # (coins, potion, debt) for a cost in cardinfo.txt
+    if text == "-":
+        return None, False, 0
+    match = _CostPattern.match(text)
+    if not text or match is None:
+        raise ValueError("Malformed cost: {}".format(text))
+    coins, potion, debt = match.groups()
+    return int(coins or 0), potion is not None, int(debt or 0)
+
+
+def _Names(text):
+    return frozenset(name.strip() for name in text.split(",") if name.strip())
+
+
+class CardIndex(object):
+    # CardInfo by card ID, with masks of the cards of each exact coin cost,
+    # type and keyword
+    def __init__(self, lines):
+        LoadCatalog()
+        cards = {str(card): card for card in AllCards}
+        self.info = [None] * len(AllCards)
+        self.typeMasks = {}
+        self.keywordMasks = dict.fromkeys(Keywords, 0)
+        self.potionMask = 0
+        self.debtMask = 0
+        costMasks = []
+        for line in lines:
+            if not line.strip():
+                continue
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) != 4:
+                raise ValueError("Malformed card info: {}".format(line))
+            name, cost, types, keywords = fields
+            card = cards.get(name)
+            if card is None:
+                raise ValueError("Unknown card: {}".format(name))
+            info = CardInfo(card, *_Cost(cost), _Names(types), _Names(keywords))
+            self.info[card.id] = info
+
+            if info.coins is not None:
+                costMasks.extend([0] * (info.coins + 1 - len(costMasks)))
+                costMasks[info.coins] |= card.mask
+            if info.potion:
+                self.potionMask |= card.mask
+            if info.debt:
+                self.debtMask |= card.mask
+            for cardType in info.types:
+                self.typeMasks[cardType] = self.typeMasks.get(cardType, 0) | card.mask
+            for keyword in info.keywords:
+                if keyword not in self.keywordMasks:
+                    raise ValueError("Unknown keyword: {}".format(keyword))
+                self.keywordMasks[keyword] |= card.mask
+
+        missing = [str(card) for card in AllCards if self.info[card.id] is None]
+        if missing:
+            raise ValueError("No card info for: {}".format(", ".join(missing)))
+
+        # _atMost[coins] is every card costing at most that many coins, so a
+        # cost range is two lookups
+        self._atMost = []
+        mask = 0
+        for costMask in costMasks:
+            mask |= costMask
+            self._atMost.append(mask)
+
+    def Info(self, card):
+        return self.info[card.id]
+
+    def CostMask(self, minCost=None, maxCost=None):
+        # Cards costing from minCost to maxCost coins, whatever their Potion
+        # or debt. Cards without a cost are never in a range.
+        atMost = self._atMost
+        if maxCost is None or maxCost >= len(atMost):
+            maxCost = len(atMost) - 1
+        if maxCost < 0 or (minCost is not None and minCost > maxCost):
+            return 0
+        mask = atMost[maxCost]
+        if minCost is not None and minCost > 0:
+            mask &= ~atMost[minCost - 1]
+        return mask
+
+    def Find(
+        self,
+        mask=None,
+        minCost=None,
+        maxCost=None,
+        types=(),
+        keywords=(),
+        potion=None,
+        debt=None,
+    ):
+        # The cards in mask (every card when None) with a cost in the range
+        # and all of types and keywords, as a CardList. potion and debt keep
+        # only the cards with (True) or without (False) them in their cost.
+        if mask is None:
+            mask = (1 << len(AllCards)) - 1
+        if minCost is not None or maxCost is not None:
+            mask &= self.CostMask(minCost, maxCost)
+        for cardType in types:
+            if cardType not in self.typeMasks:
+                raise ValueError("Unknown card type: {}".format(cardType))
+            mask &= self.typeMasks[cardType]
+        for keyword in keywords:
+            if keyword not in self.keywordMasks:
+                raise ValueError("Unknown keyword: {}".format(keyword))
+            mask &= self.keywordMasks[keyword]
+        if potion is not None:
+            mask &= self.potionMask if potion else ~self.potionMask
+        if debt is not None:
+            mask &= self.debtMask if debt else ~self.debtMask
+        return CardList(mask=mask)
+
+
+_indexLock = threading.Lock()
+_index = None
+
+
+def LoadCardInfo():
+    # The CardIndex, read from cardinfo.txt on first use
+    global _index
+    if _index is None:
+        with _indexLock:
+            if _index is None:
+                with open(CardInfoPath, encoding="utf-8") as infoFile:
+                    _index = CardIndex(infoFile.read().splitlines())
+    return _index
+
+
+def GetCardInfo(card):
+    return LoadCardInfo().Info(card)
+
+
+def FindCards(
+    setNames=None,
+    options=None,
+    collection=None,
+    minCost=None,
+    maxCost=None,
+    types=(),
+    keywords=(),
+    potion=None,
+    debt=None,
+):
+    # CardIndex.Find over the Kingdom and landscape cards of a selection, as
+    # for randomizing: FindCards(["Base"], minCost=2, maxCost=3,
+    # types=["Attack"])
+    if collection is None:
+        pools = GetCardPools(setNames, options)
+    else:
+        pools = collection.pools
+    return LoadCardInfo().Find(
+        pools.completeMask, minCost, maxCost, types, keywords, potion, debt
+    )
@@ -0,0 +1,1071 @@
+# The card catalog: every set and the card pools used by the randomizer rules.
+# randomizer.LoadCatalog() imports this module, or loads the snapshot built from
+# it by randomizer.BuildSnapshot() when that is up to date.
+from randomizer import (
+    CardList,
+    Event,
+    KingdomScope,
+    Landmark,
+    LandscapeScope,
+    MouseScope,
+    Potion,
+    Project,
+    Set,
+    SetupRule,
+    Way,
+)
+
+# Define sets
+Base = Set("Base", "Dominion")
+Base.AddCards(
+    [
+        "Cellar",
+        "Chapel",
+        "Moat",
+        "Harbinger",
+        "Merchant",
+        "Village",
+        "Workshop",
+        "Vassal",
+        "Bureaucrat",
+        "Gardens",
+        "Militia",
+        "Moneylender",
+        "Poacher",
+        "Remodel",
+        "Smithy",
+        "Throne Room",
+        "Bandit",
+        "Council Room",
+        "Festival",
+        "Laboratory",
+        "Library",
+        "Market",
+        "Mine",
+        "Sentry",
+        "Witch",
+        "Artisan",
+    ]
+)
+Base.firstEdition = ["Adventurer", "Chancellor", "Feast", "Spy", "Thief", "Woodcutter"]
+Base.secondEdition = Base.cards(
+    "Artisan", "Bandit", "Harbinger", "Merchant", "Poacher", "Sentry", "Vassal"
+)
+
+Intrigue = Set("Intrigue")
+Intrigue.AddCards(
+    [
+        "Courtyard",
+        "Lurker",
+        "Pawn",
+        "Masquerade",
+        "Shanty Town",
+        "Steward",
+        "Swindler",
+        "Wishing Well",
+        "Baron",
+        "Bridge",
+        "Conspirator",
+        "Diplomat",
+        "Ironworks",
+        "Mill",
+        "Mining Village",
+        "Secret Passage",
+        "Courtier",
+        "Duke",
+        "Minion",
+        "Patrol",
+        "Replace",
+        "Torturer",
+        "Trading Post",
+        "Upgrade",
+        "Harem",
+        "Nobles",
+    ]
+)
+Intrigue.firstEdition = [
+    "Coppersmith",
+    "Great Hall",
+    "Saboteur",
+    "Scout",
+    "Secret Chamber",
+    "Tribute",
+]
+Intrigue.secondEdition = Intrigue.cards(
+    "Courtier", "Diplomat", "Lurker", "Mill", "Patrol", "Replace", "Secret Passage"
+)
+
+Seaside = Set("Seaside")
+Seaside.AddCards(
+    [
+        "Embargo",
+        "Haven",
+        "Lighthouse",
+        "Native Village",
+        "Pearl Diver",
+        "Ambassador",
+        "Fishing Village",
+        "Lookout",
+        "Smugglers",
+        "Warehouse",
+        "Caravan",
+        "Cutpurse",
+        "Island",
+        "Navigator",
+        "Pirate Ship",
+        "Salvager",
+        "Sea Hag",
+        "Treasure Map",
+        "Bazaar",
+        "Explorer",
+        "Ghost Ship",
+        "Merchant Ship",
+        "Outpost",
+        "Tactician",
+        "Treasury",
+        "Wharf",
+    ]
+)
+
+Alchemy = Set("Alchemy")
+Alchemy.AddCards(
+    [
+        "Herbalist",
+        "Apprentice",
+        {"name": "Transmute", "types": {Potion}},
+        {"name": "Vineyard", "types": {Potion}},
+        {"name": "Apothecary", "types": {Potion}},
+        {"name": "Scrying Pool", "types": {Potion}},
+        {"name": "University", "types": {Potion}},
+        {"name": "Alchemist", "types": {Potion}},
+        {"name": "Familiar", "types": {Potion}},
+        {"name": "Philosopher's Stone", "types": {Potion}},
+        {"name": "Golem", "types": {Potion}},
+        {"name": "Possession", "types": {Potion}},
+    ]
+)
+
+Prosperity = Set("Prosperity")
+Prosperity.AddCards(
+    [
+        "Loan",
+        "Trade Route",
+        "Watchtower",
+        "Bishop",
+        "Monument",
+        "Quarry",
+        "Talisman",
+        "Worker's Village",
+        "City",
+        "Contraband",
+        "Counting House",
+        "Mint",
+        "Mountebank",
+        "Rabble",
+        "Royal Seal",
+        "Vault",
+        "Venture",
+        "Goons",
+        "Grand Market",
+        "Hoard",
+        "Bank",
+        "Expand",
+        "Forge",
+        "King's Court",
+        "Peddler",
+    ]
+)
+
+Cornucopia = Set("Cornucopia")
+Cornucopia.AddCards(
+    [
+        "Hamlet",
+        "Fortune Teller",
+        "Menagerie",
+        "Farming Village",
+        "Horse Traders",
+        "Remake",
+        "Tournament",
+        "Young Witch",
+        "Harvest",
+        "Horn of Plenty",
+        "Hunting Party",
+        "Jester",
+        "Fairgrounds",
+    ]
+)
+
+Hinterlands = Set("Hinterlands")
+Hinterlands.AddCards(
+    [
+        "Crossroads",
+        "Duchess",
+        "Fool's Gold",
+        "Develop",
+        "Oasis",
+        "Oracle",
+        "Scheme",
+        "Tunnel",
+        "Jack of All Trades",
+        "Noble Brigand",
+        "Nomad Camp",
+        "Silk Road",
+        "Spice Merchant",
+        "Trader",
+        "Cache",
+        "Cartographer",
+        "Embassy",
+        "Haggler",
+        "Highway",
+        "Ill-gotten Gains",
+        "Inn",
+        "Mandarin",
+        "Margrave",
+        "Stables",
+        "Border Village",
+        "Farmland",
+    ]
+)
+
+DarkAges = Set("Dark Ages")
+DarkAges.AddCards(
+    [
+        "Poor House",
+        "Beggar",
+        "Squire",
+        "Vagrant",
+        "Forager",
+        "Hermit",
+        "Market Square",
+        "Sage",
+        "Storeroom",
+        "Urchin",
+        "Armory",
+        "Death Cart",
+        "Feodum",
+        "Fortress",
+        "Ironmonger",
+        "Marauder",
+        "Procession",
+        "Rats",
+        "Scavenger",
+        "Wandering Minstrel",
+        "Band of Misfits",
+        "Bandit Camp",
+        "Catacombs",
+        "Count",
+        "Counterfeit",
+        "Cultist",
+        "Graverobber",
+        "Junk Dealer",
+        "Knights",
+        "Mystic",
+        "Pillage",
+        "Rebuild",
+        "Rogue",
+        "Altar",
+        "Hunting Grounds",
+    ]
+)
+
+Guilds = Set("Guilds")
+Guilds.AddCards(
+    [
+        "Candlestick Maker",
+        "Stonemason",
+        "Doctor",
+        "Masterpiece",
+        "Advisor",
+        "Plaza",
+        "Taxman",
+        "Herald",
+        "Baker",
+        "Butcher",
+        "Journeyman",
+        "Merchant Guild",
+        "Soothsayer",
+    ]
+)
+
+Adventures = Set("Adventures")
+Adventures.AddCards(
+    [
+        "Coin of the Realm",
+        "Page",
+        "Peasant",
+        "Ratcatcher",
+        "Raze",
+        "Amulet",
+        "Caravan Guard",
+        "Dungeon",
+        "Gear",
+        "Guide",
+        "Duplicate",
+        "Magpie",
+        "Messenger",
+        "Miser",
+        "Port",
+        "Ranger",
+        "Transmogrify",
+        "Artificer",
+        "Bridge Troll",
+        "Distant Lands",
+        "Giant",
+        "Haunted Woods",
+        "Lost City",
+        "Relic",
+        "Royal Carriage",
+        "Storyteller",
+        "Swamp Hag",
+        "Treasure Trove",
+        "Wine Merchant",
+        "Hireling",
+        {"name": "Alms", "types": {Event}},
+        {"name": "Borrow", "types": {Event}},
+        {"name": "Quest", "types": {Event}},
+        {"name": "Save", "types": {Event}},
+        {"name": "Scouting Party", "types": {Event}},
+        {"name": "Travelling Fair", "types": {Event}},
+        {"name": "Bonfire", "types": {Event}},
+        {"name": "Expedition", "types": {Event}},
+        {"name": "Ferry", "types": {Event}},
+        {"name": "Plan", "types": {Event}},
+        {"name": "Mission", "types": {Event}},
+        {"name": "Pilgrimage", "types": {Event}},
+        {"name": "Ball", "types": {Event}},
+        {"name": "Raid", "types": {Event}},
+        {"name": "Seaway", "types": {Event}},
+        {"name": "Lost Arts", "types": {Event}},
+        {"name": "Training", "types": {Event}},
+        {"name": "Inheritance", "types": {Event}},
+        {"name": "Pathfinding", "types": {Event}},
+    ]
+)
+
+Empires = Set("Empires")
+Empires.AddCards(
+    [
+        "Engineer",
+        "City Quarter",
+        "Overlord",
+        "Royal Blacksmith",
+        "Encampment/Plunder",
+        "Patrician/Emporium",
+        "Settlers/Bustling Village",
+        "Castles",
+        "Catapult/Rocks",
+        "Chariot Race",
+        "Enchantress",
+        "Farmers' Market",
+        "Gladiator/Fortune",
+        "Sacrifice",
+        "Temple",
+        "Villa",
+        "Archive",
+        "Capital",
+        "Charm",
+        "Crown",
+        "Forum",
+        "Groundskeeper",
+        "Legionary",
+        "Wild Hunt",
+        {"name": "Advance", "types": {Event}},
+        {"name": "Annex", "types": {Event}},
+        {"name": "Banquet", "types": {Event}},
+        {"name": "Conquest", "types": {Event}},
+        {"name": "Delve", "types": {Event}},
+        {"name": "Dominate", "types": {Event}},
+        {"name": "Donate", "types": {Event}},
+        {"name": "Salt the Earth", "types": {Event}},
+        {"name": "Ritual", "types": {Event}},
+        {"name": "Tax", "types": {Event}},
+        {"name": "Trade", "types": {Event}},
+        {"name": "Triumph", "types": {Event}},
+        {"name": "Wedding", "types": {Event}},
+        {"name": "Windfall", "types": {Event}},
+        {"name": "Aqueduct", "types": {Landmark}},
+        {"name": "Arena", "types": {Landmark}},
+        {"name": "Bandit Fort", "types": {Landmark}},
+        {"name": "Basilica", "types": {Landmark}},
+        {"name": "Baths", "types": {Landmark}},
+        {"name": "Battlefield", "types": {Landmark}},
+        {"name": "Colonnade", "types": {Landmark}},
+        {"name": "Defiled Shrine", "types": {Landmark}},
+        {"name": "Fountain", "types": {Landmark}},
+        {"name": "Keep", "types": {Landmark}},
+        {"name": "Labyrinth", "types": {Landmark}},
+        {"name": "Mountain Pass", "types": {Landmark}},
+        {"name": "Museum", "types": {Landmark}},
+        {"name": "Obelisk", "types": {Landmark}},
+        {"name": "Orchard", "types": {Landmark}},
+        {"name": "Palace", "types": {Landmark}},
+        {"name": "Tomb", "types": {Landmark}},
+        {"name": "Tower", "types": {Landmark}},
+        {"name": "Triumphal Arch", "types": {Landmark}},
+        {"name": "Wall", "types": {Landmark}},
+        {"name": "Wolf Den", "types": {Landmark}},
+    ]
+)
+
+Nocturne = Set("Nocturne")
+Nocturne.AddCards(
+    [
+        "Bard",
+        "Blessed Village",
+        "Cemetary + Haunted Mirror (Heirloom)",
+        "Changeling",
+        "Cobbler",
+        "Conclave",
+        "Crypt",
+        "Cursed Village",
+        "Den of Sin",
+        "Devil's Workshop",
+        "Druid",
+        "Exorcist",
+        "Faithful Hound",
+        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
+        "Guardian",
+        "Ghost Town",
+        "Idol",
+        "Leprechaun",
+        "Monastery",
+        "Necromancer + Zombies",
+        "Night Watchman",
+        "Pixie + Goat (Heirloom)",
+        "Pooka + Cursed Gold (Heirloom)",
+        "Sacred Grove",
+        "Secret Cave + Magic Lamp (Heirloom)",
+        "Shepherd + Pasture (Heirloom)",
+        "Raider",
+        "Skulk",
+        "Tormentor",
+        "Tracker + Pouch (Heirloom)",
+        "Tragic Hero",
+        "Vampire",
+        "Werewolf",
+    ]
+)
+
+Renaissance = Set("Renaissance")
+Renaissance.AddCards(
+    [
+        "Border Guard",
+        "Ducat",
+        "Lackeys",
+        "Acting Troupe",
+        "Cargo Ship",
+        "Experiment",
+        "Improve",
+        "Flag Bearer",
+        "Hideout",
+        "Inventor",
+        "Mountain Village",
+        "Patron",
+        "Priest",
+        "Research",
+        "Silk Merchant",
+        "Old Witch",
+        "Recruiter",
+        "Scepter",
+        "Scholar",
+        "Sculptor",
+        "Seer",
+        "Spices",
+        "Swashbuckler",
+        "Treasurer",
+        "Villain",
+        {"name": "Cathedral", "types": {Project}},
+        {"name": "City Gate", "types": {Project}},
+        {"name": "Pageant", "types": {Project}},
+        {"name": "Sewers", "types": {Project}},
+        {"name": "Star Chart", "types": {Project}},
+        {"name": "Exploration", "types": {Project}},
+        {"name": "Fair", "types": {Project}},
+        {"name": "Silos", "types": {Project}},
+        {"name": "Sinister Plot", "types": {Project}},
+        {"name": "Academy", "types": {Project}},
+        {"name": "Capitalism", "types": {Project}},
+        {"name": "Fleet", "types": {Project}},
+        {"name": "Guildhall", "types": {Project}},
+        {"name": "Piazza", "types": {Project}},
+        {"name": "Road Network", "types": {Project}},
+        {"name": "Barracks", "types": {Project}},
+        {"name": "Crop Rotation", "types": {Project}},
+        {"name": "Innovation", "types": {Project}},
+        {"name": "Canal", "types": {Project}},
+        {"name": "Citadel", "types": {Project}},
+    ]
+)
+
+Menagerie = Set("Menagerie")
+Menagerie.AddCards(
+    [
+        "Animal Fair",
+        "Barge",
+        "Black Cat",
+        "Bounty Hunter",
+        "Camel Train",
+        "Cardinal",
+        "Cavalry",
+        "Coven",
+        "Destrier",
+        "Displace",
+        "Falconer",
+        "Fisherman",
+        "Gatekeeper",
+        "Goatherd",
+        "Groom",
+        "Hostelry",
+        "Hunting Lodge",
+        "Kiln",
+        "Livery",
+        "Mastermind",
+        "Paddock",
+        "Sanctuary",
+        "Scrap",
+        "Sheepdog",
+        "Sleigh",
+        "Snowy Village",
+        "Stockpile",
+        "Supplies",
+        "Village Green",
+        "Wayfarer",
+        {"name": "Alliance", "types": {Event}},
+        {"name": "Banish", "types": {Event}},
+        {"name": "Bargain", "types": {Event}},
+        {"name": "Commerce", "types": {Event}},
+        {"name": "Delay", "types": {Event}},
+        {"name": "Demand", "types": {Event}},
+        {"name": "Desperation", "types": {Event}},
+        {"name": "Enclave", "types": {Event}},
+        {"name": "Enhance", "types": {Event}},
+        {"name": "Gamble", "types": {Event}},
+        {"name": "Invest", "types": {Event}},
+        {"name": "March", "types": {Event}},
+        {"name": "Populate", "types": {Event}},
+        {"name": "Pursue", "types": {Event}},
+        {"name": "Reap", "types": {Event}},
+        {"name": "Ride", "types": {Event}},
+        {"name": "Seize the Day", "types": {Event}},
+        {"name": "Stampede", "types": {Event}},
+        {"name": "Toil", "types": {Event}},
+        {"name": "Transport", "types": {Event}},
+        {"name": "Way of the Butterfly", "types": {Way}},
+        {"name": "Way of the Camel", "types": {Way}},
+        {"name": "Way of the Chameleon", "types": {Way}},
+        {"name": "Way of the Frog", "types": {Way}},
+        {"name": "Way of the Goat", "types": {Way}},
+        {"name": "Way of the Horse", "types": {Way}},
+        {"name": "Way of the Mole", "types": {Way}},
+        {"name": "Way of the Monkey", "types": {Way}},
+        {"name": "Way of the Mouse", "types": {Way}},
+        {"name": "Way of the Mule", "types": {Way}},
+        {"name": "Way of the Otter", "types": {Way}},
+        {"name": "Way of the Owl", "types": {Way}},
+        {"name": "Way of the Ox", "types": {Way}},
+        {"name": "Way of the Pig", "types": {Way}},
+        {"name": "Way of the Rat", "types": {Way}},
+        {"name": "Way of the Seal", "types": {Way}},
+        {"name": "Way of the Sheep", "types": {Way}},
+        {"name": "Way of the Squirrel", "types": {Way}},
+        {"name": "Way of the Turtle", "types": {Way}},
+        {"name": "Way of the Worm", "types": {Way}},
+    ]
+)
+
+Antiquities = Set("Antiquities")
+Antiquities.AddCards(
+    [
+        "Inscription",
+        "Agora",
+        "Discovery",
+        "Aquifer",
+        "Tomb Raider",
+        "Curio",
+        "Gamepiece",
+        "Dig",
+        "Moundbuilder Village",
+        "Encroach",
+        "Stoneworks",
+        "Graveyard",
+        "Inspector",
+        "Archaeologist",
+        "Mission House",
+        "Mendicant",
+        "Profiteer",
+        "Miner",
+        "Pyramid",
+        "Mastermind",
+        "Mausoleum",
+        "Shipwreck",
+        "Collector",
+        "Pharaoh",
+        "Grave Watcher",
+        "Stronghold",
+        "Snake Charmer",
+    ]
+)
+
+# Define Landscape cards
+Events = Adventures.events | Empires.events | Menagerie.events
+Landmarks = Empires.landmarks
+Projects = Renaissance.projects
+Ways = Menagerie.ways
+LandscapeCards = Events | Landmarks | Projects | Ways
+
+# Define cards requiring potions
+PotionCards = Alchemy.potionCards
+
+# Define randomizer rules
+PlatinumLove = Prosperity.cards.union(
+    Base.cards("Artisan", "Council Room", "Merchant", "Mine"),
+    Intrigue.cards("Harem", "Nobles"),
+    Seaside.cards("Explorer", "Treasure Map"),
+    Alchemy.cards("Philosopher's Stone"),
+    Cornucopia.cards("Tournament"),
+    Hinterlands.cards("Border Village", "Cache", "Duchess", "Embassy", "Fool's Gold"),
+    DarkAges.cards("Altar", "Counterfeit", "Hunting Grounds", "Poor House"),
+    Guilds.cards("Masterpiece", "Soothsayer"),
+    Adventures.cards(
+        "Hireling", "Lost City", "Page", "Treasure Trove", "Seaway", "Training"
+    ),
+    Empires.cards(
+        "Capital",
+        "Castles",
+        "Chariot Race",
+        "Crown",
+        "Encampment/Plunder",
+        "Farmers' Market",
+        "Gladiator/Fortune",
+        "Groundskeeper",
+        "Legionary",
+        "Patrician/Emporium",
+        "Sacrifice",
+        "Temple",
+        "Wild Hunt",
+        "Triumph",
+        "Delve",
+        "Wedding",
+        "Conquest",
+        "Dominate",
+        "Basilica",
+        "Keep",
+    ),
+    Nocturne.cards(
+        "Pooka + Cursed Gold (Heirloom)",
+        "Raider",
+        "Sacred Grove",
+        "Secret Cave + Magic Lamp (Heirloom)",
+        "Tragic Hero",
+    ),
+    Renaissance.cards("Ducat", "Scepter", "Spices", "Capitalism", "Guildhall"),
+    Menagerie.cards(
+        "Supplies",
+        "Camel Train",
+        "Stockpile",
+        "Livery",
+        "Animal Fair",
+        "Commerce",
+        "Enclave",
+        "Way of the Chameleon",
+    ),
+    Antiquities.cards(
+        "Agora",
+        "Archaeologist",
+        "Curio",
+        "Discovery",
+        "Encroach",
+        "Gamepiece",
+        "Moundbuilder Village",
+        "Pharaoh",
+        "Pyramid",
+        "Snake Charmer",
+        "Stoneworks",
+    ),
+)
+
+ShelterLove = DarkAges.cards.union(
+    Base.cards("Remodel", "Mine"),
+    Intrigue.cards("Replace", "Upgrade"),
+    Seaside.cards("Salvager"),
+    Alchemy.cards("Apprentice", "Scrying Pool"),
+    Prosperity.cards("Bishop", "Expand", "Forge"),
+    Cornucopia.cards("Remake"),
+    Hinterlands.cards("Develop", "Farmland", "Trader"),
+    Adventures.cards("Raze", "Transmogrify"),
+    Empires.cards(
+        "Catapult/Rocks",
+        "Sacrifice",
+        "Trade",
+        "Fountain",
+        "Labyrinth",
+        "Museum",
+        "Tomb",
+    ),
+    Guilds.cards("Butcher", "Journeyman", "Stonemason", "Taxman"),
+    Nocturne.cards(
+        "Cemetary + Haunted Mirror (Heirloom)", "Exorcist", "Necromancer + Zombies"
+    ),
+    Renaissance.cards("Priest", "Pageant"),
+    Menagerie.cards(
+        "Camel Train", "Scrap", "Displace", "Enhance", "Way of the Butterfly"
+    ),
+    Antiquities.cards(
+        "Collector",
+        "Graveyard",
+        "Mendicant",
+        "Pharaoh",
+        "Profiteer",
+        "Shipwreck",
+        "Snake Charmer",
+        "Stoneworks",
+    ),
+)
+
+LooterCards = DarkAges.cards("Death Cart", "Marauder", "Cultist")
+
+SpoilsCards = DarkAges.cards("Bandit Camp", "Marauder", "Pillage")
+
+BoonCards = Nocturne.cards(
+    "Bard",
+    "Blessed Village",
+    "Druid",
+    "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
+    "Idol",
+    "Pixie + Goat (Heirloom)",
+    "Sacred Grove",
+    "Tracker + Pouch (Heirloom)",
+)
+
+HexCards = Nocturne.cards(
+    "Cursed Village", "Leprechaun", "Skulk", "Tormentor", "Vampire", "Werewolf"
+)
+
+WishCards = Nocturne.cards("Leprechaun", "Secret Cave + Magic Lamp (Heirloom)")
+
+GhostCards = Nocturne.cards("Cemetary + Haunted Mirror (Heirloom)", "Exorcist")
+
+# Cards besides the Boon cards that need Will-o'-wisps
+WispCards = Nocturne.cards("Exorcist")
+
+BatCards = Nocturne.cards("Vampire")
+
+ImpCards = Nocturne.cards("Devil's Workshop", "Exorcist", "Tormentor")
+
+MadmanCards = DarkAges.cards("Hermit")
+
+MercenaryCards = DarkAges.cards("Urchin")
+
+PrizeCards = Cornucopia.cards("Tournament")
+
+YoungWitchCards = Cornucopia.cards("Young Witch")
+
+MouseCards = Menagerie.cards("Way of the Mouse")
+
+HorseCards = Menagerie.cards(
+    "Cavalry",
+    "Groom",
+    "Hostelry",
+    "Livery",
+    "Paddock",
+    "Scrap",
+    "Sleigh",
+    "Supplies",
+    # Events
+    "Bargain",
+    "Demand",
+    "Ride",
+    "Stampede",
+)
+
+TrapLove = Antiquities.cards.union(
+    Base.cards("Vassal", "Remodel", "Workshop", "Mine", "Library", "Artisan"),
+    Intrigue.cards(
+        "Courtyard",
+        "Lurker",
+        "Masquerade",
+        "Swindler",
+        "Ironworks",
+        "Minion",
+        "Replace",
+        "Upgrade",
+    ),
+    Seaside.cards("Lookout", "Warehouse", "Navigator", "Salvager"),
+    Alchemy.cards("University"),
+    Prosperity.cards(
+        "Loan", "Watchtower", "Bishop", "Vault", "Venture", "Goons", "Expand", "Forge"
+    ),
+    Cornucopia.cards(
+        "Fortune Teller",
+        "Menagerie",
+        "Farming Village",
+        "Remake",
+        "Young Witch",
+        "Harvest",
+        "Hunting Party",
+    ),
+    Hinterlands.cards(
+        "Develop",
+        "Oracle",
+        "Trader",
+        "Cartographer",
+        "Embassy",
+        "Haggler",
+        "Margrave",
+        "Border Village",
+        "Farmland",
+    ),
+    DarkAges.cards(
+        "Hermit",
+        "Storeroom",
+        "Urchin",
+        "Feodum",
+        "Rats",
+        "Wandering Minstrel",
+        "Catacombs",
+        "Rebuild",
+        "Rogue",
+    ),
+    Guilds.cards("Stonemason", "Butcher"),
+    Adventures.cards(
+        "Raze",
+        "Guide",
+        "Duplicate",
+        "Magpie",
+        "Messenger",
+        "Transmogrify",
+        "Scouting Party",
+    ),
+    Empires.cards(
+        "Engineer",
+        "Farmers' Market",
+        "Catapult/Rocks",
+        "Gladiator/Fortune",
+        "Temple",
+        "Forum",
+        "Legionary",
+        "Triumph",
+        "Ritual",
+        "Conquest",
+        "Labyrinth",
+        "Museum",
+    ),
+    Nocturne.cards(
+        "Monastery",
+        "Changeling",
+        "Secret Cave + Magic Lamp (Heirloom)",
+        "Devil's Workshop",
+        "Exorcist",
+        "Cobbler",
+        "Vampire",
+        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
+    ),
+    Renaissance.cards(
+        "Experiment",
+        "Inventor",
+        "Research",
+        "Recruiter",
+        "Scholar",
+        "Sculptor",
+        "Villain",
+    ),
+    Menagerie.cards(
+        "Camel Train",
+        "Scrap",
+        "Bounty Hunter",
+        "Groom",
+        "Hunting Lodge",
+        "Displace",
+        "Kiln",
+        "Livery",
+        "Destrier",
+        "Enhance",
+        "Commerce",
+        "Populate",
+        "Way of the Mole",
+    ),
+)
+
+BaneCards = CardList().union(
+    Adventures.cards(
+        "Amulet",
+        "Caravan Guard",
+        "Coin of the Realm",
+        "Dungeon",
+        "Gear",
+        "Guide",
+        "Page",
+        "Peasant",
+        "Ratcatcher",
+        "Raze",
+    ),
+    Alchemy.cards("Herbalist"),
+    Antiquities.cards(
+        "Discovery",
+        "Gamepiece",
+        "Grave Watcher",
+        "Inscription",
+        "Inspector",
+        "Profiteer",
+        "Shipwreck",
+        "Tomb Raider",
+        "Miner",
+    ),
+    Base.cards(
+        "Cellar",
+        "Chapel",
+        "Harbinger",
+        "Merchant",
+        "Moat",
+        "Vassal",
+        "Village",
+        "Workshop",
+    ),
+    Cornucopia.cards("Fortune Teller", "Hamlet", "Menagerie"),
+    DarkAges.cards(
+        "Beggar",
+        "Forager",
+        "Hermit",
+        "Market Square",
+        "Sage",
+        "Squire",
+        "Storeroom",
+        "Urchin",
+        "Vagrant",
+    ),
+    Empires.cards(
+        "Castles",
+        "Catapult/Rocks",
+        "Chariot Race",
+        "Encampment/Plunder",
+        "Enchantress",
+        "Farmers' Market",
+        "Gladiator/Fortune",
+        "Patrician/Emporium",
+        "Settlers/Bustling Village",
+    ),
+    Guilds.cards("Candlestick Maker", "Doctor", "Masterpiece", "Stonemason"),
+    Hinterlands.cards(
+        "Crossroads", "Develop", "Duchess", "Fool's Gold", "Oasis", "Scheme", "Tunnel"
+    ),
+    Intrigue.cards(
+        "Courtyard",
+        "Lurker",
+        "Masquerade",
+        "Pawn",
+        "Shanty Town",
+        "Steward",
+        "Swindler",
+        "Wishing Well",
+    ),
+    Menagerie.cards(
+        "Black Cat",
+        "Camel Train",
+        "Goatherd",
+        "Scrap",
+        "Sheepdog",
+        "Sleigh",
+        "Snowy Village",
+        "Stockpile",
+        "Supplies",
+    ),
+    Nocturne.cards(
+        "Changeling",
+        "Druid",
+        "Faithful Hound",
+        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
+        "Ghost Town",
+        "Guardian",
+        "Leprechaun",
+        "Monastery",
+        "Night Watchman",
+        "Pixie + Goat (Heirloom)",
+        "Secret Cave + Magic Lamp (Heirloom)",
+        "Tracker + Pouch (Heirloom)",
+    ),
+    Prosperity.cards("Loan", "Trade Route", "Watchtower"),
+    Renaissance.cards(
+        "Acting Troupe",
+        "Border Guard",
+        "Cargo Ship",
+        "Ducat",
+        "Experiment",
+        "Improve",
+        "Lackeys",
+    ),
+    Seaside.cards(
+        "Ambassador",
+        "Embargo",
+        "Fishing Village",
+        "Haven",
+        "Lighthouse",
+        "Lookout",
+        "Native Village",
+        "Pearl Diver",
+        "Smugglers",
+        "Warehouse",
+    ),
+)
+
+# Define setup rules: what to set out when a card of a pool is picked. Rules
+# with a sample count are evaluated in this order, which the seeded random
+# stream depends on.
+SetupRules = [
+    SetupRule(
+        PlatinumLove,
+        KingdomScope | LandscapeScope,
+        cards=("Prosperity: Colony", "Prosperity: Platinum"),
+        sample=2,
+        cardSet=Prosperity,
+    ),
+    SetupRule(
+        ShelterLove,
+        KingdomScope | LandscapeScope,
+        cards=("Dark Ages: Shelters",),
+        sample=2,
+        cardSet=DarkAges,
+    ),
+    # Technically Boulder Traps is not a landscape card, but it is set up
+    # differently than other Kingdom cards
+    SetupRule(
+        TrapLove,
+        KingdomScope | LandscapeScope,
+        landscapes=("(Antiquities Trap): Boulder Traps",),
+        sample=1,
+        cardSet=Antiquities,
+    ),
+    SetupRule(PotionCards, cards=("Alchemy: Potions",)),
+    SetupRule(
+        PrizeCards,
+        cards=(
+            "Cornucopia: Bag of Gold",
+            "Cornucopia: Diadem",
+            "Cornucopia: Followers",
+            "Cornucopia: Princess",
+            "Cornucopia: Trusty Steed",
+        ),
+    ),
+    SetupRule(LooterCards, cards=("Dark Ages: Ruins",)),
+    SetupRule(MadmanCards, cards=("Dark Ages: Madman",)),
+    SetupRule(MercenaryCards, cards=("Dark Ages: Mercenary",)),
+    SetupRule(SpoilsCards, cards=("Dark Ages: Spoils",)),
+    SetupRule(GhostCards, cards=("Nocturne: Ghost",)),
+    SetupRule(
+        BoonCards,
+        KingdomScope | MouseScope,
+        cards=("Nocturne: Will-o'-wisp",),
+        landscapes=("(Nocturne: Boons Deck)",),
+    ),
+    SetupRule(
+        HexCards, KingdomScope | MouseScope, landscapes=("(Nocturne: Hexes Deck)",)
+    ),
+    SetupRule(WispCards, cards=("Nocturne: Will-o'-wisp",)),
+    SetupRule(BatCards, cards=("Nocturne: Bat",)),
+    SetupRule(ImpCards, cards=("Nocturne: Imp",)),
+    SetupRule(WishCards, cards=("Nocturne: Wish",)),
+    SetupRule(
+        HorseCards,
+        KingdomScope | LandscapeScope | MouseScope,
+        cards=("Menagerie: Horse",),
+    ),
+]
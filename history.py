@@ -0,0 +1,275 @@
+# Play history for a game group: the kingdoms it has played, so that
+# randomizing can make recently and often played cards less likely. Plays live
+# in the SQLite file named by RANDOMIZER_HISTORY_DB. SetStore() plugs in
+# another store with the same Add/Recent methods, such as MemoryStore, and
+# without either, using a history raises StoreError. On Lambda the code's
+# directory is read-only and local to each container, so there is no default
+# file.
+#
+# Each play adds 1 to the score of its cards, and every play after it halves
+# that in HalfLife plays. A card's weight is 1 / (1 + Strength * score), so a
+# card from the last game is 1 / (1 + Strength) as likely as a fresh one.
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from randomizer import AllCards, DecodeShareCode, LoadCatalog, WeightTree
+
+GroupIdPattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+HalfLife = float(os.environ.get("RANDOMIZER_HISTORY_HALF_LIFE", 5))
+Strength = float(os.environ.get("RANDOMIZER_HISTORY_STRENGTH", 4))
+
+# Scores below this count as never played, which bounds the plays that are
+# read and the weights that change with each new play
+MinScore = 1e-3
+
+# Seconds a loaded history is reused before it is read from the store again
+HistoryTtl = float(os.environ.get("RANDOMIZER_HISTORY_TTL", 60))
+
+# Most pools whose weight trees a history keeps up to date
+MaxTrees = 16
+
+
+class StoreError(OSError):
+    # The store isn't set up or can't be reached. Stores raise it instead of
+    # their own errors so callers can report it without knowing the store.
+    pass
+
+
+class SqliteStore(object):
+    def __init__(self, path):
+        self.path = path
+        self._created = False
+
+    def _Connect(self):
+        connection = sqlite3.connect(self.path)
+        if not self._created:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS plays (groupId TEXT NOT NULL, "
+                    "playedAt REAL NOT NULL, cards TEXT NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS playsByGroup "
+                    "ON plays (groupId, playedAt)"
+                )
+            self._created = True
+        return connection
+
+    def Add(self, groupId, playedAt, cards):
+        try:
+            connection = self._Connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO plays VALUES (?, ?, ?)",
+                        (groupId, playedAt, json.dumps(cards)),
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error as error:
+            raise StoreError("Play history is unavailable: {}".format(error))
+
+    def Recent(self, groupId, limit):
+        # The card names of the last limit plays, oldest first
+        try:
+            connection = self._Connect()
+            try:
+                rows = connection.execute(
+                    "SELECT cards FROM plays WHERE groupId = ? "
+                    "ORDER BY playedAt DESC, rowid DESC LIMIT ?",
+                    (groupId, limit),
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error as error:
+            raise StoreError("Play history is unavailable: {}".format(error))
+        return [json.loads(cards) for cards, in reversed(rows)]
+
+
+class MemoryStore(object):
+    def __init__(self):
+        self.plays = {}
+
+    def Add(self, groupId, playedAt, cards):
+        self.plays.setdefault(groupId, []).append((playedAt, list(cards)))
+
+    def Recent(self, groupId, limit):
+        plays = sorted(self.plays.get(groupId, ()), key=lambda play: play[0])
+        return [cards for _, cards in plays[-limit:]] if limit else []
+
+
+_names = None
+
+
+def _CardNames():
+    # Formatted name to card, as plays are stored
+    global _names
+    if _names is None:
+        LoadCatalog()
+        _names = {str(card): card for card in AllCards}
+    return _names
+
+
+def _KingdomCards(kingdom):
+    # The cards of a kingdom as RandomizeDominion returns it, in either format
+    if isinstance(kingdom, dict):
+        kingdom = DecodeShareCode(kingdom.get("code"))
+    if not isinstance(kingdom, list):
+        raise ValueError("A kingdom must be a list of cards")
+    names = _CardNames()
+    cards = []
+    for line in kingdom:
+        if not isinstance(line, str):
+            raise ValueError("A kingdom must be a list of cards")
+        for prefix in ("Bane is ", "Mouse is "):
+            if line.startswith(prefix):
+                line = line[len(prefix) :]
+        # Setup cards such as Potions aren't picked, so they have no weight
+        if line in names:
+            cards.append(names[line])
+    return cards
+
+
+class PlayHistory(object):
+    # Card weights from a list of plays, oldest first, each a list of card
+    # names. Weight trees for pools are built on first use and then updated
+    # in place as plays are added.
+    def __init__(self, plays=(), halfLife=HalfLife, strength=Strength):
+        self.decay = 0.5 ** (1 / halfLife)
+        self.strength = strength
+        # Card ID to score, for cards with a score of at least MinScore
+        self.scores = {}
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+        names = _CardNames()
+        for play in plays:
+            self._Add([names[name] for name in play if name in names])
+
+    @staticmethod
+    def PlayLimit(halfLife=HalfLife):
+        # Plays after which a card's score is below MinScore
+        return math.ceil(halfLife * math.log2(1 / MinScore))
+
+    def Weight(self, card):
+        return 1 / (1 + self.strength * self.scores.get(card.id, 0))
+
+    def Tree(self, pools, weights=None):
+        # The weight tree for pools, with each card's weight multiplied by its
+        # static weight in weights, a randomizer.CardWeights
+        key = (pools.key, None if weights is None else weights.key)
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is None:
+                entry = (
+                    WeightTree(
+                        pools.complete,
+                        [self._Weight(card, weights) for card in pools.complete],
+                    ),
+                    weights,
+                )
+                self._trees[key] = entry
+                if len(self._trees) > MaxTrees:
+                    self._trees.popitem(last=False)
+            else:
+                self._trees.move_to_end(key)
+            return entry[0]
+
+    def _Weight(self, card, weights):
+        if weights is None:
+            return self.Weight(card)
+        return self.Weight(card) * weights.Weight(card)
+
+    def Add(self, kingdom):
+        # Records kingdom as played. Only the cards whose score changes get
+        # new weights, in every tree already built.
+        cards = _KingdomCards(kingdom)
+        with self._lock:
+            for card in self._Add(cards):
+                for tree, weights in self._trees.values():
+                    tree.Set(card, self._Weight(card, weights))
+        return cards
+
+    def _Add(self, cards):
+        # Returns the cards whose scores changed
+        changed = []
+        for cardId, score in list(self.scores.items()):
+            score *= self.decay
+            if score < MinScore:
+                del self.scores[cardId]
+            else:
+                self.scores[cardId] = score
+            changed.append(AllCards[cardId])
+        for card in cards:
+            if card.id not in self.scores:
+                changed.append(card)
+            self.scores[card.id] = self.scores.get(card.id, 0) + 1
+        return changed
+
+
+Store = None
+if os.environ.get("RANDOMIZER_HISTORY_DB"):
+    Store = SqliteStore(os.environ["RANDOMIZER_HISTORY_DB"])
+
+_historiesLock = threading.Lock()
+_histories = {}
+
+
+def SetStore(store):
+    global Store
+    with _historiesLock:
+        Store = store
+        _histories.clear()
+
+
+def _Store():
+    if Store is None:
+        raise StoreError(
+            "Play history needs RANDOMIZER_HISTORY_DB or a store from SetStore()"
+        )
+    return Store
+
+
+def _CheckId(groupId):
+    if not isinstance(groupId, str) or not GroupIdPattern.match(groupId):
+        raise ValueError(
+            "Group IDs are 1 to 64 letters, digits, hyphens or underscores"
+        )
+
+
+def LoadHistory(groupId):
+    # The group's PlayHistory, read once and reused for HistoryTtl seconds. A
+    # group that hasn't played yet has an empty history.
+    _CheckId(groupId)
+    now = time.monotonic()
+    with _historiesLock:
+        loaded = _histories.get(groupId)
+    if loaded is not None and now - loaded[0] < HistoryTtl:
+        return loaded[1]
+
+    history = PlayHistory(_Store().Recent(groupId, PlayHistory.PlayLimit()))
+    with _historiesLock:
+        _histories[groupId] = (now, history)
+    return history
+
+
+def RecordPlay(groupId, kingdom, playedAt=None):
+    # Stores kingdom as played by the group and updates its loaded history.
+    # Returns the cards that count towards the history.
+    _CheckId(groupId)
+    cards = _KingdomCards(kingdom)
+    _Store().Add(
+        groupId,
+        time.time() if playedAt is None else playedAt,
+        [str(card) for card in cards],
+    )
+    with _historiesLock:
+        loaded = _histories.get(groupId)
+    if loaded is not None:
+        loaded[1].Add(kingdom)
+    return cards
@@ -1,24 +1,364 @@
+import hashlib
 import json
-from randomizer import RandomizeDominion
+import os
+import random
+import time
+from profiles import LoadProfile
+from randomizer import (
+    DecodeShareCode,
+    GetCatalog,
+    GetProbabilities,
+    GetShareDictionary,
+    HasBalanceOptions,
+    NewSeed,
+    RandomizeDominion,
+    RandomizeDominionBatch,
+    RandomizeTables,
+    ShareCode,
+)
 
+# Largest number of kingdoms a single request may ask for
+MaxBatchCount = 1000
 
-def lambda_handler(event, context):
-    print("Received event: " + json.dumps(event, indent=2))
-
-    response = {
-        "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type",
-        },
-    }
+# Most candidate kingdoms a request may have scored for the best one. 500 over
+# every set take a few tens of milliseconds, nearly all of it drawing them.
+MaxCandidates = 500
+
+# Fraction of successful requests that are logged, and the most characters of
+# a request body that end up in a log line. Failed requests are always logged.
+LogSampleRate = float(os.environ.get("RANDOMIZER_LOG_SAMPLE_RATE", 0.01))
+LogBodyLimit = int(os.environ.get("RANDOMIZER_LOG_BODY_LIMIT", 512))
+
+Headers = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type, If-None-Match",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Expose-Headers": "ETag, X-Randomizer-Seed, X-Randomizer-Share-Code",
+}
+
+# Response formats for POST "format". "structured" returns share IDs, which
+# GET .../dictionary explains.
+Formats = ("strings", "structured")
+
+# The catalog and the share dictionary only change with a deploy, so their
+# bodies and ETags are built once on the first GET
+_cachedResponses = {}
+
+
+def _CachedResponse(build):
+    if build not in _cachedResponses:
+        body = json.dumps(build(), separators=(",", ":"), sort_keys=True)
+        etag = '"{}"'.format(hashlib.sha256(body.encode()).hexdigest()[:32])
+        _cachedResponses[build] = (body, etag)
+    return _cachedResponses[build]
+
+
+def _History():
+    # Imported on the first history request: it brings in sqlite3, which
+    # other cold starts can do without
+    import history
+
+    return history
+
+
+def _Header(event, name):
+    name = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _Log(event, response, started):
+    if response["statusCode"] < 400 and random.random() >= LogSampleRate:
+        return
+
+    body = event.get("body") or ""
+    print(
+        json.dumps(
+            {
+                "requestId": event["requestContext"].get("requestId"),
+                "method": event["requestContext"]["httpMethod"],
+                "status": response["statusCode"],
+                "durationMs": round((time.perf_counter() - started) * 1000, 3),
+                "bodyLength": len(body),
+                "body": body[:LogBodyLimit],
+            },
+            separators=(",", ":"),
+        )
+    )
+
+
+def _Get(event, build=GetCatalog):
+    body, etag = _CachedResponse(build)
+    headers = dict(Headers)
+    headers["ETag"] = etag
+    headers["Cache-Control"] = "public, max-age=3600"
+
+    ifNoneMatch = _Header(event, "If-None-Match")
+    if ifNoneMatch and (
+        ifNoneMatch.strip() == "*"
+        or etag in (tag.strip() for tag in ifNoneMatch.split(","))
+    ):
+        return {"statusCode": 304, "headers": headers}
+
+    headers["Content-Type"] = "application/json"
+    return {"statusCode": 200, "headers": headers, "body": body}
+
+
+def _GetShared(event, code):
+    # Share codes never change meaning, so their kingdoms can be cached for
+    # good
+    response = {"statusCode": 200, "headers": dict(Headers)}
+    try:
+        data = DecodeShareCode(code)
+        response["headers"]["Cache-Control"] = "public, max-age=31536000, immutable"
+    except ValueError as error:
+        response["statusCode"] = 400
+        data = {"error": str(error)}
+    response["headers"]["Content-Type"] = "application/json"
+    response["body"] = json.dumps(data)
+    return response
 
-    if event["requestContext"]["httpMethod"] == "POST":
+
+def JsonBody(event):
+    # The POST body, or None when it isn't a JSON object
+    try:
         body = json.loads(event["body"] or "{}")
-        sets = body.get("sets") or None
-        options = body.get("options")
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _BadBody():
+    return {
+        "statusCode": 400,
+        "headers": dict(Headers, **{"Content-Type": "application/json"}),
+        "body": json.dumps({"error": "The body must be a JSON object"}),
+    }
+
+
+def InvalidSelection(sets, options):
+    # The error message for "sets" or "options" of the wrong type, or None
+    if sets is not None and (
+        not isinstance(sets, list) or not all(isinstance(name, str) for name in sets)
+    ):
+        return "sets must be a list of set names"
+    if options is not None and not isinstance(options, dict):
+        return "options must be an object"
+    return None
+
+
+def InvalidRequest(seed, responseFormat, constraints, count, maxCount=MaxBatchCount):
+    # The error message for POST fields of the wrong type, or None. With
+    # maxCount None any positive count is allowed.
+    if isinstance(seed, bool) or not isinstance(seed, (int, str)):
+        return "seed must be an integer or a string"
+    if responseFormat not in Formats:
+        return "format must be one of: {}".format(", ".join(Formats))
+    if constraints is not None and not isinstance(constraints, list):
+        return "constraints must be a list"
+    if count is not None and (
+        not isinstance(count, int)
+        or isinstance(count, bool)
+        or count < 1
+        or (maxCount is not None and count > maxCount)
+    ):
+        if maxCount is None:
+            return "count must be a positive integer"
+        return "count must be an integer from 1 to {}".format(maxCount)
+    return None
+
+
+def _Post(event):
+    body = JsonBody(event)
+    if body is None:
+        return _BadBody()
+    response = {"statusCode": 200, "headers": dict(Headers)}
+
+    sets = body.get("sets") or None
+    options = body.get("options")
+    count = body.get("count")
+    constraints = body.get("constraints")
+    profile = body.get("profile")
+    responseFormat = body.get("format", "strings")
+    # Kingdoms for this many tables, with no card at two of them
+    tables = body.get("tables")
+    # A game group whose recently played cards are made less likely
+    historyId = body.get("history")
+    # Static card and set weights, e.g. {"sets": {"Antiquities": 2}}
+    weights = body.get("weights")
+    # Draw this many kingdoms and return the one with the best synergy score
+    candidates = body.get("candidates")
+    seed = body.get("seed")
+    if seed is None:
+        seed = NewSeed()
+
+    error = InvalidRequest(seed, responseFormat, constraints, count)
+    if not error:
+        error = InvalidSelection(sets, options)
+    if not error and tables is not None:
+        if not isinstance(tables, int) or isinstance(tables, bool):
+            error = "tables must be an integer"
+        elif (
+            count is not None
+            or constraints
+            or historyId is not None
+            or weights is not None
+            or HasBalanceOptions(options)
+        ):
+            error = (
+                "tables can't be combined with count, constraints, history, weights "
+                "or balance options"
+            )
+    if not error and candidates is not None:
+        if (
+            not isinstance(candidates, int)
+            or isinstance(candidates, bool)
+            or not 1 <= candidates <= MaxCandidates
+        ):
+            error = "candidates must be an integer from 1 to {}".format(MaxCandidates)
+        elif count is not None or tables is not None:
+            error = "candidates can't be combined with count or tables"
+    if error:
+        response["statusCode"] = 400
+        data = {"error": error}
+    else:
+        try:
+            # A stored collection profile replaces "sets"
+            collection = None if profile is None else LoadProfile(profile)
+            history = None
+            if historyId is not None:
+                history = _History().LoadHistory(historyId)
+            structured = responseFormat == "structured"
+            if tables is not None:
+                data = RandomizeTables(
+                    sets, options, tables, seed, collection, structured
+                )
+            elif count is None:
+                data = RandomizeDominion(
+                    sets,
+                    options,
+                    seed,
+                    constraints,
+                    collection,
+                    structured,
+                    history,
+                    weights,
+                    candidates,
+                )
+                response["headers"]["X-Randomizer-Share-Code"] = (
+                    data["code"] if structured else ShareCode(data)
+                )
+            else:
+                data = RandomizeDominionBatch(
+                    sets,
+                    options,
+                    count,
+                    seed,
+                    constraints,
+                    collection,
+                    structured,
+                    history,
+                    weights,
+                )
+        except KeyError as error:
+            response["statusCode"] = 404
+            data = {"error": error.args[0]}
+        except ValueError as error:
+            # Constraints that can't be satisfied, too few Kingdom cards, too
+            # many tables, malformed weights or a malformed profile
+            response["statusCode"] = 400
+            data = {"error": str(error)}
+        except OSError as error:
+            # A history or profile store that isn't set up or can't be reached
+            response["statusCode"] = 503
+            data = {"error": str(error)}
 
-        data = RandomizeDominion(sets, options)
+    # The body keeps the requested format, so the seed goes in a header.
+    # Sending it back as "seed" reproduces the same kingdom(s).
+    response["headers"]["X-Randomizer-Seed"] = str(seed)
+    if responseFormat == "structured":
+        response["body"] = json.dumps(data, separators=(",", ":"))
+    else:
         response["body"] = json.dumps(data)
+    return response
+
+
+def _PostProbabilities(event):
+    # Exact chances of each card, landscape and setup component for the
+    # selection in the body, the same as for randomizing
+    body = JsonBody(event)
+    if body is None:
+        return _BadBody()
+    response = {"statusCode": 200, "headers": dict(Headers)}
+    sets = body.get("sets") or None
+    options = body.get("options")
+    profile = body.get("profile")
+    try:
+        error = InvalidSelection(sets, options)
+        if error:
+            raise ValueError(error)
+        collection = None if profile is None else LoadProfile(profile)
+        data = GetProbabilities(sets, options, collection)
+    except KeyError as error:
+        response["statusCode"] = 404
+        data = {"error": error.args[0]}
+    except ValueError as error:
+        response["statusCode"] = 400
+        data = {"error": str(error)}
+    response["headers"]["Content-Type"] = "application/json"
+    response["body"] = json.dumps(data, separators=(",", ":"), sort_keys=True)
+    return response
+
+
+def _PostHistory(event):
+    # Records a kingdom as played by the group in "history". The kingdom is
+    # sent as "kingdom", in either response format, or as a share "code".
+    body = JsonBody(event)
+    if body is None:
+        return _BadBody()
+    response = {"statusCode": 200, "headers": dict(Headers)}
+    kingdom = body.get("kingdom")
+    if kingdom is None:
+        kingdom = {"code": body.get("code")}
+    try:
+        cards = _History().RecordPlay(body.get("history"), kingdom)
+        data = {"recorded": len(cards)}
+    except ValueError as error:
+        response["statusCode"] = 400
+        data = {"error": str(error)}
+    except OSError as error:
+        response["statusCode"] = 503
+        data = {"error": str(error)}
+    response["headers"]["Content-Type"] = "application/json"
+    response["body"] = json.dumps(data)
+    return response
+
+
+def lambda_handler(event, context):
+    started = time.perf_counter()
+
+    method = event["requestContext"]["httpMethod"]
+    rawPath = event.get("path") or ""
+    path = rawPath.rstrip("/")
+    if method == "POST" and path.endswith("/probabilities"):
+        response = _PostProbabilities(event)
+    elif method == "POST" and path.endswith("/history"):
+        response = _PostHistory(event)
+    elif method == "POST":
+        response = _Post(event)
+    elif method == "GET" and path.endswith("/dictionary"):
+        response = _Get(event, GetShareDictionary)
+    elif method == "GET" and rawPath.rpartition("/")[0].endswith("/share"):
+        # Matched before stripping, so an empty code is a bad request rather
+        # than a catalog request
+        response = _GetShared(event, rawPath.rpartition("/")[2])
+    elif method == "GET":
+        response = _Get(event)
+    else:
+        # CORS preflight
+        response = {"statusCode": 200, "headers": Headers}
 
+    _Log(event, response, started)
     return response
@@ -0,0 +1,177 @@
+# Load test for server.py: starts it with the given number of processes,
+# keeps --connections keep-alive connections busy for --duration seconds and
+# reports requests per second and latency percentiles.
+#
+#   python3 loadtest.py --processes 1
+#   python3 loadtest.py --processes 4 --clients 4 --body '{"count": 100}'
+#
+# --url points it at a server that is already running instead.
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+Directory = os.path.dirname(os.path.abspath(__file__))
+
+
+async def _Connection(host, port, request, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def _Client(host, port, request, connections, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *(
+            _Connection(host, port, request, deadline, latencies, errors)
+            for _ in range(connections)
+        )
+    )
+    return latencies, len(errors)
+
+
+def _RunClient(args):
+    return asyncio.run(_Client(*args))
+
+
+def _Request(host, path, body):
+    method = "GET" if body is None else "POST"
+    body = (body or "").encode()
+    head = (
+        "{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+        "Content-Length: {}\r\n\r\n".format(method, path, host, len(body))
+    )
+    return head.encode() + body
+
+
+def _FreePort():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+def _StartServer(processes, workers):
+    port = _FreePort()
+    command = [
+        sys.executable,
+        os.path.join(Directory, "server.py"),
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--processes",
+        str(processes),
+    ]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    server = subprocess.Popen(command, cwd=Directory, stdout=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError("server.py did not start")
+
+
+def LoadTest(host, port, path, body, connections, clients, duration):
+    request = _Request(host, path, body)
+    # Warm up the pools and caches before measuring
+    _RunClient((host, port, request, 1, 0.5))
+
+    perClient = max(1, connections // clients)
+    jobs = [(host, port, request, perClient, duration)] * clients
+    if clients == 1:
+        results = [_RunClient(jobs[0])]
+    else:
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(_RunClient, jobs)
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        raise RuntimeError("No requests completed")
+
+    def Percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests-per-second": len(latencies) / duration,
+        "p50-ms": Percentile(0.5) * 1e3,
+        "p99-ms": Percentile(0.99) * 1e3,
+        "mean-ms": statistics.fmean(latencies) * 1e3,
+    }
+
+
+def _Main():
+    parser = argparse.ArgumentParser(description="Load test server.py")
+    parser.add_argument("--url", help="test this server instead of starting one")
+    parser.add_argument(
+        "--processes", type=int, default=1, help="server event loop processes"
+    )
+    parser.add_argument("--workers", type=int, help="server pool for heavy requests")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument(
+        "--clients", type=int, default=1, help="processes generating the load"
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--body", default="{}", help='POST body, e.g. {"count": 100}; "" sends a GET'
+    )
+    args = parser.parse_args()
+    body = args.body or None
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port, path = url.hostname, url.port or 80, url.path or "/"
+    else:
+        server, port = _StartServer(args.processes, args.workers)
+        host, path = "127.0.0.1", "/"
+    try:
+        results = LoadTest(
+            host, port, path, body, args.connections, args.clients, args.duration
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results.update(
+        {"processes": args.processes, "connections": args.connections, "body": body}
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    _Main()
@@ -0,0 +1,103 @@
+# Stored collection profiles: the sets and cards a player owns, saved under an
+# ID so that requests can refer to it instead of sending it every time.
+# Profiles live in a key-value store, a directory of JSON files by default.
+# SetStore() plugs in another one, such as MemoryStore or an adapter for a
+# hosted key-value service with the same Get/Put methods.
+import json
+import os
+import re
+import threading
+import time
+from randomizer import Collection
+
+ProfileIdPattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Seconds a loaded profile is reused before it is read from the store again
+ProfileTtl = float(os.environ.get("RANDOMIZER_PROFILE_TTL", 300))
+
+
+class DirectoryStore(object):
+    def __init__(self, path):
+        self.path = path
+
+    def _Path(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def Get(self, key):
+        try:
+            with open(self._Path(key), encoding="utf-8") as profileFile:
+                return profileFile.read()
+        except FileNotFoundError:
+            return None
+
+    def Put(self, key, value):
+        # Write to a temporary file first so readers never see half a profile
+        os.makedirs(self.path, exist_ok=True)
+        temporaryPath = self._Path(key) + ".tmp"
+        with open(temporaryPath, "w", encoding="utf-8") as profileFile:
+            profileFile.write(value)
+        os.replace(temporaryPath, self._Path(key))
+
+
+class MemoryStore(object):
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def Get(self, key):
+        return self.values.get(key)
+
+    def Put(self, key, value):
+        self.values[key] = value
+
+
+Store = DirectoryStore(
+    os.environ.get(
+        "RANDOMIZER_PROFILE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"),
+    )
+)
+
+_profilesLock = threading.Lock()
+_profiles = {}
+
+
+def SetStore(store):
+    global Store
+    with _profilesLock:
+        Store = store
+        _profiles.clear()
+
+
+def _CheckId(profileId):
+    if not isinstance(profileId, str) or not ProfileIdPattern.match(profileId):
+        raise ValueError(
+            "Profile IDs are 1 to 64 letters, digits, hyphens or underscores"
+        )
+
+
+def LoadProfile(profileId):
+    # The profile's Collection, compiled once and reused for ProfileTtl
+    # seconds. Raises KeyError for unknown profiles.
+    _CheckId(profileId)
+    now = time.monotonic()
+    with _profilesLock:
+        loaded = _profiles.get(profileId)
+    if loaded is not None and now - loaded[0] < ProfileTtl:
+        return loaded[1]
+
+    data = Store.Get(profileId)
+    if data is None:
+        raise KeyError("Unknown profile: {}".format(profileId))
+    collection = Collection.FromDict(json.loads(data))
+    with _profilesLock:
+        _profiles[profileId] = (now, collection)
+    return collection
+
+
+def SaveProfile(profileId, data):
+    # data is the JSON form read by Collection.FromDict
+    _CheckId(profileId)
+    Collection.FromDict(data)
+    Store.Put(profileId, json.dumps(data, sort_keys=True))
+    with _profilesLock:
+        _profiles.pop(profileId, None)
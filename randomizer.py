@@ -1,34 +1,245 @@
+import base64
+import hashlib
+import json
+import marshal
+import math
+import os
 import random
+import threading
+from collections import OrderedDict, deque
+from itertools import accumulate, chain, compress, islice
+from math import comb
 
+# NumPy is optional and slow to import, so it is only imported for batches
+# (see _Numpy)
+_numpy = None
 
+# Filled in by LoadCatalog()
 AllSets = {}
 
+# Every card ever defined, indexed by Card.id. IDs are handed out in
+# definition order, so new cards must be appended to keep existing IDs stable.
+AllCards = []
+
+
+def _PopCount(mask):
+    return bin(mask).count("1")
+
+
+# Maps the "0"/"1" digits of bin() to byte values usable as compress() selectors
+_BitSelectors = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _MaskCards(mask):
+    return compress(AllCards, bin(mask)[:1:-1].encode().translate(_BitSelectors))
+
+
+def _SparseMaskCards(mask):
+    # Same as _MaskCards, but faster for masks with only a few cards
+    while mask:
+        lowest = mask & -mask
+        yield AllCards[lowest.bit_length() - 1]
+        mask ^= lowest
+
+
+def _Mask(cards):
+    try:
+        return cards.mask
+    except AttributeError:
+        mask = 0
+        for card in cards:
+            mask |= card.mask
+        return mask
+
+
+def _Sample(mask, count, rng):
+    cards = tuple(_MaskCards(mask))
+    return rng.sample(cards, min(count, len(cards)))
+
 
 class CardType(object):
     def __init__(self, name):
         self.name = name
 
 
-class CardList(set):
+# Set of cards stored as a bitmask over Card.id, so that intersections, unions
+# and differences between card pools are single integer operations.
+class CardList(object):
+    __slots__ = ("mask", "_names")
+    __hash__ = None
+
+    def __init__(self, cards=(), mask=0):
+        self.mask = mask | _Mask(cards)
+        self._names = None
+
+    def _New(self, mask):
+        cards = object.__new__(CardList)
+        cards.mask = mask
+        cards._names = None
+        return cards
+
+    def _Index(self):
+        # Name -> card index, built on first lookup and kept up to date by the
+        # mutating methods below
+        if self._names is None:
+            self._names = {card.name: card for card in self}
+        return self._names
+
+    def _SetMask(self, mask):
+        if self._names is not None:
+            for card in _MaskCards(mask & ~self.mask):
+                self._names[card.name] = card
+            for card in _MaskCards(self.mask & ~mask):
+                del self._names[card.name]
+        self.mask = mask
+
+    def __iter__(self):
+        return _MaskCards(self.mask)
+
+    def __len__(self):
+        return _PopCount(self.mask)
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __repr__(self):
+        return "<randomizer.CardList: {}>".format(", ".join(map(str, self)))
+
     def __contains__(self, item):
         if not isinstance(item, Card):
-            for card in self:
-                if card.name == item:
-                    return True
-        return super(CardList, self).__contains__(item)
+            return item in self._Index()
+        return bool(self.mask & item.mask)
 
     def __call__(self, *names):
-        cards = set()
-        for card in self:
-            if card.name in names:
-                cards.add(card)
-        return cards
+        index = self._Index()
+        try:
+            return CardList(index[name] for name in names)
+        except KeyError:
+            unknown = [name for name in names if name not in index]
+            raise KeyError("Unknown card(s): {}".format(", ".join(unknown))) from None
+
+    def __eq__(self, other):
+        try:
+            return self.mask == _Mask(other)
+        except (AttributeError, TypeError):
+            return NotImplemented
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        return self.issuperset(other)
+
+    def __and__(self, other):
+        return self._New(self.mask & _Mask(other))
+
+    def __or__(self, other):
+        return self._New(self.mask | _Mask(other))
+
+    def __sub__(self, other):
+        return self._New(self.mask & ~_Mask(other))
+
+    def __xor__(self, other):
+        return self._New(self.mask ^ _Mask(other))
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        return self._New(_Mask(other) & ~self.mask)
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def copy(self):
+        return self._New(self.mask)
+
+    def union(self, *others):
+        mask = self.mask
+        for other in others:
+            mask |= _Mask(other)
+        return self._New(mask)
+
+    def intersection(self, *others):
+        mask = self.mask
+        for other in others:
+            mask &= _Mask(other)
+        return self._New(mask)
+
+    def difference(self, *others):
+        mask = self.mask
+        for other in others:
+            mask &= ~_Mask(other)
+        return self._New(mask)
+
+    def isdisjoint(self, other):
+        return not self.mask & _Mask(other)
+
+    def issubset(self, other):
+        return not self.mask & ~_Mask(other)
+
+    def issuperset(self, other):
+        mask = _Mask(other)
+        return not mask & ~self.mask
+
+    def add(self, card):
+        self.mask |= card.mask
+        if self._names is not None:
+            self._names[card.name] = card
+
+    def discard(self, card):
+        self._SetMask(self.mask & ~card.mask)
+
+    def remove(self, card):
+        if not self.mask & card.mask:
+            raise KeyError(card)
+        self._SetMask(self.mask & ~card.mask)
+
+    def update(self, *others):
+        self._SetMask(self.union(*others).mask)
+
+    def intersection_update(self, *others):
+        self._SetMask(self.intersection(*others).mask)
+
+    def difference_update(self, *others):
+        self._SetMask(self.difference(*others).mask)
+
+    def clear(self):
+        self._SetMask(0)
+
+
+# Immutable CardList for pools shared between requests
+class FrozenCardList(CardList):
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def _Immutable(self, *args):
+        raise TypeError("FrozenCardList is immutable")
+
+    add = discard = remove = clear = _Immutable
+    update = intersection_update = difference_update = _Immutable
 
 
 class Card(object):
     def __init__(self, name, types=None, cardSet=None):
         self.name = name
         self.set = cardSet
+        self.id = len(AllCards)
+        self.mask = 1 << self.id
+        self._str = None
+        AllCards.append(self)
 
         if isinstance(types, set):
             self.types = types
@@ -38,7 +249,7 @@ class Card(object):
             self.types = set(types)
 
     def __hash__(self):
-        return hash(str(self))
+        return self.id
 
     def __repr__(self):
         return "<randomizer.Card: {}>".format(self)
@@ -50,6 +261,13 @@ class Card(object):
         return str(self) < str(other)
 
     def __str__(self):
+        # Cards are formatted over and over when sorting results, and neither
+        # the name, the set nor the types change once a card is in a set
+        if self._str is None:
+            self._str = self._Format()
+        return self._str
+
+    def _Format(self):
         if Event in self.types:
             formatStr = "({} Event): {}"
         elif Landmark in self.types:
@@ -64,12 +282,15 @@ class Card(object):
 
 
 class Set(object):
-    def __init__(self, name):
+    def __init__(self, name, label=None):
         global AllSets
         self.name = name
+        self.label = label or name
+        self.optionPrefix = name.lower().replace(" ", "-")
         self._cards = CardList()
         self._firstEdition = None
         self._secondEdition = None
+        self._editions = {}
 
         self._events = None
         self._landmarks = None
@@ -99,9 +320,57 @@ class Set(object):
 
     def AddCards(self, cards):
         self._AddCards(self._cards, cards)
+        self._editions.clear()
 
     def RemoveCards(self, cards):
         self._cards -= cards
+        self._editions.clear()
+
+    def EditionOptions(self, options):
+        # Canonical (firstEdition, secondEdition) flags from request options
+        # such as "base-first-edition"
+        firstEdition = self._firstEdition is not None and bool(
+            options.get(self.optionPrefix + "-first-edition", False)
+        )
+        secondEdition = self._secondEdition is None or bool(
+            options.get(self.optionPrefix + "-second-edition", True)
+        )
+        return firstEdition, secondEdition
+
+    def Options(self):
+        # Edition options understood by EditionOptions, as listed by GetCatalog
+        options = []
+        if self._firstEdition is not None:
+            options.append(
+                {
+                    "name": self.optionPrefix + "-first-edition",
+                    "label": "Include first edition cards",
+                    "default": False,
+                }
+            )
+        if self._secondEdition is not None:
+            options.append(
+                {
+                    "name": self.optionPrefix + "-second-edition",
+                    "label": "Include second edition cards",
+                    "default": True,
+                }
+            )
+        return options
+
+    def EditionCards(self, firstEdition=False, secondEdition=True):
+        # Cards for a combination of edition options. Each combination is
+        # computed once and shared, so requests never modify the Set itself.
+        key = (bool(firstEdition), bool(secondEdition))
+        cards = self._editions.get(key)
+        if cards is None:
+            mask = self._cards.mask
+            if firstEdition and self._firstEdition is not None:
+                mask |= self._firstEdition.mask
+            if not secondEdition and self._secondEdition is not None:
+                mask &= ~self._secondEdition.mask
+            cards = self._editions[key] = FrozenCardList(mask=mask)
+        return cards
 
     @property
     def cards(self):
@@ -116,6 +385,7 @@ class Set(object):
         if self._firstEdition is None:
             self._firstEdition = CardList()
         self._AddCards(self._firstEdition, cards)
+        self._editions.clear()
 
     @property
     def secondEdition(self):
@@ -126,6 +396,7 @@ class Set(object):
         if self._secondEdition is None:
             self._secondEdition = CardList()
         self._AddCards(self._secondEdition, cards)
+        self._editions.clear()
 
     @property
     def events(self):
@@ -166,6 +437,91 @@ class Set(object):
         return self._potionCards
 
 
+# Ready-to-sample pools for one canonical selection of sets and edition options
+# (see GetCardPools)
+class CardPools(object):
+    # Built either from a key of (setName, firstEdition, secondEdition) tuples,
+    # or from the mask of the cards in a Collection
+    def __init__(self, key, completeMask=None):
+        catalog = LoadCatalog()
+        self.key = key
+        if completeMask is None:
+            self.sets = frozenset(AllSets[setName] for setName, _, _ in key)
+            completeMask = 0
+            for setName, firstEdition, secondEdition in key:
+                completeMask |= (
+                    AllSets[setName].EditionCards(firstEdition, secondEdition).mask
+                )
+        else:
+            self.sets = frozenset(card.set for card in _MaskCards(completeMask))
+        self.completeMask = completeMask
+        self.kingdomMask = completeMask & ~catalog.LandscapeCards.mask
+        self.baneMask = self.kingdomMask & catalog.BaneCards.mask
+
+        self.complete = tuple(_MaskCards(completeMask))
+        self.kingdom = tuple(_MaskCards(self.kingdomMask))
+        self.banes = tuple(_MaskCards(self.baneMask))
+        self.events = tuple(_MaskCards(completeMask & catalog.Events.mask))
+        self.landmarks = tuple(_MaskCards(completeMask & catalog.Landmarks.mask))
+        self.projects = tuple(_MaskCards(completeMask & catalog.Projects.mask))
+        self.ways = tuple(_MaskCards(completeMask & catalog.Ways.mask))
+
+        # Whether each rule can fire at all for this selection
+        self.hasLandscapes = bool(completeMask & catalog.LandscapeCards.mask)
+        self.alchemyRule = bool(self.kingdomMask & catalog.Alchemy.cards.mask)
+        self.baneRule = bool(self.kingdomMask & catalog.YoungWitchCards.mask)
+        self.mouseRule = bool(completeMask & catalog.MouseCards.mask)
+        self.sampledRules = [
+            rule for rule in catalog.sampledRules if rule.cardSet in self.sets
+        ]
+
+
+# Thread-safe bounded LRU cache with counters to help size it
+class CardPoolCache(object):
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def Get(self, key, build):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            self.misses += 1
+
+        value = build(key)
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def Info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
 # Define card types
 Event = CardType("Event")
 Landmark = CardType("Landmark")
@@ -173,1209 +529,2744 @@ Project = CardType("Project")
 Way = CardType("Way")
 Potion = CardType("Potion")
 
-# Define sets
-Base = Set("Base")
-Base.AddCards(
-    [
-        "Cellar",
-        "Chapel",
-        "Moat",
-        "Harbinger",
-        "Merchant",
-        "Village",
-        "Workshop",
-        "Vassal",
-        "Bureaucrat",
-        "Gardens",
-        "Militia",
-        "Moneylender",
-        "Poacher",
-        "Remodel",
-        "Smithy",
-        "Throne Room",
-        "Bandit",
-        "Council Room",
-        "Festival",
-        "Laboratory",
-        "Library",
-        "Market",
-        "Mine",
-        "Sentry",
-        "Witch",
-        "Artisan",
-    ]
+CardTypes = {
+    cardType.name: cardType for cardType in (Event, Landmark, Project, Way, Potion)
+}
+
+# Where a picked card has to be for a SetupRule to trigger
+KingdomScope = 1
+LandscapeScope = 2
+MouseScope = 4
+
+
+# Extra cards and decks to set out with a kingdom (Potions, Ruins, Boons, ...).
+# A rule triggers when a card of pool is picked in one of scopes. A rule with a
+# sample count instead triggers when one of that many cards drawn at random
+# from the picked cards in scopes is in pool, and only if cardSet is selected.
+class SetupRule(object):
+    def __init__(
+        self,
+        pool,
+        scopes=KingdomScope,
+        cards=(),
+        landscapes=(),
+        sample=0,
+        cardSet=None,
+    ):
+        self.pool = pool
+        self.scopes = scopes
+        self.cards = tuple(cards)
+        self.landscapes = tuple(landscapes)
+        self.sample = sample
+        self.cardSet = cardSet
+
+
+# The catalog (catalog.py) is loaded on first use instead of at import, so
+# cold starts that never randomize don't pay for it. BuildSnapshot() compiles
+# it into a marshal file that loads without compiling or running catalog.py.
+CatalogPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.py")
+SnapshotPath = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "catalog.snapshot"
 )
-Base.firstEdition = ["Adventurer", "Chancellor", "Feast", "Spy", "Thief", "Woodcutter"]
-Base.secondEdition = Base.cards(
-    "Artisan", "Bandit", "Harbinger", "Merchant", "Poacher", "Sentry", "Vassal"
-)
-
-Intrigue = Set("Intrigue")
-Intrigue.AddCards(
-    [
-        "Courtyard",
-        "Lurker",
-        "Pawn",
-        "Masquerade",
-        "Shanty Town",
-        "Steward",
-        "Swindler",
-        "Wishing Well",
-        "Baron",
-        "Bridge",
-        "Conspirator",
-        "Diplomat",
-        "Ironworks",
-        "Mill",
-        "Mining Village",
-        "Secret Passage",
-        "Courtier",
-        "Duke",
-        "Minion",
-        "Patrol",
-        "Replace",
-        "Torturer",
-        "Trading Post",
-        "Upgrade",
-        "Harem",
-        "Nobles",
+SnapshotVersion = 2
+
+_catalogLock = threading.Lock()
+_catalog = None
+
+
+def _CatalogDigest():
+    try:
+        with open(CatalogPath, "rb") as catalogFile:
+            return hashlib.sha256(catalogFile.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _ReadSnapshot(path):
+    try:
+        with open(path, "rb") as snapshotFile:
+            snapshot = marshal.loads(snapshotFile.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SnapshotVersion:
+        return None
+    return snapshot
+
+
+def _LoadSnapshot():
+    snapshot = _ReadSnapshot(SnapshotPath)
+    if snapshot is None:
+        return None
+
+    # Fall back to catalog.py if it was edited after the snapshot was built.
+    # Deployments that ship only the snapshot skip the check.
+    digest = _CatalogDigest()
+    if digest is not None and digest != snapshot["digest"]:
+        return None
+
+    names = {}
+    sets = {}
+    for varName, name, label, cards, firstEdition, secondEdition in snapshot["sets"]:
+        cardSet = names[varName] = sets[name] = Set(name, label)
+        cardSet._cards = CardList(mask=cards)
+        if firstEdition is not None:
+            cardSet._firstEdition = CardList(mask=firstEdition)
+        if secondEdition is not None:
+            cardSet._secondEdition = CardList(mask=secondEdition)
+    for name, setName, typeNames in snapshot["cards"]:
+        Card(name, [CardTypes[typeName] for typeName in typeNames], sets[setName])
+    for varName, mask in snapshot["pools"]:
+        names[varName] = CardList(mask=mask)
+    names["SetupRules"] = [
+        SetupRule(
+            CardList(mask=pool), scopes, cards, landscapes, sample, sets.get(setName)
+        )
+        for pool, scopes, cards, landscapes, sample, setName in snapshot["rules"]
     ]
-)
-Intrigue.firstEdition = [
-    "Coppersmith",
-    "Great Hall",
-    "Saboteur",
-    "Scout",
-    "Secret Chamber",
-    "Tribute",
+    return names
+
+
+def _ImportCatalog():
+    import catalog
+
+    return {
+        name: value
+        for name, value in vars(catalog).items()
+        if isinstance(value, (Set, CardList)) or name == "SetupRules"
+    }
+
+
+# The names defined by catalog.py (Base, PlatinumLove, ...)
+class Catalog(object):
+    def __init__(self, names):
+        self.names = names
+        self.__dict__.update(names)
+
+        # Compile SetupRules into an index from card id to the rules the card
+        # can trigger, so each picked card is looked up once. Rules that sample
+        # the picked cards are kept in order, as they consume the random stream.
+        # ruleTriggers masks, per scope, the cards that appear in the index.
+        self.ruleIndex = {}
+        self.ruleTriggers = {KingdomScope: 0, LandscapeScope: 0, MouseScope: 0}
+        self.sampledRules = []
+        for rule in names.get("SetupRules", ()):
+            if rule.sample:
+                self.sampledRules.append(rule)
+                continue
+            for card in rule.pool:
+                self.ruleIndex.setdefault(card.id, []).append(rule)
+            for scope in self.ruleTriggers:
+                if rule.scopes & scope:
+                    self.ruleTriggers[scope] |= rule.pool.mask
+
+
+def LoadCatalog(useSnapshot=True):
+    # Loads the catalog once, filling in AllSets and AllCards
+    global _catalog
+    if _catalog is None:
+        with _catalogLock:
+            if _catalog is None:
+                names = useSnapshot and _LoadSnapshot()
+                if not names:
+                    AllSets.clear()
+                    del AllCards[:]
+                    names = _ImportCatalog()
+                _catalog = Catalog(names)
+    return _catalog
+
+
+def __getattr__(name):
+    # Catalog names are still available as e.g. randomizer.Base
+    if not name.startswith("__"):
+        catalog = LoadCatalog()
+        if name in catalog.names:
+            return catalog.names[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def BuildSnapshot(path=None):
+    # Build step: compile catalog.py into the snapshot loaded by LoadCatalog
+    names = LoadCatalog(useSnapshot=False).names
+    snapshot = {
+        "version": SnapshotVersion,
+        "digest": _CatalogDigest(),
+        "sets": [
+            (
+                varName,
+                cardSet.name,
+                cardSet.label,
+                cardSet.cards.mask,
+                None if cardSet.firstEdition is None else cardSet.firstEdition.mask,
+                None if cardSet.secondEdition is None else cardSet.secondEdition.mask,
+            )
+            for varName, cardSet in names.items()
+            if isinstance(cardSet, Set)
+        ],
+        "cards": [
+            (card.name, card.set.name, sorted(cardType.name for cardType in card.types))
+            for card in AllCards
+        ],
+        "pools": [
+            (varName, cards.mask)
+            for varName, cards in names.items()
+            if isinstance(cards, CardList)
+        ],
+        "rules": [
+            (
+                rule.pool.mask,
+                rule.scopes,
+                rule.cards,
+                rule.landscapes,
+                rule.sample,
+                None if rule.cardSet is None else rule.cardSet.name,
+            )
+            for rule in names["SetupRules"]
+        ],
+    }
+    with open(path or SnapshotPath, "wb") as snapshotFile:
+        marshal.dump(snapshot, snapshotFile)
+
+
+# Options besides the edition ones. Options with a "set" only apply to, and are
+# listed with, that set.
+Options = [
+    {
+        "name": "enforce-alchemy-rule",
+        "label": "Enforce Alchemy rule",
+        "default": True,
+        "set": "Alchemy",
+    },
+    {
+        "name": "limit-landscapes",
+        "label": "Maximum 2 landscape cards",
+        "default": False,
+    },
+    {"name": "guarantee-buy", "label": "Guarantee a +Buy", "default": False},
+    {"name": "guarantee-trasher", "label": "Guarantee a trasher", "default": False},
+    {
+        "name": "village-for-draw",
+        "label": "A village when there is terminal draw",
+        "default": False,
+    },
+    {"name": "cost-spread", "label": "Costs from $2 to $5+", "default": False},
+    {"name": "limit-attacks", "label": "Maximum 2 Attacks", "default": False},
 ]
-Intrigue.secondEdition = Intrigue.cards(
-    "Courtier", "Diplomat", "Lurker", "Mill", "Patrol", "Replace", "Secret Passage"
-)
 
-Seaside = Set("Seaside")
-Seaside.AddCards(
-    [
-        "Embargo",
-        "Haven",
-        "Lighthouse",
-        "Native Village",
-        "Pearl Diver",
-        "Ambassador",
-        "Fishing Village",
-        "Lookout",
-        "Smugglers",
-        "Warehouse",
-        "Caravan",
-        "Cutpurse",
-        "Island",
-        "Navigator",
-        "Pirate Ship",
-        "Salvager",
-        "Sea Hag",
-        "Treasure Map",
-        "Bazaar",
-        "Explorer",
-        "Ghost Ship",
-        "Merchant Ship",
-        "Outpost",
-        "Tactician",
-        "Treasury",
-        "Wharf",
-    ]
+# Options that KingdomBalance enforces as the cards are drawn
+BalanceOptions = (
+    "guarantee-buy",
+    "guarantee-trasher",
+    "village-for-draw",
+    "cost-spread",
+    "limit-attacks",
 )
-
-Alchemy = Set("Alchemy")
-Alchemy.AddCards(
-    [
-        "Herbalist",
-        "Apprentice",
-        {"name": "Transmute", "types": {Potion}},
-        {"name": "Vineyard", "types": {Potion}},
-        {"name": "Apothecary", "types": {Potion}},
-        {"name": "Scrying Pool", "types": {Potion}},
-        {"name": "University", "types": {Potion}},
-        {"name": "Alchemist", "types": {Potion}},
-        {"name": "Familiar", "types": {Potion}},
-        {"name": "Philosopher's Stone", "types": {Potion}},
-        {"name": "Golem", "types": {Potion}},
-        {"name": "Possession", "types": {Potion}},
-    ]
+MaxAttacks = 2
+
+
+def GetCatalog():
+    # Sets and options that clients can offer, in a JSON-friendly form
+    LoadCatalog()
+    setOptions = {setName: cardSet.Options() for setName, cardSet in AllSets.items()}
+    otherOptions = []
+    for option in Options:
+        option = dict(option)
+        setName = option.pop("set", None)
+        if setName is None:
+            otherOptions.append(option)
+        else:
+            setOptions[setName].append(option)
+
+    return {
+        "sets": [
+            {
+                "name": cardSet.name,
+                "label": cardSet.label,
+                "options": setOptions[cardSet.name],
+            }
+            for cardSet in AllSets.values()
+        ],
+        "options": otherOptions,
+    }
+
+
+# Number of kingdoms whose card orders are drawn together in a batch
+BatchChunkSize = 256
+
+PoolCache = CardPoolCache(int(os.environ.get("RANDOMIZER_POOL_CACHE_SIZE", 128)))
+ConstraintCache = CardPoolCache(
+    int(os.environ.get("RANDOMIZER_CONSTRAINT_CACHE_SIZE", 128))
 )
-
-Prosperity = Set("Prosperity")
-Prosperity.AddCards(
-    [
-        "Loan",
-        "Trade Route",
-        "Watchtower",
-        "Bishop",
-        "Monument",
-        "Quarry",
-        "Talisman",
-        "Worker's Village",
-        "City",
-        "Contraband",
-        "Counting House",
-        "Mint",
-        "Mountebank",
-        "Rabble",
-        "Royal Seal",
-        "Vault",
-        "Venture",
-        "Goons",
-        "Grand Market",
-        "Hoard",
-        "Bank",
-        "Expand",
-        "Forge",
-        "King's Court",
-        "Peddler",
-    ]
+ProbabilityCache = CardPoolCache(
+    int(os.environ.get("RANDOMIZER_PROBABILITY_CACHE_SIZE", 32))
 )
-
-Cornucopia = Set("Cornucopia")
-Cornucopia.AddCards(
-    [
-        "Hamlet",
-        "Fortune Teller",
-        "Menagerie",
-        "Farming Village",
-        "Horse Traders",
-        "Remake",
-        "Tournament",
-        "Young Witch",
-        "Harvest",
-        "Horn of Plenty",
-        "Hunting Party",
-        "Jester",
-        "Fairgrounds",
-    ]
+WeightCache = CardPoolCache(int(os.environ.get("RANDOMIZER_WEIGHT_CACHE_SIZE", 64)))
+BalanceCache = CardPoolCache(int(os.environ.get("RANDOMIZER_BALANCE_CACHE_SIZE", 64)))
+LandscapeCountCache = CardPoolCache(
+    int(os.environ.get("RANDOMIZER_LANDSCAPE_COUNT_CACHE_SIZE", 128))
 )
 
-Hinterlands = Set("Hinterlands")
-Hinterlands.AddCards(
-    [
-        "Crossroads",
-        "Duchess",
-        "Fool's Gold",
-        "Develop",
-        "Oasis",
-        "Oracle",
-        "Scheme",
-        "Tunnel",
-        "Jack of All Trades",
-        "Noble Brigand",
-        "Nomad Camp",
-        "Silk Road",
-        "Spice Merchant",
-        "Trader",
-        "Cache",
-        "Cartographer",
-        "Embassy",
-        "Haggler",
-        "Highway",
-        "Ill-gotten Gains",
-        "Inn",
-        "Mandarin",
-        "Margrave",
-        "Stables",
-        "Border Village",
-        "Farmland",
-    ]
-)
 
-DarkAges = Set("Dark Ages")
-DarkAges.AddCards(
-    [
-        "Poor House",
-        "Beggar",
-        "Squire",
-        "Vagrant",
-        "Forager",
-        "Hermit",
-        "Market Square",
-        "Sage",
-        "Storeroom",
-        "Urchin",
-        "Armory",
-        "Death Cart",
-        "Feodum",
-        "Fortress",
-        "Ironmonger",
-        "Marauder",
-        "Procession",
-        "Rats",
-        "Scavenger",
-        "Wandering Minstrel",
-        "Band of Misfits",
-        "Bandit Camp",
-        "Catacombs",
-        "Count",
-        "Counterfeit",
-        "Cultist",
-        "Graverobber",
-        "Junk Dealer",
-        "Knights",
-        "Mystic",
-        "Pillage",
-        "Rebuild",
-        "Rogue",
-        "Altar",
-        "Hunting Grounds",
-    ]
-)
+def GetCardPools(setNames=None, options=None):
+    LoadCatalog()
+    if setNames is None:
+        sets = AllSets.values()
+    else:
+        sets = [AllSets[setName] for setName in set(setNames) if setName in AllSets]
 
-Guilds = Set("Guilds")
-Guilds.AddCards(
-    [
-        "Candlestick Maker",
-        "Stonemason",
-        "Doctor",
-        "Masterpiece",
-        "Advisor",
-        "Plaza",
-        "Taxman",
-        "Herald",
-        "Baker",
-        "Butcher",
-        "Journeyman",
-        "Merchant Guild",
-        "Soothsayer",
-    ]
-)
+    # Only the selected sets and their edition options change the pools
+    key = tuple(
+        sorted(
+            (cardSet.name,) + cardSet.EditionOptions(options or {}) for cardSet in sets
+        )
+    )
+    return PoolCache.Get(key, CardPools)
+
+
+def _NamedCards(name):
+    # Mask of the cards called name, which may also be "Set: Card"
+    mask = 0
+    if isinstance(name, str):
+        mask = _Mask(card for card in AllCards if name in (card.name, str(card)))
+    if not mask:
+        raise ValueError("Unknown card: {}".format(name))
+    return mask
+
+
+# The cards a player owns: whole sets, with their edition options, plus single
+# cards they own and minus cards they are missing. Collections with the same
+# cards share their pools.
+class Collection(object):
+    def __init__(self, sets=(), options=None, cards=(), missing=(), weights=None):
+        LoadCatalog()
+        self.options = dict(options or {})
+        # Default static weights for randomizing with the collection
+        if weights is not None:
+            _ParseWeights(weights)
+        self.weights = weights
+        mask = 0
+        for setName in sets:
+            if setName not in AllSets:
+                raise ValueError("Unknown set: {}".format(setName))
+            cardSet = AllSets[setName]
+            mask |= cardSet.EditionCards(*cardSet.EditionOptions(self.options)).mask
+        for name in cards:
+            mask |= _NamedCards(name)
+        for name in missing:
+            mask &= ~_NamedCards(name)
+        self.mask = mask
+        self._SetPools()
+
+    def _SetPools(self):
+        mask = self.mask
+        self.pools = PoolCache.Get(
+            ("collection", mask), lambda key: CardPools(key, mask)
+        )
 
-Adventures = Set("Adventures")
-Adventures.AddCards(
-    [
-        "Coin of the Realm",
-        "Page",
-        "Peasant",
-        "Ratcatcher",
-        "Raze",
-        "Amulet",
-        "Caravan Guard",
-        "Dungeon",
-        "Gear",
-        "Guide",
-        "Duplicate",
-        "Magpie",
-        "Messenger",
-        "Miser",
-        "Port",
-        "Ranger",
-        "Transmogrify",
-        "Artificer",
-        "Bridge Troll",
-        "Distant Lands",
-        "Giant",
-        "Haunted Woods",
-        "Lost City",
-        "Relic",
-        "Royal Carriage",
-        "Storyteller",
-        "Swamp Hag",
-        "Treasure Trove",
-        "Wine Merchant",
-        "Hireling",
-        {"name": "Alms", "types": {Event}},
-        {"name": "Borrow", "types": {Event}},
-        {"name": "Quest", "types": {Event}},
-        {"name": "Save", "types": {Event}},
-        {"name": "Scouting Party", "types": {Event}},
-        {"name": "Travelling Fair", "types": {Event}},
-        {"name": "Bonfire", "types": {Event}},
-        {"name": "Expedition", "types": {Event}},
-        {"name": "Ferry", "types": {Event}},
-        {"name": "Plan", "types": {Event}},
-        {"name": "Mission", "types": {Event}},
-        {"name": "Pilgrimage", "types": {Event}},
-        {"name": "Ball", "types": {Event}},
-        {"name": "Raid", "types": {Event}},
-        {"name": "Seaway", "types": {Event}},
-        {"name": "Lost Arts", "types": {Event}},
-        {"name": "Training", "types": {Event}},
-        {"name": "Inheritance", "types": {Event}},
-        {"name": "Pathfinding", "types": {Event}},
-    ]
-)
+    # Worker processes get the cards and options and rebuild the pools
+    def __getstate__(self):
+        return {"options": self.options, "mask": self.mask, "weights": self.weights}
+
+    def __setstate__(self, state):
+        LoadCatalog()
+        self.__dict__.update(state)
+        self._SetPools()
+
+    @classmethod
+    def FromDict(cls, data):
+        # From the JSON form, e.g. {"sets": ["Base"], "options":
+        # {"base-first-edition": true}, "cards": ["Prosperity: Platinum"],
+        # "missing": ["Base: Witch"], "weights": {"sets": {"Antiquities": 2}}}
+        if not isinstance(data, dict):
+            raise ValueError("A collection must be an object")
+        for field in ("sets", "cards", "missing"):
+            if not isinstance(data.get(field, []), list):
+                raise ValueError("{} must be a list".format(field))
+        if not isinstance(data.get("options", {}), dict):
+            raise ValueError("options must be an object")
+        return cls(
+            data.get("sets", ()),
+            data.get("options"),
+            data.get("cards", ()),
+            data.get("missing", ()),
+            data.get("weights"),
+        )
 
-Empires = Set("Empires")
-Empires.AddCards(
-    [
-        "Engineer",
-        "City Quarter",
-        "Overlord",
-        "Royal Blacksmith",
-        "Encampment/Plunder",
-        "Patrician/Emporium",
-        "Settlers/Bustling Village",
-        "Castles",
-        "Catapult/Rocks",
-        "Chariot Race",
-        "Enchantress",
-        "Farmers' Market",
-        "Gladiator/Fortune",
-        "Sacrifice",
-        "Temple",
-        "Villa",
-        "Archive",
-        "Capital",
-        "Charm",
-        "Crown",
-        "Forum",
-        "Groundskeeper",
-        "Legionary",
-        "Wild Hunt",
-        {"name": "Advance", "types": {Event}},
-        {"name": "Annex", "types": {Event}},
-        {"name": "Banquet", "types": {Event}},
-        {"name": "Conquest", "types": {Event}},
-        {"name": "Delve", "types": {Event}},
-        {"name": "Dominate", "types": {Event}},
-        {"name": "Donate", "types": {Event}},
-        {"name": "Salt the Earth", "types": {Event}},
-        {"name": "Ritual", "types": {Event}},
-        {"name": "Tax", "types": {Event}},
-        {"name": "Trade", "types": {Event}},
-        {"name": "Triumph", "types": {Event}},
-        {"name": "Wedding", "types": {Event}},
-        {"name": "Windfall", "types": {Event}},
-        {"name": "Aqueduct", "types": {Landmark}},
-        {"name": "Arena", "types": {Landmark}},
-        {"name": "Bandit Fort", "types": {Landmark}},
-        {"name": "Basilica", "types": {Landmark}},
-        {"name": "Baths", "types": {Landmark}},
-        {"name": "Battlefield", "types": {Landmark}},
-        {"name": "Colonnade", "types": {Landmark}},
-        {"name": "Defiled Shrine", "types": {Landmark}},
-        {"name": "Fountain", "types": {Landmark}},
-        {"name": "Keep", "types": {Landmark}},
-        {"name": "Labyrinth", "types": {Landmark}},
-        {"name": "Mountain Pass", "types": {Landmark}},
-        {"name": "Museum", "types": {Landmark}},
-        {"name": "Obelisk", "types": {Landmark}},
-        {"name": "Orchard", "types": {Landmark}},
-        {"name": "Palace", "types": {Landmark}},
-        {"name": "Tomb", "types": {Landmark}},
-        {"name": "Tower", "types": {Landmark}},
-        {"name": "Triumphal Arch", "types": {Landmark}},
-        {"name": "Wall", "types": {Landmark}},
-        {"name": "Wolf Den", "types": {Landmark}},
-    ]
-)
 
-Nocturne = Set("Nocturne")
-Nocturne.AddCards(
-    [
-        "Bard",
-        "Blessed Village",
-        "Cemetary + Haunted Mirror (Heirloom)",
-        "Changeling",
-        "Cobbler",
-        "Conclave",
-        "Crypt",
-        "Cursed Village",
-        "Den of Sin",
-        "Devil's Workshop",
-        "Druid",
-        "Exorcist",
-        "Faithful Hound",
-        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
-        "Guardian",
-        "Ghost Town",
-        "Idol",
-        "Leprechaun",
-        "Monastery",
-        "Necromancer + Zombies",
-        "Night Watchman",
-        "Pixie + Goat (Heirloom)",
-        "Pooka + Cursed Gold (Heirloom)",
-        "Sacred Grove",
-        "Secret Cave + Magic Lamp (Heirloom)",
-        "Shepherd + Pasture (Heirloom)",
-        "Raider",
-        "Skulk",
-        "Tormentor",
-        "Tracker + Pouch (Heirloom)",
-        "Tragic Hero",
-        "Vampire",
-        "Werewolf",
-    ]
-)
+def _DrawCards(pools, options, cards, rng, weighted=False):
+    # Draw the Kingdom and landscape cards from a shuffled pile of cards: all
+    # of pools.complete when there are landscapes, otherwise 10 Kingdom cards.
+    # A weighted pile is in weighted order, so the landscapes kept are the
+    # first ones dealt.
+    if not pools.hasLandscapes:
+        # A pile filtered by KingdomBalance holds every Kingdom card
+        resultMask = _Mask(islice(cards, 10))
+        if _PopCount(resultMask) < 10:
+            raise ValueError("The selected sets have fewer than 10 Kingdom cards")
+        return resultMask, []
+    catalog = LoadCatalog()
+
+    # Handle sets that include landscape cards. Categorize cards from the
+    # shuffled pile until there are 10 Kingdom cards.
+    resultMask = 0
+    landscapeMask = 0
+    wayMask = 0
+    kingdomCount = 0
+    dealt = []
+    for card in cards:
+        if card.mask & catalog.Ways.mask:
+            wayMask |= card.mask
+            dealt.append(card)
+        elif card.mask & catalog.LandscapeCards.mask:
+            landscapeMask |= card.mask
+            dealt.append(card)
+        else:
+            resultMask |= card.mask
+            kingdomCount += 1
+            if kingdomCount == 10:
+                break
+    else:
+        raise ValueError("The selected sets have fewer than 10 Kingdom cards")
 
-Renaissance = Set("Renaissance")
-Renaissance.AddCards(
-    [
-        "Border Guard",
-        "Ducat",
-        "Lackeys",
-        "Acting Troupe",
-        "Cargo Ship",
-        "Experiment",
-        "Improve",
-        "Flag Bearer",
-        "Hideout",
-        "Inventor",
-        "Mountain Village",
-        "Patron",
-        "Priest",
-        "Research",
-        "Silk Merchant",
-        "Old Witch",
-        "Recruiter",
-        "Scepter",
-        "Scholar",
-        "Sculptor",
-        "Seer",
-        "Spices",
-        "Swashbuckler",
-        "Treasurer",
-        "Villain",
-        {"name": "Cathedral", "types": {Project}},
-        {"name": "City Gate", "types": {Project}},
-        {"name": "Pageant", "types": {Project}},
-        {"name": "Sewers", "types": {Project}},
-        {"name": "Star Chart", "types": {Project}},
-        {"name": "Exploration", "types": {Project}},
-        {"name": "Fair", "types": {Project}},
-        {"name": "Silos", "types": {Project}},
-        {"name": "Sinister Plot", "types": {Project}},
-        {"name": "Academy", "types": {Project}},
-        {"name": "Capitalism", "types": {Project}},
-        {"name": "Fleet", "types": {Project}},
-        {"name": "Guildhall", "types": {Project}},
-        {"name": "Piazza", "types": {Project}},
-        {"name": "Road Network", "types": {Project}},
-        {"name": "Barracks", "types": {Project}},
-        {"name": "Crop Rotation", "types": {Project}},
-        {"name": "Innovation", "types": {Project}},
-        {"name": "Canal", "types": {Project}},
-        {"name": "Citadel", "types": {Project}},
-    ]
-)
+    # Get final list of landscape cards
+    if weighted:
+        ways = [card for card in dealt if card.mask & wayMask][:1]
+        others = [card for card in dealt if card.mask & landscapeMask]
+        if options and options.get("limit-landscapes"):
+            return resultMask, ways + others[: 2 - len(ways)]
+        return resultMask, others[:3] + ways
+    if options and options.get("limit-landscapes"):
+        landscapeList = _Sample(wayMask, 1, rng)
+        landscapeList.extend(_Sample(landscapeMask, 2 - len(landscapeList), rng))
+    else:
+        landscapeList = _Sample(landscapeMask, 3, rng)
+        landscapeList.extend(_Sample(wayMask, 1, rng))
+    return resultMask, landscapeList
+
+
+def _PartialShuffle(population, rng):
+    # Yield population in random order, one card at a time. This is a
+    # Fisher-Yates shuffle that only makes the swaps for the cards actually
+    # taken: displaced cards are tracked in a dict instead of copying the
+    # whole population, so drawing k cards costs O(k).
+    random = rng.random
+    size = len(population)
+    displaced = {}
+    for index in range(size):
+        swap = index + int(random() * (size - index))
+        card = displaced.get(swap, population[swap])
+        if swap != index:
+            displaced[swap] = displaced.get(index, population[index])
+        yield card
+
+
+# Weights for the cards of a pool in a Fenwick tree, so one weight changes and
+# a weighted draw without replacement both take O(log n). Draws work on a copy
+# of the sums, so they never recompute the weights.
+class WeightTree(object):
+    def __init__(self, cards, weights):
+        self.cards = tuple(cards)
+        self.weights = [float(weight) for weight in weights]
+        self.positions = {card.id: index for index, card in enumerate(self.cards)}
+        # Padded to a power of two so the search never checks bounds
+        self.top = 1 << max(0, len(self.cards) - 1).bit_length()
+        self.sums = [0.0] + self.weights + [0.0] * (self.top - len(self.cards))
+        for index in range(1, self.top):
+            parent = index + (index & -index)
+            if parent <= self.top:
+                self.sums[parent] += self.sums[index]
+        self._lock = threading.Lock()
+
+    def Set(self, card, weight):
+        # Sets the weight of card, if it is one of the tree's cards
+        index = self.positions.get(card.id)
+        if index is None:
+            return
+        with self._lock:
+            _TreeAdd(self.sums, index, weight - self.weights[index])
+            self.weights[index] = weight
+
+    def Shuffled(self, rng):
+        # Yields the cards one at a time, each drawn with probability in
+        # proportion to its weight among the cards not drawn yet
+        with self._lock:
+            sums = list(self.sums)
+            weights = list(self.weights)
+        total = sum(weights)
+        random = rng.random
+        top = self.top
+        for _ in range(len(weights) - weights.count(0.0)):
+            pick = random() * total
+            index = 0
+            step = top
+            while step:
+                if sums[index + step] <= pick:
+                    index += step
+                    pick -= sums[index]
+                step >>= 1
+            if index >= len(weights) or not weights[index]:
+                # Rounding put the pick past the last card left
+                index = max(i for i, weight in enumerate(weights) if weight)
+            yield self.cards[index]
+            weight = weights[index]
+            weights[index] = 0.0
+            total -= weight
+            index += 1
+            while index <= top:
+                sums[index] -= weight
+                index += index & -index
+
+
+def _TreeAdd(sums, index, delta):
+    index += 1
+    while index < len(sums):
+        sums[index] += delta
+        index += index & -index
+
+
+# Largest set or card weight. A card's weight is a product of two of them,
+# and the sum over the pool must stay finite for the alias table.
+MaxWeight = 1000000
+
+
+# Static weights, e.g. {"sets": {"Antiquities": 2}, "cards": {"Possession":
+# 0.05}}. A card's weight is its set's times its own, 1 by default. Returns
+# ((mask, weight), ...). Raises ValueError for unknown names or bad weights.
+def _ParseWeights(weights):
+    LoadCatalog()
+    if not isinstance(weights, dict) or set(weights) - {"sets", "cards"}:
+        raise ValueError('weights must be an object with "sets" and "cards"')
+    factors = []
+    for field in ("sets", "cards"):
+        named = weights.get(field, {})
+        if not isinstance(named, dict):
+            raise ValueError("weights {} must be an object".format(field))
+        for name, weight in sorted(named.items()):
+            if (
+                isinstance(weight, bool)
+                or not isinstance(weight, (int, float))
+                or not 0 <= weight <= MaxWeight
+            ):
+                raise ValueError(
+                    "Weights must be numbers from 0 to {}".format(MaxWeight)
+                )
+            if field == "cards":
+                mask = _NamedCards(name)
+            elif name in AllSets:
+                mask = AllSets[name].cards.mask
+            else:
+                raise ValueError("Unknown set: {}".format(name))
+            factors.append((mask, float(weight)))
+    return tuple(factors)
+
+
+# Static card weights compiled for one pool, with a Vose alias table over
+# pools.complete. A weighted draw costs O(1): draws without replacement
+# reject cards already drawn, and only fall back to a linear scan once most
+# of the weight is gone.
+class CardWeights(object):
+    def __init__(self, pools, weights, key=None):
+        self.key = key
+        self.cards = pools.complete
+        self.weights = {card.id: 1.0 for card in self.cards}
+        for mask, factor in _ParseWeights(weights):
+            for card in _MaskCards(mask & pools.completeMask):
+                self.weights[card.id] *= factor
+        if sum(1 for card in pools.kingdom if self.weights[card.id]) < 10:
+            raise ValueError("Fewer than 10 Kingdom cards have a weight above 0")
+        self.total = sum(self.weights.values())
+        if not math.isfinite(self.total) or not all(
+            map(math.isfinite, self.weights.values())
+        ):
+            raise ValueError("The weights are too large")
+
+        # Vose's method: every column holds one card's share and tops it up
+        # with an alias
+        size = len(self.cards)
+        scaled = [self.weights[card.id] * size / self.total for card in self.cards]
+        self.shares = [1.0] * size
+        self.aliases = list(range(size))
+        small = [index for index, share in enumerate(scaled) if share < 1]
+        large = [index for index, share in enumerate(scaled) if share >= 1]
+        while small and large:
+            less = small.pop()
+            more = large[-1]
+            self.shares[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(large.pop())
+
+    def Weight(self, card):
+        return self.weights.get(card.id, 0.0)
+
+    def _Draw(self, random):
+        index = int(random() * len(self.cards))
+        if random() >= self.shares[index]:
+            index = self.aliases[index]
+        return self.cards[index]
+
+    def Shuffled(self, rng):
+        # Same as WeightTree.Shuffled
+        random = rng.random
+        drawnMask = 0
+        left = self.total
+        while left > self.total / 2:
+            card = self._Draw(random)
+            if not card.mask & drawnMask:
+                drawnMask |= card.mask
+                left -= self.weights[card.id]
+                yield card
+        rest = [card for card in self.cards if not card.mask & drawnMask]
+        while True:
+            picked = self._Linear(rest, 1, rng)
+            if not picked:
+                return
+            rest.remove(picked[0])
+            yield picked[0]
+
+    def Sample(self, mask, count, rng):
+        # Same as _Sample, but weighted. Cards with weight 0 are only picked
+        # when no others are left, so the rules always find a card.
+        cards = []
+        if self.total:
+            for _ in range(4 * count):
+                if len(cards) == count:
+                    return cards
+                card = self._Draw(rng.random)
+                if card.mask & mask and self.weights[card.id]:
+                    cards.append(card)
+                    mask &= ~card.mask
+        cards += self._Linear(tuple(_MaskCards(mask)), count - len(cards), rng)
+        if len(cards) < count:
+            cards += _Sample(mask & ~_Mask(cards), count - len(cards), rng)
+        return cards
 
-Menagerie = Set("Menagerie")
-Menagerie.AddCards(
-    [
-        "Animal Fair",
-        "Barge",
-        "Black Cat",
-        "Bounty Hunter",
-        "Camel Train",
-        "Cardinal",
-        "Cavalry",
-        "Coven",
-        "Destrier",
-        "Displace",
-        "Falconer",
-        "Fisherman",
-        "Gatekeeper",
-        "Goatherd",
-        "Groom",
-        "Hostelry",
-        "Hunting Lodge",
-        "Kiln",
-        "Livery",
-        "Mastermind",
-        "Paddock",
-        "Sanctuary",
-        "Scrap",
-        "Sheepdog",
-        "Sleigh",
-        "Snowy Village",
-        "Stockpile",
-        "Supplies",
-        "Village Green",
-        "Wayfarer",
-        {"name": "Alliance", "types": {Event}},
-        {"name": "Banish", "types": {Event}},
-        {"name": "Bargain", "types": {Event}},
-        {"name": "Commerce", "types": {Event}},
-        {"name": "Delay", "types": {Event}},
-        {"name": "Demand", "types": {Event}},
-        {"name": "Desperation", "types": {Event}},
-        {"name": "Enclave", "types": {Event}},
-        {"name": "Enhance", "types": {Event}},
-        {"name": "Gamble", "types": {Event}},
-        {"name": "Invest", "types": {Event}},
-        {"name": "March", "types": {Event}},
-        {"name": "Populate", "types": {Event}},
-        {"name": "Pursue", "types": {Event}},
-        {"name": "Reap", "types": {Event}},
-        {"name": "Ride", "types": {Event}},
-        {"name": "Seize the Day", "types": {Event}},
-        {"name": "Stampede", "types": {Event}},
-        {"name": "Toil", "types": {Event}},
-        {"name": "Transport", "types": {Event}},
-        {"name": "Way of the Butterfly", "types": {Way}},
-        {"name": "Way of the Camel", "types": {Way}},
-        {"name": "Way of the Chameleon", "types": {Way}},
-        {"name": "Way of the Frog", "types": {Way}},
-        {"name": "Way of the Goat", "types": {Way}},
-        {"name": "Way of the Horse", "types": {Way}},
-        {"name": "Way of the Mole", "types": {Way}},
-        {"name": "Way of the Monkey", "types": {Way}},
-        {"name": "Way of the Mouse", "types": {Way}},
-        {"name": "Way of the Mule", "types": {Way}},
-        {"name": "Way of the Otter", "types": {Way}},
-        {"name": "Way of the Owl", "types": {Way}},
-        {"name": "Way of the Ox", "types": {Way}},
-        {"name": "Way of the Pig", "types": {Way}},
-        {"name": "Way of the Rat", "types": {Way}},
-        {"name": "Way of the Seal", "types": {Way}},
-        {"name": "Way of the Sheep", "types": {Way}},
-        {"name": "Way of the Squirrel", "types": {Way}},
-        {"name": "Way of the Turtle", "types": {Way}},
-        {"name": "Way of the Worm", "types": {Way}},
-    ]
-)
+    def _Linear(self, cards, count, rng):
+        # Weighted sample without replacement from cards, skipping weight 0
+        cards = [card for card in cards if self.Weight(card)]
+        picked = []
+        while cards and len(picked) < count:
+            pick = rng.random() * sum(self.Weight(card) for card in cards)
+            for index, card in enumerate(cards):
+                pick -= self.Weight(card)
+                if pick < 0:
+                    break
+            picked.append(cards.pop(index))
+        return picked
+
+
+def _WeightedShuffle(pools, tree, rng):
+    # _ShuffledCards with the cards drawn in proportion to their weights. tree
+    # holds pools.complete, which is pools.kingdom without landscapes.
+    if pools.hasLandscapes:
+        return tree.Shuffled(rng)
+    cards = []
+    for card in tree.Shuffled(rng):
+        cards.append(card)
+        if len(cards) == 10:
+            break
+    return cards
+
+
+def _ShuffledCards(pools, rng):
+    if pools.hasLandscapes:
+        # Landscapes compete with Kingdom cards for a place in the pile, which
+        # _DrawCards consumes only until it has 10 Kingdom cards
+        return _PartialShuffle(pools.complete, rng)
+    if len(pools.kingdom) < 10:
+        raise ValueError("The selected sets have fewer than 10 Kingdom cards")
+    return rng.sample(pools.kingdom, 10)
+
+
+def _Numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as _numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
+def _Starts(count, step):
+    # range(0, count, step), without end when count is None
+    start = 0
+    while count is None or start < count:
+        yield start
+        start += step
+
+
+def _ShuffledCardsBatch(pools, count, rng):
+    # Same as _ShuffledCards, but draws the orders for many kingdoms at once.
+    # With count None there is no end.
+    numpy = _Numpy()
+    if not numpy:
+        for _ in _Starts(count, 1):
+            yield _ShuffledCards(pools, rng)
+        return
+
+    generator = numpy.random.default_rng(rng.getrandbits(128))
+
+    if pools.hasLandscapes:
+        population = pools.complete
+        # Even if every landscape comes first, 10 Kingdom cards follow them
+        columns = min(len(population), 10 + len(population) - len(pools.kingdom))
+    else:
+        population = pools.kingdom
+        columns = 10
+
+    for start in _Starts(count, BatchChunkSize):
+        rows = BatchChunkSize if count is None else min(BatchChunkSize, count - start)
+        keys = generator.random((rows, len(population)))
+        if pools.hasLandscapes:
+            orders = numpy.argsort(keys, axis=1)[:, :columns]
+        else:
+            orders = numpy.argpartition(keys, columns - 1, axis=1)[:, :columns]
+        for order in orders.tolist():
+            yield [population[index] for index in order]
+
+
+def NewSeed():
+    # Random seed that survives a round trip through JSON and JavaScript
+    return random.SystemRandom().randrange(2**53)
+
+
+def _Random(seed):
+    # seed may be anything random.Random accepts, or a random.Random instance.
+    # Without a seed every call gets its own independently seeded generator.
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+
+# Constraints on the kingdom and landscapes, e.g. [{"set": "Antiquities",
+# "min": 2}, {"card": "Chapel"}, {"type": "Event", "max": 1}]. Each one selects
+# cards by card, set or type and bounds how many of them are picked. Without
+# min or max a constraint means "at least one".
+def _ParseConstraint(constraint):
+    if not isinstance(constraint, dict):
+        raise ValueError("Each constraint must be an object")
+    selectors = [key for key in ("card", "set", "type") if key in constraint]
+    if len(selectors) != 1:
+        raise ValueError("Each constraint needs exactly one of card, set or type")
+    selector = selectors[0]
+    value = constraint[selector]
+    if not isinstance(value, str):
+        raise ValueError("{} must be a string".format(selector))
+
+    if selector == "card":
+        mask = _NamedCards(value)
+    elif selector == "set":
+        mask = AllSets[value].cards.mask if value in AllSets else 0
+    else:
+        cardType = CardTypes.get(value)
+        mask = _Mask(card for card in AllCards if cardType in card.types)
+    if not mask or (selector == "type" and value not in CardTypes):
+        raise ValueError("Unknown {}: {}".format(selector, value))
+
+    low = constraint.get("min")
+    high = constraint.get("max")
+    for bound in (low, high):
+        if bound is not None and (
+            not isinstance(bound, int) or isinstance(bound, bool) or bound < 0
+        ):
+            raise ValueError("min and max must be non-negative integers")
+    if low is None:
+        low = 1 if high is None else 0
+    if high is not None and high < low:
+        raise ValueError("{} {}: max is less than min".format(selector, value))
+    return "{} {}".format(selector, value), mask, low, high
+
+
+def _LandscapeCounts(kingdoms, landscapes, ways, limitLandscapes):
+    # Yields (landscapes, ways, probability) for the landscape row of
+    # _DrawCards: the pile is shuffled and dealt until 10 Kingdom cards
+    # are out, then up to 3 landscapes and 1 Way are kept from what was
+    # dealt (1 Way and 2 in all with limit-landscapes)
+    others = landscapes + ways
+    counts = {}
+    for dealt in range(others + 1):
+        # Negative hypergeometric: landscapes dealt before the 10th
+        # Kingdom card. Which of them are Ways is then hypergeometric.
+        dealtCount = comb(dealt + 9, dealt) * comb(
+            kingdoms - 10 + others - dealt, others - dealt
+        )
+        for dealtWays in range(max(0, dealt - landscapes), min(dealt, ways) + 1):
+            keptWays = min(1, dealtWays)
+            if limitLandscapes:
+                kept = min(2 - keptWays, dealt - dealtWays)
+            else:
+                kept = min(3, dealt - dealtWays)
+            counts[kept, keptWays] = counts.get((kept, keptWays), 0) + (
+                dealtCount
+                * comb(landscapes, dealt - dealtWays)
+                * comb(ways, dealtWays)
+                / comb(others, dealt)
+            )
+    total = sum(counts.values())
+    for (kept, keptWays), count in sorted(counts.items()):
+        yield kept, keptWays, count / total
+
+
+class KingdomConstraints(object):
+    # Draws kingdoms that meet a list of constraints by construction. Cards
+    # are grouped into atoms (same part of the pile and same constraints), and
+    # the number of cards taken from each atom is drawn from the exact
+    # distribution an unconstrained draw has once it is conditioned on the
+    # constraints, so no draw is ever thrown away. The Kingdom is a uniform
+    # set of 10 Kingdom cards. Landscapes follow the pile model of _DrawCards,
+    # in which landscapes compete with Kingdom cards, and the counts of
+    # landscapes and Ways it ends up with are worked out up front.
+    def __init__(self, pools, options, constraints):
+        catalog = LoadCatalog()
+        options = options or {}
+
+        # Each constraint is (description, mask, cap, allowed): counts are
+        # capped at cap, and allowed lists the capped counts that are fine
+        landscapeMask = pools.completeMask & catalog.LandscapeCards.mask
+        wayMask = landscapeMask & catalog.Ways.mask
+        self.constraints = []
+        for constraint in constraints:
+            description, mask, low, high = _ParseConstraint(constraint)
+            available = _PopCount(mask & pools.completeMask)
+            if low > available:
+                raise ValueError(
+                    "Can't satisfy {}: needs at least {} but the selected sets "
+                    "have {}".format(description, low, available)
+                )
+            # Each constraint on its own against the 10 Kingdom cards and the
+            # landscape row (up to 3 landscapes and 1 Way, or 2 in all with
+            # limit-landscapes), so the one at fault is named
+            ways = min(1, _PopCount(mask & wayMask))
+            others = _PopCount(mask & landscapeMask & ~wayMask)
+            if options.get("limit-landscapes"):
+                row = min(2, others + ways)
+            else:
+                row = min(3, others) + ways
+            most = min(10, _PopCount(mask & pools.kingdomMask)) + row
+            if low > most:
+                raise ValueError(
+                    "Can't satisfy {}: needs at least {} but a kingdom can have "
+                    "at most {}".format(description, low, most)
+                )
+            least = max(0, 10 - _PopCount(pools.kingdomMask & ~mask))
+            if high is not None and high < least:
+                raise ValueError(
+                    "Can't satisfy {}: allows at most {} but every kingdom has "
+                    "at least {}".format(description, high, least)
+                )
+            if high is None:
+                self.constraints.append((description, mask, low, {low}))
+            else:
+                self.constraints.append(
+                    (description, mask, high + 1, set(range(low, high + 1)))
+                )
+        # With constraints the Alchemy rule is one more constraint, instead of
+        # redrawing cards afterwards: no Alchemy cards, or at least 3. It is
+        # left out of error messages, which name only the request's own.
+        requested = [constraint[0] for constraint in self.constraints]
+        if pools.alchemyRule and options.get("enforce-alchemy-rule", True):
+            self.constraints.append(
+                ("Alchemy rule", catalog.Alchemy.cards.mask, 3, {0, 3})
+            )
 
-Antiquities = Set("Antiquities")
-Antiquities.AddCards(
-    [
-        "Inscription",
-        "Agora",
-        "Discovery",
-        "Aquifer",
-        "Tomb Raider",
-        "Curio",
-        "Gamepiece",
-        "Dig",
-        "Moundbuilder Village",
-        "Encroach",
-        "Stoneworks",
-        "Graveyard",
-        "Inspector",
-        "Archaeologist",
-        "Mission House",
-        "Mendicant",
-        "Profiteer",
-        "Miner",
-        "Pyramid",
-        "Mastermind",
-        "Mausoleum",
-        "Shipwreck",
-        "Collector",
-        "Pharaoh",
-        "Grave Watcher",
-        "Stronghold",
-        "Snake Charmer",
-    ]
-)
+        if _PopCount(pools.kingdomMask) < 10:
+            raise ValueError("The selected sets have fewer than 10 Kingdom cards")
+        parts = (pools.kingdomMask, landscapeMask & ~wayMask, wayMask)
+
+        self.atoms = []
+        for part, mask in enumerate(parts):
+            atoms = {}
+            for card in _MaskCards(mask):
+                signature = tuple(
+                    index
+                    for index, constraint in enumerate(self.constraints)
+                    if card.mask & constraint[1]
+                )
+                atoms.setdefault(signature, []).append(card)
+            for signature, cards in sorted(atoms.items()):
+                self.atoms.append((part, tuple(cards), signature))
+        # Cards left in each part from each atom on, to cut off dead ends
+        self.left = []
+        left = [0, 0, 0]
+        for part, cards, _ in reversed(self.atoms):
+            left[part] += len(cards)
+            self.left.append(tuple(left))
+        self.left.reverse()
+        self.left.append((0, 0, 0))
+
+        self.limitLandscapes = bool(options.get("limit-landscapes"))
+        self.outcomes = []
+        self._ways = {}
+        start = tuple(0 for _ in self.constraints)
+        for landscapes, ways, probability in _LandscapeCounts(
+            *(_PopCount(mask) for mask in parts), self.limitLandscapes
+        ):
+            weight = (
+                probability
+                / comb(_PopCount(parts[1]), landscapes)
+                / comb(_PopCount(parts[2]), ways)
+                * self._Ways(0, (10, landscapes, ways), start)
+            )
+            if weight:
+                self.outcomes.append((weight, (10, landscapes, ways)))
+        if not self.outcomes:
+            raise ValueError(
+                "The constraints can't all be satisfied together: {}".format(
+                    ", ".join(requested)
+                )
+            )
+        self.total = sum(weight for weight, _ in self.outcomes)
+
+    def _Ways(self, index, remaining, counts):
+        # Weighted number of ways to take the remaining cards of each part
+        # from atoms[index:] and end up with allowed counts
+        key = (index, remaining, counts)
+        if key in self._ways:
+            return self._ways[key]
+        if index == len(self.atoms):
+            ways = int(
+                not any(remaining)
+                and all(
+                    count in constraint[3]
+                    for count, constraint in zip(counts, self.constraints)
+                )
+            )
+        elif any(need > left for need, left in zip(remaining, self.left[index])):
+            ways = 0
+        else:
+            ways = 0
+            for take, nextCounts in self._Takes(index, remaining, counts):
+                part = self.atoms[index][0]
+                nextRemaining = list(remaining)
+                nextRemaining[part] -= take
+                ways += comb(len(self.atoms[index][1]), take) * self._Ways(
+                    index + 1, tuple(nextRemaining), nextCounts
+                )
+        self._ways[key] = ways
+        return ways
+
+    def _Takes(self, index, remaining, counts):
+        # How many cards atoms[index] can give, with the counts that follows
+        part, cards, signature = self.atoms[index]
+        for take in range(min(len(cards), remaining[part]) + 1):
+            nextCounts = list(counts)
+            for constraint in signature:
+                cap, allowed = self.constraints[constraint][2:]
+                nextCounts[constraint] = min(cap, counts[constraint] + take)
+                if nextCounts[constraint] == cap and cap not in allowed:
+                    return
+            yield take, tuple(nextCounts)
+
+    def Draw(self, rng):
+        # Returns (resultMask, landscapeList) like _DrawCards
+        pick = rng.random() * self.total
+        for weight, remaining in self.outcomes:
+            pick -= weight
+            if pick < 0:
+                break
+
+        resultMask = 0
+        landscapeList = []
+        counts = tuple(0 for _ in self.constraints)
+        for index, (part, cards, _) in enumerate(self.atoms):
+            choices = []
+            for take, nextCounts in self._Takes(index, remaining, counts):
+                nextRemaining = list(remaining)
+                nextRemaining[part] -= take
+                nextRemaining = tuple(nextRemaining)
+                weight = comb(len(cards), take) * self._Ways(
+                    index + 1, nextRemaining, nextCounts
+                )
+                if weight:
+                    choices.append((weight, take, nextRemaining, nextCounts))
+            pick = rng.random() * sum(choice[0] for choice in choices)
+            for weight, take, nextRemaining, nextCounts in choices:
+                pick -= weight
+                if pick < 0:
+                    break
+            remaining, counts = nextRemaining, nextCounts
+
+            picked = rng.sample(cards, take)
+            if part:
+                landscapeList.extend(picked)
+            else:
+                resultMask |= _Mask(picked)
+        return resultMask, landscapeList
+
+    def Blocked(self, mask):
+        # Cards that would take a constraint past its max, for the Bane and
+        # Mouse picks that come after the draw
+        blocked = 0
+        for _, constraintMask, cap, allowed in self.constraints:
+            if cap - 1 in allowed and _PopCount(mask & constraintMask) >= cap - 1:
+                blocked |= constraintMask
+        return blocked & ~mask
+
+
+def GetConstraints(pools, options, constraints):
+    # Compiled KingdomConstraints, cached like the card pools. Raises
+    # ValueError when the constraints can't be satisfied.
+    key = (
+        pools.key,
+        bool((options or {}).get("limit-landscapes")),
+        bool((options or {}).get("enforce-alchemy-rule", True)),
+        json.dumps(constraints, sort_keys=True),
+    )
+    return ConstraintCache.Get(
+        key, lambda key: KingdomConstraints(pools, options, constraints)
+    )
 
-# Define Landscape cards
-Events = Adventures.events | Empires.events | Menagerie.events
-Landmarks = Empires.landmarks
-Projects = Renaissance.projects
-Ways = Menagerie.ways
-LandscapeCards = Events | Landmarks | Projects | Ways
-
-# Define cards requiring potions
-PotionCards = Alchemy.potionCards
-
-# Define randomizer rules
-PlatinumLove = Prosperity.cards.union(
-    Base.cards("Artisan", "Council Room", "Merchant", "Mine"),
-    Intrigue.cards("Harem", "Nobles"),
-    Seaside.cards("Explorer", "Treasure Map"),
-    Alchemy.cards("Philosopher's Stone"),
-    Cornucopia.cards("Tournament"),
-    Hinterlands.cards("Border Village", "Cache", "Duchess", "Embassy", "Fool's Gold"),
-    DarkAges.cards("Altar", "Counterfeit", "Hunting Grounds", "Poor House"),
-    Guilds.cards("Masterpiece", "Soothsayer"),
-    Adventures.cards(
-        "Hireling", "Lost City", "Page", "Treasure Trove", "Seaway", "Training"
-    ),
-    Empires.cards(
-        "Capital",
-        "Castles",
-        "Chariot Race",
-        "Crown",
-        "Encampment/Plunder",
-        "Farmers' Market",
-        "Gladiator/Fortune",
-        "Groundskeeper",
-        "Legionary",
-        "Patrician/Emporium",
-        "Sacrifice",
-        "Temple",
-        "Wild Hunt",
-        "Triumph",
-        "Delve",
-        "Wedding",
-        "Conquest",
-        "Dominate",
-        "Basilica",
-        "Keep",
-    ),
-    Nocturne.cards(
-        "Pooka + Cursed Gold (Heirloom)",
-        "Raider",
-        "Sacred Grove",
-        "Secret Cave + Magic Lamp (Heirloom)",
-        "Tragic Hero",
-    ),
-    Renaissance.cards("Ducat", "Scepter", "Spices", "Capitalism", "Guildhall"),
-    Menagerie.cards(
-        "Supplies",
-        "Camel Train",
-        "Stockpile",
-        "Livery",
-        "Animal Fair",
-        "Commerce",
-        "Enclave",
-        "Way of the Chameleon",
-    ),
-    Antiquities.cards(
-        "Agora",
-        "Archaeologist",
-        "Curio",
-        "Discovery",
-        "Encroach",
-        "Gamepiece",
-        "Moundbuilder Village",
-        "Pharaoh",
-        "Pyramid",
-        "Snake Charmer",
-        "Stoneworks",
-    ),
-)
 
-ShelterLove = DarkAges.cards.union(
-    Base.cards("Remodel", "Mine"),
-    Intrigue.cards("Replace", "Upgrade"),
-    Seaside.cards("Salvager"),
-    Alchemy.cards("Apprentice", "Scrying Pool"),
-    Prosperity.cards("Bishop", "Expand", "Forge"),
-    Cornucopia.cards("Remake"),
-    Hinterlands.cards("Develop", "Farmland", "Trader"),
-    Adventures.cards("Raze", "Transmogrify", "Trade"),
-    Empires.cards(
-        "Catapult/Rocks", "Sacrifice", "Fountain", "Labyrinth", "Museum", "Tomb"
-    ),
-    Guilds.cards("Butcher", "Journeyman", "Stonemason", "Taxman"),
-    Nocturne.cards(
-        "Cemetary + Haunted Mirror (Heirloom)", "Exorcist", "Necromancer + Zombies"
-    ),
-    Renaissance.cards("Priest", "Pageant"),
-    Menagerie.cards(
-        "Camel Train", "Scrap", "Displace", "Enhance", "Way of the Butterfly"
-    ),
-    Antiquities.cards(
-        "Collector",
-        "Graveyard",
-        "Mendicant",
-        "Pharaoh",
-        "Profiteer",
-        "Shipwreck",
-        "Snake Charmer",
-        "Stoneworks",
-    ),
-)
+# The balance options compiled for a pool, from the card metadata in
+# cardinfo.py. Each option is a requirement that some Kingdom card has to meet
+# (village-for-draw only once there is terminal draw), or with limit-attacks
+# a cap. Every Kingdom card gets the bits of the requirements it meets, so
+# checking a card as it is drawn takes a few integer operations instead of
+# rerolling kingdoms that miss.
+class KingdomBalance(object):
+    def __init__(self, pools, options):
+        import cardinfo
+
+        index = cardinfo.LoadCardInfo()
+        keywords = index.keywordMasks
+        kingdomMask = pools.kingdomMask
+        requirements = []
+        if options.get("guarantee-buy"):
+            requirements.append(("+Buy", keywords["+Buy"]))
+        if options.get("guarantee-trasher"):
+            requirements.append(("trasher", keywords["Trasher"]))
+        if options.get("cost-spread"):
+            # Cards that cost debt count as expensive ones
+            requirements += [
+                ("card costing $2 or less", index.CostMask(None, 2) & ~index.debtMask),
+                ("card costing $3", index.CostMask(3, 3) & ~index.debtMask),
+                ("card costing $4", index.CostMask(4, 4) & ~index.debtMask),
+                ("card costing $5 or more", index.CostMask(5) | index.debtMask),
+            ]
+
+        # Requirement bits by card ID
+        self.bits = [0] * len(AllCards)
+        self.required = 0
+        for bit, (name, mask) in enumerate(requirements):
+            mask &= kingdomMask
+            if not mask:
+                raise ValueError("The selected sets have no {}".format(name))
+            self.required |= 1 << bit
+            for card in _MaskCards(mask):
+                self.bits[card.id] |= 1 << bit
+
+        self.villageBit = 0
+        self.terminalMask = 0
+        self.blockedMask = 0
+        if options.get("village-for-draw"):
+            terminalMask = (
+                kingdomMask
+                & index.typeMasks["Action"]
+                & keywords["+Card"]
+                & ~keywords["+Action"]
+                & ~keywords["Village"]
+            )
+            villageMask = kingdomMask & keywords["Village"]
+            if villageMask:
+                self.villageBit = 1 << len(requirements)
+                self.terminalMask = terminalMask
+                for card in _MaskCards(villageMask):
+                    self.bits[card.id] |= self.villageBit
+            else:
+                # Terminal draw can never have a village here, so it's out
+                self.blockedMask = terminalMask
+        self.attackMask = 0
+        if options.get("limit-attacks"):
+            self.attackMask = kingdomMask & index.typeMasks["Attack"]
+        self.landscapeMask = LoadCatalog().LandscapeCards.mask
+        # Unmet requirements by their bits, without counting bits per card
+        self.unmetCounts = [
+            _PopCount(bits) for bits in range(1 << (len(requirements) + 1))
+        ]
+
+    def _State(self, mask):
+        # (requirements met, requirements, Attacks) for the Kingdom cards in
+        # mask
+        met = 0
+        for card in _SparseMaskCards(mask & ~self.landscapeMask):
+            met |= self.bits[card.id]
+        required = self.required
+        if mask & self.terminalMask:
+            required |= self.villageBit
+        return met, required, _PopCount(mask & self.attackMask)
+
+    def Met(self, mask):
+        met, required, attacks = self._State(mask)
+        return (
+            not required & ~met
+            and attacks <= MaxAttacks
+            and not mask & self.blockedMask
+        )
 
-LooterCards = DarkAges.cards("Death Cart", "Marauder", "Cultist")
+    def Blocked(self, mask):
+        # Cards that would break a guarantee if added to the Kingdom cards in
+        # mask, as a Bane is
+        met, _, attacks = self._State(mask)
+        blocked = self.blockedMask
+        if attacks >= MaxAttacks:
+            blocked |= self.attackMask
+        if self.villageBit and not met & self.villageBit:
+            blocked |= self.terminalMask
+        return blocked & ~mask
+
+    def Filter(self, cards, takenMask=0, slots=10):
+        # The pile of cards with each Kingdom card held back that would leave
+        # more requirements unmet than there are slots left after it, or go
+        # over the Attack cap. _DrawCards takes every Kingdom card this yields
+        # until it has slots of them. Held back cards follow at the end in
+        # case the pile runs out first.
+        if takenMask:
+            met, required, attacks = self._State(takenMask)
+        else:
+            met, required, attacks = 0, self.required, 0
+        bits = self.bits
+        unmetCounts = self.unmetCounts
+        villageBit = self.villageBit
+        terminalMask = self.terminalMask
+        attackMask = self.attackMask
+        blockedMask = self.blockedMask
+        landscapeMask = self.landscapeMask
+        held = []
+        for card in cards:
+            mask = card.mask
+            if mask & landscapeMask:
+                yield card
+                continue
+            if mask & takenMask:
+                continue
+            cardMet = met | bits[card.id]
+            cardRequired = required | villageBit if mask & terminalMask else required
+            cardAttacks = attacks + 1 if mask & attackMask else attacks
+            if (
+                mask & blockedMask
+                or cardAttacks > MaxAttacks
+                or unmetCounts[cardRequired & ~cardMet] >= slots
+            ):
+                held.append(card)
+                continue
+            met, required, attacks = cardMet, cardRequired, cardAttacks
+            takenMask |= mask
+            slots -= 1
+            yield card
+        for card in held:
+            yield card
+
+    def Refill(self, resultMask, keepMask, kingdomMask, rng):
+        # resultMask with its cards outside keepMask drawn again through
+        # Filter: those cards first where they fit, then others from
+        # kingdomMask
+        count = _PopCount(resultMask & ~keepMask)
+        pile = chain(
+            _PartialShuffle(tuple(_MaskCards(resultMask & ~keepMask)), rng),
+            _PartialShuffle(tuple(_MaskCards(kingdomMask & ~resultMask)), rng),
+        )
+        for card in islice(self.Filter(pile, keepMask, count), count):
+            keepMask |= card.mask
+        return keepMask
 
-SpoilsCards = DarkAges.cards("Bandit Camp", "Marauder", "Pillage")
 
-BoonCards = Nocturne.cards(
-    "Bard",
-    "Blessed Village",
-    "Druid",
-    "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
-    "Idol",
-    "Pixie + Goat (Heirloom)",
-    "Sacred Grove",
-    "Tracker + Pouch (Heirloom)",
-)
+def HasBalanceOptions(options):
+    return any((options or {}).get(name) for name in BalanceOptions)
 
-HexCards = Nocturne.cards(
-    "Cursed Village", "Leprechaun", "Skulk", "Tormentor", "Vampire", "Werewolf"
-)
 
-WishCards = Nocturne.cards("Leprechaun", "Secret Cave + Magic Lamp (Heirloom)")
-
-HorseCards = Menagerie.cards(
-    "Cavalry",
-    "Groom",
-    "Hostelry",
-    "Livery",
-    "Paddock",
-    "Scrap",
-    "Sleigh",
-    "Supplies",
-    # Events
-    "Bargain",
-    "Demand",
-    "Ride",
-    "Stampede",
-)
+def GetBalance(pools, options, constraints=None):
+    # Compiled KingdomBalance for the balance options that are on, or None.
+    # Raises ValueError when the pool can't meet them.
+    flags = tuple(bool((options or {}).get(name)) for name in BalanceOptions)
+    if not any(flags):
+        return None
+    if constraints:
+        raise ValueError("Constraints can't be combined with balance options")
+    return BalanceCache.Get(
+        (pools.key,) + flags, lambda key: KingdomBalance(pools, options)
+    )
 
-TrapLove = Antiquities.cards.union(
-    Base.cards("Vassal", "Remodel", "Workshop", "Mine", "Library", "Artisan"),
-    Intrigue.cards(
-        "Courtyard",
-        "Lurker",
-        "Masquerade",
-        "Swindler",
-        "Ironworks",
-        "Minion",
-        "Replace",
-        "Upgrade",
-    ),
-    Seaside.cards("Lookout", "Warehouse", "Navigator", "Salvager"),
-    Alchemy.cards("University"),
-    Prosperity.cards(
-        "Loan", "Watchtower", "Bishop", "Vault", "Venture", "Goons", "Expand", "Forge"
-    ),
-    Cornucopia.cards(
-        "Fortune Teller",
-        "Menagerie",
-        "Farming Village",
-        "Remake",
-        "Young Witch",
-        "Harvest",
-        "Hunting Party",
-    ),
-    Hinterlands.cards(
-        "Develop",
-        "Oracle",
-        "Trader",
-        "Cartographer",
-        "Embassy",
-        "Haggler",
-        "Margrave",
-        "Border Village",
-        "Farmland",
-    ),
-    DarkAges.cards(
-        "Hermit",
-        "Storeroom",
-        "Urchin",
-        "Feodum",
-        "Rats",
-        "Wandering Minstrel",
-        "Catacombs",
-        "Rebuild",
-        "Rogue",
-    ),
-    Guilds.cards("Stonemason", "Butcher"),
-    Adventures.cards(
-        "Raze",
-        "Guide",
-        "Duplicate",
-        "Magpie",
-        "Messenger",
-        "Transmogrify",
-        "Scouting Party",
-    ),
-    Empires.cards(
-        "Engineer",
-        "Farmers' Market",
-        "Catapult/Rocks",
-        "Gladiator/Fortune",
-        "Temple",
-        "Forum",
-        "Legionary",
-        "Triumph",
-        "Ritual",
-        "Conquest",
-        "Labyrinth",
-        "Museum",
-    ),
-    Nocturne.cards(
-        "Monastery",
-        "Changeling",
-        "Secret Cave + Magic Lamp (Heirloom)",
-        "Devil's Workshop",
-        "Exorcist",
-        "Cobbler",
-        "Vampire",
-        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
-    ),
-    Renaissance.cards(
-        "Experiment",
-        "Inventor",
-        "Research",
-        "Recruiter",
-        "Scholar",
-        "Sculptor",
-        "Villain",
-    ),
-    Menagerie.cards(
-        "Camel Train",
-        "Scrap",
-        "Bounty Hunter",
-        "Groom",
-        "Hunting Lodge",
-        "Displace",
-        "Kiln",
-        "Livery",
-        "Destrier",
-        "Enhance",
-        "Commerce",
-        "Populate",
-        "Way of the Mole",
-    ),
-)
 
-BaneCards = set().union(
-    Adventures.cards(
-        "Amulet",
-        "Caravan Guard",
-        "Coin of the Realm",
-        "Dungeon",
-        "Gear",
-        "Guide",
-        "Page",
-        "Peasant",
-        "Ratcatcher",
-        "Raze",
-    ),
-    Alchemy.cards("Herbalist"),
-    Antiquities.cards(
-        "Discovery",
-        "Gamepiece",
-        "Grave Watcher",
-        "Inscription",
-        "Inspector",
-        "Profiteer",
-        "Shipwreck",
-        "Tomb Raider",
-        "Miner",
-    ),
-    Base.cards(
-        "Cellar",
-        "Chapel",
-        "Harbinger",
-        "Merchant",
-        "Moat",
-        "Vassal",
-        "Village",
-        "Workshop",
-    ),
-    Cornucopia.cards("Fortune Teller", "Hamlet", "Menagerie"),
-    DarkAges.cards(
-        "Beggar",
-        "Forager",
-        "Hermit",
-        "Market Square",
-        "Sage",
-        "Squire",
-        "Storeroom",
-        "Urchin",
-        "Vagrant",
-    ),
-    Empires.cards(
-        "Castles",
-        "Catapult/Rocks",
-        "Chariot Race",
-        "Encampment/Plunder",
-        "Enchantress",
-        "Farmers' Market",
-        "Gladiator/Fortune",
-        "Patrician/Emporium",
-        "Settlers/Bustling Village",
-    ),
-    Guilds.cards("Candlestick Maker", "Doctor", "Masterpiece", "Stonemason"),
-    Hinterlands.cards(
-        "Crossroads", "Develop", "Duchess", "Fool's Gold", "Oasis", "Scheme", "Tunnel"
-    ),
-    Intrigue.cards(
-        "Courtyard",
-        "Lurker",
-        "Masquerade",
-        "Pawn",
-        "Shanty Town",
-        "Steward",
-        "Swindler",
-        "Wishing Well",
-    ),
-    Menagerie.cards(
-        "Black Cat",
-        "Camel Train",
-        "Goatherd",
-        "Scrap",
-        "Sheepdog",
-        "Sleigh",
-        "Snowy Village",
-        "Stockpile",
-        "Supplies",
-    ),
-    Nocturne.cards(
-        "Changeling",
-        "Druid",
-        "Faithful Hound",
-        "Fool + Lucky Coin (Heirloom) + Lost In the Woods (State)",
-        "Ghost Town",
-        "Guardian",
-        "Leprechaun",
-        "Monastery",
-        "Night Watchman",
-        "Pixie + Goat (Heirloom)",
-        "Secret Cave + Magic Lamp (Heirloom)",
-        "Tracker + Pouch (Heirloom)",
-    ),
-    Prosperity.cards("Loan", "Trade Route", "Watchtower"),
-    Renaissance.cards(
-        "Acting Troupe",
-        "Border Guard",
-        "Cargo Ship",
-        "Ducat",
-        "Experiment",
-        "Improve",
-        "Lackeys",
-    ),
-    Seaside.cards(
-        "Ambassador",
-        "Embargo",
-        "Fishing Village",
-        "Haven",
-        "Lighthouse",
-        "Lookout",
-        "Native Village",
-        "Pearl Diver",
-        "Smugglers",
-        "Warehouse",
-    ),
-)
+def GetCardWeights(pools, weights):
+    # Compiled CardWeights, cached like the card pools so each selection and
+    # weights pair builds its alias table once
+    key = (pools.key, json.dumps(weights, sort_keys=True))
+    return WeightCache.Get(key, lambda key: CardWeights(pools, weights, key))
+
+
+def _Pools(setNames, options, collection):
+    # A collection replaces the set selection, and its options are defaults
+    # for the ones given with the request
+    if collection is None:
+        return GetCardPools(setNames, options), options
+    return collection.pools, dict(collection.options, **(options or {}))
+
+
+def _Weights(pools, collection, constraints, history, weights):
+    # CardWeights for the request, or None. A collection's weights apply
+    # unless the request has its own or is constrained.
+    if weights is None and collection is not None and not constraints:
+        weights = collection.weights
+    if constraints and (history is not None or weights is not None):
+        raise ValueError("Constraints can't be combined with weights or a history")
+    return None if weights is None else GetCardWeights(pools, weights)
+
+
+def _Draw(pools, options, rng, history, weights, balance):
+    # _DrawCards from a pile in weighted order, by the history's weights times
+    # the static ones, or in uniform order without either. With a
+    # KingdomBalance the whole pile goes through its Filter.
+    tree = weights if history is None else history.Tree(pools, weights)
+    if balance is None:
+        cards = _WeightedShuffle(pools, tree, rng)
+    elif tree is None:
+        cards = balance.Filter(_PartialShuffle(pools.complete, rng))
+    else:
+        cards = balance.Filter(tree.Shuffled(rng))
+    return _DrawCards(pools, options, cards, rng, tree is not None)
+
+
+def _Candidates(pools, options, rng, count, constraints, history, weights, balance):
+    # (resultMask, landscapeList) for count kingdoms, each drawn the way
+    # RandomizeDominion draws one
+    if constraints:
+        for _ in range(count):
+            yield constraints.Draw(rng)
+    elif history is not None or weights is not None or balance is not None:
+        for _ in range(count):
+            yield _Draw(pools, options, rng, history, weights, balance)
+    else:
+        for cards in _ShuffledCardsBatch(pools, count, rng):
+            yield _DrawCards(pools, options, cards, rng)
+
+
+def _BestKingdom(
+    pools, options, rng, candidates, constraints, structured, weights, balance
+):
+    # _ApplyRules for the candidate kingdom that synergy.py scores highest.
+    # Every candidate gets its rule cards, so the Bane and Mouse count too,
+    # but only the best one is formatted.
+    import synergy
+
+    kingdoms = []
+    masks = []
+    for resultMask, landscapeList in candidates:
+        resultMask, baneCard, mouseCard = _RuleCards(
+            pools,
+            options,
+            resultMask,
+            landscapeList,
+            rng,
+            constraints,
+            weights=weights,
+            balance=balance,
+        )
+        kingdoms.append((resultMask, landscapeList, baneCard, mouseCard))
+        mask = resultMask | _Mask(landscapeList)
+        if mouseCard is not None:
+            mask |= mouseCard.mask
+        masks.append(mask)
+    best = kingdoms[synergy.LoadSynergy().Best(masks)]
+    return _FinalKingdom(pools, *best, rng, structured)
+
+
+def RandomizeDominion(
+    setNames=None,
+    options=None,
+    seed=None,
+    constraints=None,
+    collection=None,
+    structured=False,
+    history=None,
+    weights=None,
+    candidates=None,
+):
+    # The kingdom as a list of formatted strings, or with structured as a
+    # dict of share IDs (see _Structured and GetShareDictionary). history
+    # makes recently played cards less likely: anything with a Tree(pools,
+    # weights) method that returns a WeightTree of pools.complete, such as
+    # history.PlayHistory. weights are static weights (see _ParseWeights).
+    # The balance options (BalanceOptions) are enforced as cards are drawn.
+    # With candidates more than 1, that many kingdoms are drawn and the one
+    # with the best synergy score is returned.
+    if candidates is not None and (
+        not isinstance(candidates, int)
+        or isinstance(candidates, bool)
+        or candidates < 1
+    ):
+        raise ValueError("candidates must be a positive integer")
+    rng = _Random(seed)
+    pools, options = _Pools(setNames, options, collection)
+    weights = _Weights(pools, collection, constraints, history, weights)
+    balance = GetBalance(pools, options, constraints)
+    if constraints:
+        constraints = GetConstraints(pools, options, constraints)
+    if candidates is not None and candidates > 1:
+        return _BestKingdom(
+            pools,
+            options,
+            rng,
+            _Candidates(
+                pools,
+                options,
+                rng,
+                candidates,
+                constraints,
+                history,
+                weights,
+                balance,
+            ),
+            constraints,
+            structured,
+            weights,
+            balance,
+        )
+    if constraints:
+        resultMask, landscapeList = constraints.Draw(rng)
+    elif history is not None or weights is not None or balance is not None:
+        resultMask, landscapeList = _Draw(
+            pools, options, rng, history, weights, balance
+        )
+    else:
+        resultMask, landscapeList = _DrawCards(
+            pools, options, _ShuffledCards(pools, rng), rng
+        )
+    return _ApplyRules(
+        pools,
+        options,
+        resultMask,
+        landscapeList,
+        rng,
+        constraints,
+        structured,
+        weights,
+        balance,
+    )
 
 
-def RandomizeDominion(setNames=None, options=None):
-    # Make full list + Events + Landmarks to determine landmarks
-    sets = set()
-    if setNames is None:
-        sets.update(AllSets.values())
-    else:
-        for setName in setNames:
-            if setName in AllSets:
-                sets.add(AllSets[setName])
-
-    if options:
-        if Base in sets:
-            if options.get("base-first-edition"):
-                Base.AddCards(Base.firstEdition)
-
-            if not options.get("base-second-edition", True):
-                Base.RemoveCards(Base.secondEdition)
-
-        if Intrigue in sets:
-            if options.get("intrigue-first-edition"):
-                Intrigue.AddCards(Intrigue.firstEdition)
-
-            if not options.get("intrigue-second-edition", True):
-                Intrigue.RemoveCards(Intrigue.secondEdition)
-
-    completeSet = set().union(*(cardSet.cards for cardSet in sets))
-    landscapeSet = set()
-
-    if completeSet & LandscapeCards:
-        # Handle sets that include landscape cards
-        kingdomSet = completeSet - LandscapeCards
-
-        resultSet = set()
-        waySet = set()
-        counter = 0
-        while not landscapeSet and counter < 3:
-            # Shuffle all cards
-            cards = iter(random.sample(completeSet, len(completeSet)))
-
-            # Categorize cards from the shuffled pile
-            while len(resultSet) < 10:
-                card = next(cards)
-                if card.types & {Way}:
-                    waySet.add(card)
-                elif card.types & {Event, Landmark, Project}:
-                    landscapeSet.add(card)
-                else:
-                    resultSet.add(card)
-
-            counter += 1
-
-        # Get final list of landscape cards
-        if options and options.get("limit-landscapes"):
-            landscapeList = random.sample(waySet, len(waySet))[:1]
-            landscapeList.extend(
-                random.sample(landscapeSet, len(landscapeSet))[: 2 - len(landscapeList)]
+def RandomizeDominionBatch(
+    setNames=None,
+    options=None,
+    count=1,
+    seed=None,
+    constraints=None,
+    collection=None,
+    structured=False,
+    history=None,
+    weights=None,
+):
+    rng = _Random(seed)
+    pools, options = _Pools(setNames, options, collection)
+    weights = _Weights(pools, collection, constraints, history, weights)
+    balance = GetBalance(pools, options, constraints)
+    if constraints:
+        constraints = GetConstraints(pools, options, constraints)
+        return [
+            _ApplyRules(
+                pools, options, *constraints.Draw(rng), rng, constraints, structured
+            )
+            for _ in range(count)
+        ]
+    if history is not None or weights is not None or balance is not None:
+        return [
+            _ApplyRules(
+                pools,
+                options,
+                *_Draw(pools, options, rng, history, weights, balance),
+                rng,
+                structured=structured,
+                weights=weights,
+                balance=balance,
             )
+            for _ in range(count)
+        ]
+    return [
+        _ApplyRules(
+            pools,
+            options,
+            *_DrawCards(pools, options, cards, rng),
+            rng,
+            structured=structured,
+        )
+        for cards in _ShuffledCardsBatch(pools, count, rng)
+    ]
+
+
+def IterKingdoms(
+    setNames=None,
+    options=None,
+    seed=None,
+    constraints=None,
+    collection=None,
+    structured=False,
+    weights=None,
+):
+    # Kingdoms one at a time, without end, for simulations and exports that
+    # shouldn't build a list. The pools and constraints are compiled once, and
+    # the first count kingdoms are the ones RandomizeDominionBatch returns for
+    # the same seed.
+    rng = _Random(seed)
+    pools, options = _Pools(setNames, options, collection)
+    weights = _Weights(pools, collection, constraints, None, weights)
+    balance = GetBalance(pools, options, constraints)
+    if weights is not None or balance is not None:
+        while True:
+            yield _ApplyRules(
+                pools,
+                options,
+                *_Draw(pools, options, rng, None, weights, balance),
+                rng,
+                structured=structured,
+                weights=weights,
+                balance=balance,
+            )
+    if constraints:
+        constraints = GetConstraints(pools, options, constraints)
+        while True:
+            yield _ApplyRules(
+                pools, options, *constraints.Draw(rng), rng, constraints, structured
+            )
+    for cards in _ShuffledCardsBatch(pools, None, rng):
+        yield _ApplyRules(
+            pools,
+            options,
+            *_DrawCards(pools, options, cards, rng),
+            rng,
+            structured=structured,
+        )
+
+
+def _MaxTables(pools):
+    catalog = LoadCatalog()
+    kingdoms = _PopCount(pools.kingdomMask)
+    witches = _PopCount(pools.kingdomMask & catalog.YoungWitchCards.mask)
+    mice = int(pools.mouseRule)
+    tables = 0
+    while 10 * (tables + 1) + min(tables + 1, witches) + mice <= kingdoms:
+        tables += 1
+    return tables
+
+
+def MaxTables(setNames=None, options=None, collection=None):
+    # Most tables RandomizeTables can always deal for the selection. Each
+    # table needs 10 Kingdom cards, plus a Bane where there's a Young Witch
+    # and a Mouse card at the table with Way of the Mouse.
+    return _MaxTables(_Pools(setNames, options, collection)[0])
+
+
+def _Deal(pile, position, count, takenMask):
+    # Up to count cards from pile[position:] that aren't taken, and the
+    # position after them
+    cards = []
+    while len(cards) < count and position < len(pile):
+        card = pile[position]
+        position += 1
+        if not card.mask & takenMask:
+            cards.append(card)
+    return cards, position
+
+
+def RandomizeTables(
+    setNames=None,
+    options=None,
+    tables=2,
+    seed=None,
+    collection=None,
+    structured=False,
+):
+    # Kingdoms for tables playing at the same time, with no Kingdom or
+    # landscape card at more than one table. One shuffle of the pool is dealt
+    # out table by table. Each table gets as many landscapes as a single
+    # kingdom would (fewer once they run out) and its own Alchemy, Young
+    # Witch and Mouse rules, which only add cards no other table has. A
+    # collection's weights don't apply: the deal is uniform. The balance
+    # options would need every table to meet them, so they raise ValueError.
+    catalog = LoadCatalog()
+    rng = _Random(seed)
+    pools, options = _Pools(setNames, options, collection)
+    if HasBalanceOptions(options):
+        raise ValueError("Tables can't be combined with balance options")
+    maxTables = _MaxTables(pools)
+    if not 1 <= tables <= maxTables:
+        raise ValueError(
+            "The selected sets have enough cards for 1 to {} tables".format(maxTables)
+        )
+
+    # The shuffled pool split into Kingdom cards, other landscapes and Ways,
+    # each still in random order
+    piles = ([], [], [])
+    for card in rng.sample(pools.complete, len(pools.complete)):
+        if card.mask & catalog.Ways.mask:
+            piles[2].append(card)
+        elif card.mask & catalog.LandscapeCards.mask:
+            piles[1].append(card)
         else:
-            landscapeList = random.sample(landscapeSet, len(landscapeSet))[:3]
-            landscapeList.extend(random.sample(waySet, len(waySet))[:1])
+            piles[0].append(card)
+    if pools.hasLandscapes:
+        # The same for every shuffle, and slow to work out for many landscapes
+        rows = LandscapeCountCache.Get(
+            tuple(len(pile) for pile in piles)
+            + (bool(options and options.get("limit-landscapes")),),
+            lambda key: list(_LandscapeCounts(*key)),
+        )
     else:
-        kingdomSet = completeSet
-        landscapeList = []
+        rows = [(0, 0, 1)]
+
+    kingdoms = []
+    takenMask = 0
+    positions = [0, 0, 0]
+    for _ in range(tables):
+        pick = rng.random()
+        for landscapes, ways, probability in rows:
+            pick -= probability
+            if pick < 0:
+                break
+
+        cards, positions[0] = _Deal(piles[0], positions[0], 10, takenMask)
+        if len(cards) < 10:
+            # Cards the Alchemy rule put back are behind the deal
+            cards += _Sample(
+                pools.kingdomMask & ~takenMask & ~_Mask(cards), 10 - len(cards), rng
+            )
+        landscapeList, positions[1] = _Deal(
+            piles[1], positions[1], landscapes, takenMask
+        )
+        wayList, positions[2] = _Deal(piles[2], positions[2], ways, takenMask)
+        landscapeList += wayList
 
-        resultSet = set(random.sample(kingdomSet, 10))
+        resultMask, baneCard, mouseCard = _RuleCards(
+            pools, options, _Mask(cards), landscapeList, rng, takenMask=takenMask
+        )
+        takenMask |= resultMask | _Mask(landscapeList)
+        if mouseCard is not None:
+            takenMask |= mouseCard.mask
+        kingdoms.append(
+            _FinalKingdom(
+                pools, resultMask, landscapeList, baneCard, mouseCard, rng, structured
+            )
+        )
+    return kingdoms
+
+
+def _ApplyRules(
+    pools,
+    options,
+    resultMask,
+    landscapeList,
+    rng,
+    constraints=None,
+    structured=False,
+    weights=None,
+    balance=None,
+):
+    resultMask, baneCard, mouseCard = _RuleCards(
+        pools,
+        options,
+        resultMask,
+        landscapeList,
+        rng,
+        constraints,
+        weights=weights,
+        balance=balance,
+    )
+    return _FinalKingdom(
+        pools, resultMask, landscapeList, baneCard, mouseCard, rng, structured
+    )
 
-    # Enforce Alchemy rule
-    if (options or {}).get("enforce-alchemy-rule", True):
-        alchemyCards = Alchemy.cards & resultSet
-        if len(alchemyCards) == 1:
+
+def _RuleCards(
+    pools,
+    options,
+    resultMask,
+    landscapeList,
+    rng,
+    constraints=None,
+    takenMask=0,
+    weights=None,
+    balance=None,
+):
+    # Applies the Alchemy, Young Witch and Mouse rules to a drawn kingdom and
+    # returns (resultMask, baneCard, mouseCard), with None for a Bane or Mouse
+    # that isn't needed. Cards in takenMask (at other tables) are never added,
+    # and with CardWeights every card picked here is weighted too.
+    catalog = LoadCatalog()
+    sample = _Sample if weights is None else weights.Sample
+    kingdomMask = pools.kingdomMask & ~takenMask
+
+    # Enforce Alchemy rule. KingdomConstraints already drew a kingdom that
+    # follows it.
+    if (
+        not constraints
+        and pools.alchemyRule
+        and (options or {}).get("enforce-alchemy-rule", True)
+    ):
+        alchemyMask = catalog.Alchemy.cards.mask & resultMask
+        alchemyCount = _PopCount(alchemyMask)
+        spareAlchemy = kingdomMask & catalog.Alchemy.cards.mask & ~alchemyMask
+        if alchemyCount == 1:
             # If there's only 1 Alchemy card, remove Alchemy from the options
             # and draw an addtional Kingdom card
-            resultSet -= alchemyCards
-            resultSet.update(random.sample(kingdomSet - resultSet, 1))
-        elif len(alchemyCards) == 2:
+            resultMask &= ~alchemyMask
+            resultMask |= _Mask(sample(kingdomMask & ~resultMask, 1, rng))
+        elif alchemyCount == 2 and spareAlchemy:
             # If there are only 2 Alchemy cards, pull an additional Alchemy
             # card and randomly remove one non-Alchemy card
-            alchemyCards.update(random.sample(Alchemy.cards - alchemyCards, 1))
-            resultSet = alchemyCards.union(random.sample(resultSet, 7))
+            alchemyMask |= _Mask(sample(spareAlchemy, 1, rng))
+            resultMask = alchemyMask | _Mask(sample(resultMask, 7, rng))
+        elif alchemyCount == 2:
+            # The other Alchemy cards are outside the collection or at other
+            # tables, so swap these two for other cards if there are any left
+            otherMask = kingdomMask & ~resultMask & ~catalog.Alchemy.cards.mask
+            if _PopCount(otherMask) >= 2:
+                resultMask &= ~alchemyMask
+                resultMask |= _Mask(sample(otherMask, 2, rng))
         # If there are 3 or more Alchemy cards, let it lie.
 
+        # The swaps can undo a balance guarantee. If they did, the cards
+        # besides the Alchemy ones are drawn again through the balance filter.
+        if (
+            balance is not None
+            and alchemyCount in (1, 2)
+            and not balance.Met(resultMask)
+        ):
+            resultMask = balance.Refill(
+                resultMask,
+                resultMask & catalog.Alchemy.cards.mask,
+                kingdomMask & ~catalog.Alchemy.cards.mask,
+                rng,
+            )
+
+    # Cards that the Bane and Mouse picks must avoid to keep within the
+    # constraints or the balance options
+    blockedMask = takenMask
+    if constraints:
+        blockedMask |= constraints.Blocked(resultMask | _Mask(landscapeList))
+    if balance is not None:
+        blockedMask |= balance.Blocked(resultMask)
+
     # Young Witch support
-    includeBane = resultSet & Cornucopia.cards("Young Witch")
-    if includeBane:
-        eligibleBanes = (kingdomSet & BaneCards) - resultSet
+    baneCard = None
+    if resultMask & catalog.YoungWitchCards.mask:
+        eligibleBanes = pools.baneMask & ~resultMask & ~blockedMask
         if not eligibleBanes:
             # All eligible Bane cards are already part of the randomized set!
             # Add a new card to the set and pull a Bane from the randomized
             # cards.
-            resultSet.update(random.sample(kingdomSet - resultSet, 1))
-            baneCard = random.sample(resultSet & BaneCards, 1)[0]
+            resultMask |= _Mask(
+                sample(kingdomMask & ~resultMask & ~blockedMask, 1, rng)
+            )
+            if resultMask & catalog.BaneCards.mask:
+                baneCard = sample(resultMask & catalog.BaneCards.mask, 1, rng)[0]
+            else:
+                # Every card that could be the Bane is at another table, so
+                # this table does without Young Witch
+                resultMask &= ~catalog.YoungWitchCards.mask
         else:
-            baneCard = random.sample(eligibleBanes, 1)[0]
-            resultSet.add(baneCard)
+            baneCard = sample(eligibleBanes, 1, rng)[0]
+            resultMask |= baneCard.mask
 
     # Get card for Way of the Mouse. This uses similar rules to Young Witch, so
     # select a card from the Bane Cards. The card chosen for Way of the Mouse
     # should not be used when determining most additional card rules.
-    includeMouse = Menagerie.cards("Way of the Mouse").intersection(landscapeList)
-    mouseSet = set()
-    if includeMouse:
-        eligibleMice = (kingdomSet & BaneCards) - resultSet
-        if not eligibleMice:
+    mouseCard = None
+    if catalog.MouseCards.mask & _Mask(landscapeList):
+        if constraints:
+            blockedMask = takenMask | constraints.Blocked(
+                resultMask | _Mask(landscapeList)
+            )
+        eligibleMice = pools.baneMask & ~resultMask & ~blockedMask
+        fromKingdom = not eligibleMice
+        if fromKingdom:
             # All eligible Mouse cards are already part of the randomized set!
             # (This is nearly impossible.) Get a Mouse from the randomized
             # cards, add a new card to the set, and remove the mouse from the
             # set.
-            eligibleMice = resultSet & BaneCards
-            if includeBane:
-                eligibleMice.remove(baneCard)
-
-            mouseCard = random.sample(eligibleMice, 1)[0]
-            resultSet.update(random.sample(kingdomSet - resultSet, 1))
-            resultSet.remove(mouseCard)
+            eligibleMice = resultMask & catalog.BaneCards.mask
+            if baneCard is not None:
+                eligibleMice &= ~baneCard.mask
+        if not eligibleMice:
+            # Every card that could be the Mouse is at another table, so this
+            # table does without Way of the Mouse
+            landscapeList[:] = [
+                card
+                for card in landscapeList
+                if not card.mask & catalog.MouseCards.mask
+            ]
+        elif fromKingdom:
+            mouseCard = sample(eligibleMice, 1, rng)[0]
+            resultMask |= _Mask(
+                sample(kingdomMask & ~resultMask & ~blockedMask, 1, rng)
+            )
+            resultMask &= ~mouseCard.mask
         else:
-            mouseCard = random.sample(eligibleMice, 1)[0]
-        mouseSet.add(mouseCard)
+            mouseCard = sample(eligibleMice, 1, rng)[0]
+    return resultMask, baneCard, mouseCard
+
+
+def _FinalKingdom(
+    pools, resultMask, landscapeList, baneCard, mouseCard, rng, structured=False
+):
+    # Works out the setup rules and formats the kingdom (see _ApplyRules)
+    catalog = LoadCatalog()
+    mouseMask = 0 if mouseCard is None else mouseCard.mask
+
+    # Setup rules. Each picked card is looked up once in the compiled index.
+    scopeMasks = (
+        (KingdomScope, resultMask),
+        (LandscapeScope, _Mask(landscapeList)),
+        (MouseScope, mouseMask),
+    )
+    ruleIndex = catalog.ruleIndex
+    rules = set()
+    for scope, mask in scopeMasks:
+        for card in _SparseMaskCards(mask & catalog.ruleTriggers[scope]):
+            for rule in ruleIndex.get(card.id, ()):
+                if rule.scopes & scope:
+                    rules.add(rule)
+    for rule in pools.sampledRules:
+        sampleMask = 0
+        for scope, mask in scopeMasks:
+            if rule.scopes & scope:
+                sampleMask |= mask
+        if rule.pool.mask & _Mask(_Sample(sampleMask, rule.sample, rng)):
+            rules.add(rule)
+
+    if structured:
+        return _Structured(resultMask, landscapeList, baneCard, mouseCard, rules)
 
-    fullResults = resultSet.union(landscapeList)
+    # Create final list
+    additionalCards = set()
+    additionalLandscapes = set()
+    for rule in rules:
+        additionalCards.update(rule.cards)
+        additionalLandscapes.update(rule.landscapes)
+    landscapeList.extend(additionalLandscapes)
 
-    # Check for Colonies and Platinums
-    includeColoniesAndPlatinum = Prosperity in sets and PlatinumLove.intersection(
-        random.sample(fullResults, 2)
-    )
+    # Create final card list
+    if baneCard is not None:
+        # Append Bane Card to end of list
+        resultMask &= ~baneCard.mask
+        finalResult = sorted(additionalCards.union(_MaskCards(resultMask)), key=str)
+        finalResult.append("Bane is {}".format(baneCard))
+    else:
+        finalResult = sorted(additionalCards.union(_MaskCards(resultMask)), key=str)
 
-    # Check for Potions
-    includePotions = Alchemy.potionCards & resultSet
+    # Add non-kingdom cards
+    finalResult.extend(sorted(landscapeList, key=str))
+    if mouseCard is not None:
+        finalResult.append("Mouse is {}".format(mouseCard))
+
+    return [str(card) for card in finalResult]
 
-    # Check for Prizes
-    includePrizes = Cornucopia.cards("Tournament") & resultSet
 
-    # Check for Shelters
-    includeShelters = DarkAges in sets and ShelterLove.intersection(
-        random.sample(fullResults, 2)
+def _Compositions(sizes, total):
+    # Every way to take total cards from groups of the given sizes
+    if not sizes:
+        if not total:
+            yield ()
+        return
+    for count in range(min(sizes[0], total) + 1):
+        for rest in _Compositions(sizes[1:], total - count):
+            yield (count,) + rest
+
+
+def _Add(distribution, key, probability):
+    distribution[key] = distribution.get(key, 0) + probability
+
+
+class KingdomProbabilities(object):
+    # Exact probabilities of what RandomizeDominion picks for a selection,
+    # worked out instead of sampled. The rules only look at a few things about
+    # a Kingdom card (in the pools, Alchemy, a possible Bane, Young Witch), so
+    # cards that agree on those are interchangeable: they form an atom, and
+    # the cards picked from an atom are a uniform subset of it. The Kingdom is
+    # then tracked as the number of cards from each atom through the draw, the
+    # Alchemy rule, the Bane and the Mouse, which takes a few hundred states.
+    # Every question is an exact expectation over those states: a card's
+    # chance is its atom's expected count over the atom's size, a setup rule
+    # fires unless the picked cards miss its pool (hypergeometric), and the
+    # rules that sample 2 or 1 of the picked cards need the mean and variance
+    # of how many picked cards are in their pool. The landscape row is
+    # independent of the Kingdom apart from Way of the Mouse and follows
+    # _LandscapeCounts.
+    def __init__(self, pools, options):
+        catalog = LoadCatalog()
+        options = options or {}
+        self.pools = pools
+        self.kingdomCount = _PopCount(pools.kingdomMask)
+        if self.kingdomCount < 10:
+            raise ValueError("The selected sets have fewer than 10 Kingdom cards")
+
+        alchemyMask = 0
+        if pools.alchemyRule and options.get("enforce-alchemy-rule", True):
+            alchemyMask = pools.kingdomMask & catalog.Alchemy.cards.mask
+        atoms = {}
+        for card in _MaskCards(pools.kingdomMask):
+            signature = (
+                bool(card.mask & alchemyMask),
+                bool(card.mask & catalog.BaneCards.mask),
+                bool(card.mask & catalog.YoungWitchCards.mask),
+            )
+            atoms[signature] = atoms.get(signature, 0) | card.mask
+        self.atoms = [mask for _, mask in sorted(atoms.items())]
+        self.sizes = [_PopCount(mask) for mask in self.atoms]
+        signatures = sorted(atoms)
+        self.everyAtom = list(range(len(self.atoms)))
+        self.alchemy = [index for index, key in enumerate(signatures) if key[0]]
+        self.banes = [index for index, key in enumerate(signatures) if key[1]]
+        self.youngWitches = [index for index, key in enumerate(signatures) if key[2]]
+
+        # States are (counts per atom, Bane atom, Mouse atom, whether the
+        # Mouse came from the Kingdom), with -1 for no Bane or Mouse
+        states = {}
+        draws = comb(self.kingdomCount, 10)
+        for counts in _Compositions(self.sizes, 10):
+            ways = 1
+            for size, count in zip(self.sizes, counts):
+                ways *= comb(size, count)
+            states[tuple(counts), -1, -1, False] = ways / draws
+        if alchemyMask:
+            states = self._AlchemyRule(states)
+        if pools.baneRule:
+            states = self._Bane(states)
+        self.states = states
+
+        # Landscape rows as (landscapes, ways, whether the Way is Way of the
+        # Mouse, probability)
+        landscapeMask = pools.completeMask & catalog.LandscapeCards.mask
+        self.wayMask = landscapeMask & catalog.Ways.mask
+        self.landscapeMask = landscapeMask & ~self.wayMask
+        self.mouseMask = pools.completeMask & catalog.MouseCards.mask
+        ways = _PopCount(self.wayMask)
+        self.rows = []
+        if not pools.hasLandscapes:
+            self.rows.append((0, 0, False, 1.0))
+        else:
+            for kept, keptWays, probability in _LandscapeCounts(
+                self.kingdomCount,
+                _PopCount(self.landscapeMask),
+                ways,
+                bool(options.get("limit-landscapes")),
+            ):
+                if keptWays and self.mouseMask:
+                    self.rows.append((kept, keptWays, True, probability / ways))
+                    probability *= (ways - 1) / ways
+                if probability:
+                    self.rows.append((kept, keptWays, False, probability))
+        self.mouseStates = {}
+        if any(mouse for _, _, mouse, _ in self.rows):
+            self.mouseStates = self._Mouse(states)
+
+    def _Free(self, counts, indexes):
+        # (atom, cards of it not picked yet) for the atoms in indexes
+        return [
+            (index, self.sizes[index] - counts[index])
+            for index in indexes
+            if self.sizes[index] > counts[index]
+        ]
+
+    def _AddOne(self, distribution, state, probability, indexes):
+        # Follow a uniform pick of one more card from indexes
+        counts, bane, mouse, fromKingdom = state
+        free = self._Free(counts, indexes)
+        total = sum(count for _, count in free)
+        if not total:
+            _Add(distribution, state, probability)
+        for index, count in free:
+            added = list(counts)
+            added[index] += 1
+            _Add(
+                distribution,
+                (tuple(added), bane, mouse, fromKingdom),
+                probability * count / total,
+            )
+
+    def _AlchemyRule(self, states):
+        result = {}
+        others = [
+            index for index in range(len(self.atoms)) if index not in self.alchemy
+        ]
+        for state, probability in states.items():
+            counts = state[0]
+            alchemyCount = sum(counts[index] for index in self.alchemy)
+            if alchemyCount == 1:
+                # The Alchemy card is put back and one Kingdom card drawn
+                removed = list(counts)
+                for index in self.alchemy:
+                    if removed[index]:
+                        removed[index] -= 1
+                self._AddOne(
+                    result, (tuple(removed),) + state[1:], probability, self.everyAtom
+                )
+            elif alchemyCount == 2 and not self._Free(counts, self.alchemy):
+                # No Alchemy card is left, so the two are swapped for two
+                # other cards if there are that many left
+                if sum(count for _, count in self._Free(counts, others)) < 2:
+                    _Add(result, state, probability)
+                    continue
+                removed = list(counts)
+                for index in self.alchemy:
+                    removed[index] = 0
+                added = {}
+                self._AddOne(added, (tuple(removed),) + state[1:], probability, others)
+                for addedState, addedProbability in added.items():
+                    self._AddOne(result, addedState, addedProbability, others)
+            elif alchemyCount == 2:
+                # One more Alchemy card, plus 7 of the 10 cards picked, which
+                # may include the first 2 Alchemy cards again
+                added = {}
+                self._AddOne(added, state, probability, self.alchemy)
+                for (addedCounts, *rest), addedProbability in added.items():
+                    for dropped in _Compositions(
+                        [counts[index] for index in others] + [2], 3
+                    ):
+                        keptCounts = list(addedCounts)
+                        weight = comb(2, dropped[-1])
+                        for index, count in zip(others, dropped):
+                            keptCounts[index] -= count
+                            weight *= comb(counts[index], count)
+                        _Add(
+                            result,
+                            (tuple(keptCounts), *rest),
+                            addedProbability * weight / 120,
+                        )
+            else:
+                _Add(result, state, probability)
+        return result
+
+    def _Bane(self, states):
+        result = {}
+        for state, probability in states.items():
+            counts, _, mouse, fromKingdom = state
+            if not any(counts[index] for index in self.youngWitches):
+                _Add(result, state, probability)
+                continue
+            free = self._Free(counts, self.banes)
+            total = sum(count for _, count in free)
+            for index, count in free:
+                added = list(counts)
+                added[index] += 1
+                _Add(
+                    result,
+                    (tuple(added), index, mouse, fromKingdom),
+                    probability * count / total,
+                )
+            if total:
+                continue
+            # Every Bane is already picked: one more Kingdom card, and the
+            # Bane is one of the picked cards
+            added = {}
+            self._AddOne(added, state, probability, self.everyAtom)
+            for (addedCounts, *rest), addedProbability in added.items():
+                banes = sum(addedCounts[index] for index in self.banes)
+                for index in self.banes:
+                    if addedCounts[index]:
+                        _Add(
+                            result,
+                            (addedCounts, index, mouse, fromKingdom),
+                            addedProbability * addedCounts[index] / banes,
+                        )
+        return result
+
+    def _Mouse(self, states):
+        result = {}
+        for state, probability in states.items():
+            counts, bane = state[:2]
+            free = self._Free(counts, self.banes)
+            total = sum(count for _, count in free)
+            for index, count in free:
+                _Add(result, (counts, bane, index, False), probability * count / total)
+            if total:
+                continue
+            # Every Bane is already picked: the Mouse comes out of the Kingdom
+            # and one more Kingdom card replaces it
+            picked = [
+                (index, counts[index] - (index == bane))
+                for index in self.banes
+                if counts[index] > (index == bane)
+            ]
+            mice = sum(count for _, count in picked)
+            for mouse, count in picked:
+                added = {}
+                self._AddOne(
+                    added,
+                    (counts, bane, mouse, True),
+                    probability * count / mice,
+                    self.everyAtom,
+                )
+                for (addedCounts, *rest), addedProbability in added.items():
+                    removed = list(addedCounts)
+                    removed[mouse] -= 1
+                    _Add(result, (tuple(removed), *rest), addedProbability)
+        return result
+
+    def _Mixture(self):
+        # (state, probability) over both kinds of row, each state's
+        # probability weighted by the chance of its kind of row
+        mouseRows = sum(p for _, _, mouse, p in self.rows if mouse)
+        for state, probability in self.states.items():
+            yield state, probability * (1 - mouseRows)
+        for state, probability in self.mouseStates.items():
+            yield state, probability * mouseRows
+
+    def _Hits(self, mask):
+        # Cards of mask in each atom
+        return [_PopCount(atom & mask) for atom in self.atoms]
+
+    def _Missed(self, counts, hits):
+        # Chance that a Kingdom with counts has no card of the hits
+        probability = 1.0
+        for size, count, hit in zip(self.sizes, counts, hits):
+            if hit and count:
+                probability *= comb(size - hit, count) / comb(size, count)
+        return probability
+
+    def _MouseMissed(self, state, kingdomHits, mouseHits, otherHits):
+        # Chance that the Mouse misses mouseHits, given that the Kingdom of
+        # state misses kingdomHits. otherHits are the Mouse cards outside
+        # kingdomMask, which may have been picked already.
+        counts, _, index, fromKingdom = state
+        size = self.sizes[index]
+        hits = mouseHits[index]
+        if fromKingdom:
+            # Nearly impossible, and only its cards' own share is used
+            return 1 - hits / size
+        allowed = size - kingdomHits[index]
+        if allowed:
+            hits -= counts[index] * otherHits[index] / allowed
+        return 1 - hits / (size - counts[index])
+
+    def _RowMissed(self, kept, keptWays, mouse, mask):
+        landscapes = _PopCount(self.landscapeMask)
+        hits = _PopCount(self.landscapeMask & mask)
+        probability = comb(landscapes - hits, kept) / comb(landscapes, kept)
+        if mouse:
+            probability *= not self.mouseMask & mask
+        elif keptWays:
+            ways = self.wayMask & ~self.mouseMask
+            hits = _PopCount(ways & mask)
+            probability *= 1 - hits / _PopCount(ways)
+        return probability
+
+    def _RuleMissed(self, kingdomMask, landscapeMask, mouseMask):
+        # Chance that no card of the masks is picked in its scope
+        rows = [0.0, 0.0]
+        for kept, keptWays, mouse, probability in self.rows:
+            rows[mouse] += probability * self._RowMissed(
+                kept, keptWays, mouse, landscapeMask
+            )
+        kingdomHits = self._Hits(kingdomMask)
+        missed = rows[0] * sum(
+            probability * self._Missed(state[0], kingdomHits)
+            for state, probability in self.states.items()
+        )
+        if rows[1]:
+            mouseHits = self._Hits(mouseMask)
+            otherHits = self._Hits(mouseMask & ~kingdomMask)
+            missed += rows[1] * sum(
+                probability
+                * self._Missed(state[0], kingdomHits)
+                * self._MouseMissed(state, kingdomHits, mouseHits, otherHits)
+                for state, probability in self.mouseStates.items()
+            )
+        return missed
+
+    def _SampleMissed(self, rule):
+        # Chance that none of rule.sample cards drawn from the Kingdom and the
+        # landscapes is in rule.pool. Given the counts, the number of hits is
+        # a sum of independent hypergeometrics, and for samples of 1 or 2
+        # cards its mean and variance are all that matter.
+        if rule.sample > 2:
+            raise ValueError("Only samples of 1 or 2 cards can be worked out")
+        mask = rule.pool.mask
+        rows = []
+        for kept, keptWays, mouse, probability in self.rows:
+            if not rule.scopes & LandscapeScope:
+                rows.append((0, 0.0, 0.0, mouse, probability))
+                continue
+            mean, variance = _Hypergeometric(
+                _PopCount(self.landscapeMask),
+                _PopCount(self.landscapeMask & mask),
+                kept,
+            )
+            if mouse:
+                mean += bool(self.mouseMask & mask)
+            else:
+                ways = self.wayMask & ~self.mouseMask
+                wayMean, wayVariance = _Hypergeometric(
+                    _PopCount(ways), _PopCount(ways & mask), keptWays
+                )
+                mean += wayMean
+                variance += wayVariance
+            rows.append((kept + keptWays, mean, variance, mouse, probability))
+
+        hits = self._Hits(mask)
+        missed = 0.0
+        for mouse, states in ((False, self.states), (True, self.mouseStates)):
+            stateRows = [row for row in rows if row[3] == mouse]
+            if not stateRows:
+                continue
+            for (counts, *_), probability in states.items():
+                size = sum(counts)
+                mean = variance = 0.0
+                for atomSize, count, hit in zip(self.sizes, counts, hits):
+                    if count and hit:
+                        atomMean, atomVariance = _Hypergeometric(atomSize, hit, count)
+                        mean += atomMean
+                        variance += atomVariance
+                for kept, rowMean, rowVariance, _, rowProbability in stateRows:
+                    total = size + kept
+                    left = total - mean - rowMean
+                    if rule.sample == 1:
+                        chance = left / total
+                    else:
+                        # E[C(total - hits, 2)] / C(total, 2)
+                        chance = (variance + rowVariance + left * left - left) / (
+                            total * (total - 1)
+                        )
+                    missed += probability * rowProbability * chance
+        return missed
+
+    def Probabilities(self):
+        catalog = LoadCatalog()
+        kingdom = [0.0] * len(self.atoms)
+        banes = [0.0] * len(self.atoms)
+        mice = [0.0] * len(self.atoms)
+        for (counts, bane, mouse, _), probability in self._Mixture():
+            for index, count in enumerate(counts):
+                kingdom[index] += probability * count
+            if bane >= 0:
+                kingdom[bane] -= probability
+                banes[bane] += probability
+            if mouse >= 0:
+                mice[mouse] += probability
+
+        def ByCard(expected):
+            result = {}
+            for index, value in enumerate(expected):
+                if value > 0:
+                    for card in _MaskCards(self.atoms[index]):
+                        result[str(card)] = value / self.sizes[index]
+            return result
+
+        landscapes = {}
+        rowSizes = {}
+        keptLandscapes = sum(kept * p for kept, _, _, p in self.rows)
+        keptWays = sum(ways * p for _, ways, _, p in self.rows)
+        for mask, expected in (
+            (self.landscapeMask, keptLandscapes),
+            (self.wayMask, keptWays),
+        ):
+            for card in _MaskCards(mask):
+                landscapes[str(card)] = expected / _PopCount(mask)
+        for kept, ways, _, probability in self.rows:
+            rowSizes[kept + ways] = rowSizes.get(kept + ways, 0) + probability
+
+        # Setup components, such as Potions or the Boons deck, fire when any
+        # of the rules that add them does
+        components = {}
+        for rule in catalog.SetupRules:
+            if rule.sample and rule not in self.pools.sampledRules:
+                continue
+            for name in rule.cards + rule.landscapes:
+                components.setdefault(name, []).append(rule)
+        # Only cards that can be picked in a scope matter there, and leaving
+        # out rules that can't fire keeps rounding from giving them a chance
+        scopes = (
+            (KingdomScope, self.pools.kingdomMask),
+            (LandscapeScope, self.landscapeMask | self.wayMask),
+            (MouseScope, self.pools.baneMask if self.mouseStates else 0),
+        )
+        setup = {}
+        for name, rules in components.items():
+            masks = [0, 0, 0]
+            missed = 1.0
+            for rule in rules:
+                if rule.sample:
+                    # No component comes from both kinds of rule; if one did,
+                    # they would be taken as independent here
+                    if rule.pool.mask & (scopes[0][1] | scopes[1][1]):
+                        missed *= self._SampleMissed(rule)
+                    continue
+                for position, (scope, mask) in enumerate(scopes):
+                    if rule.scopes & scope:
+                        masks[position] |= rule.pool.mask & mask
+            if any(masks):
+                missed *= self._RuleMissed(*masks)
+            if missed < 1:
+                setup[name] = 1 - missed
+
+        return {
+            "kingdom": ByCard(kingdom),
+            "bane": ByCard(banes),
+            "mouse": ByCard(mice),
+            "landscapes": landscapes,
+            "landscapeCounts": {
+                str(size): probability for size, probability in sorted(rowSizes.items())
+            },
+            "setup": setup,
+        }
+
+
+def _Hypergeometric(size, hits, count):
+    # Mean and variance of how many of count cards drawn from size cards are
+    # among the hits
+    if not count or not size:
+        return 0.0, 0.0
+    share = hits / size
+    variance = 0.0
+    if size > 1:
+        variance = count * share * (1 - share) * (size - count) / (size - 1)
+    return count * share, variance
+
+
+def GetProbabilities(setNames=None, options=None, collection=None):
+    # Exact chances of each card, landscape and setup component for a
+    # selection, e.g. {"kingdom": {"Base: Chapel": 0.0385, ...}, "setup":
+    # {"Alchemy: Potions": 0.31, ...}, ...}. Raises ValueError when there are
+    # too few Kingdom cards, or for balance options, which the model doesn't
+    # cover.
+    pools, options = _Pools(setNames, options, collection)
+    if HasBalanceOptions(options):
+        raise ValueError("Probabilities can't be worked out with balance options")
+    key = (
+        pools.key,
+        bool((options or {}).get("limit-landscapes")),
+        bool((options or {}).get("enforce-alchemy-rule", True)),
     )
-    # Check for Ruins
-    includeRuins = LooterCards & resultSet
-    # Check for Madman
-    includeMadman = DarkAges.cards("Hermit") & resultSet
-    # Check for Mercenary
-    includeMercenary = DarkAges.cards("Urchin") & resultSet
-    # Check for Spoils
-    includeSpoils = SpoilsCards & resultSet
-
-    # Check for special Nocturne cards
-    includeGhost = resultSet & Nocturne.cards(
-        "Cemetary + Haunted Mirror (Heirloom)", "Exorcist"
+    return ProbabilityCache.Get(
+        key, lambda key: KingdomProbabilities(pools, options).Probabilities()
     )
 
-    includeBoons = BoonCards & (resultSet | mouseSet)
-
-    includeHexes = HexCards & (resultSet | mouseSet)
 
-    includeWisp = includeBoons or (Nocturne.cards("Exorcist") & resultSet)
+# Share codes: a kingdom as a short base64url string that decodes straight
+# back into the formatted list. Every card, landscape and setup component has
+# a share ID, its line in shareids.txt. The file is append-only (new catalog
+# entries get new lines from --build-snapshot), so old codes keep decoding
+# after the catalog grows. A code is a list of varints: the format version,
+# flags for a Bane and a Mouse, their IDs, the number of Kingdom-side entries,
+# then the Kingdom-side and landscape-side IDs, each sorted and stored as
+# differences.
+ShareIdsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shareids.txt")
+ShareCodeVersion = 1
+
+_shareIds = None
+
+
+def _ShareNames():
+    # Every string a formatted kingdom can contain, besides "Bane is" and
+    # "Mouse is", in catalog order
+    catalog = LoadCatalog()
+    names = [str(card) for card in AllCards]
+    for rule in catalog.SetupRules:
+        names.extend(rule.cards + rule.landscapes)
+    return list(dict.fromkeys(names))
+
+
+def _ShareIds():
+    # (names by share ID, share ID by name, landscape-side names, share ID by
+    # card id)
+    global _shareIds
+    if _shareIds is None:
+        catalog = LoadCatalog()
+        with open(ShareIdsPath, encoding="utf-8") as shareIdsFile:
+            names = shareIdsFile.read().splitlines()
+        shareIds = {name: index for index, name in enumerate(names)}
+        landscapes = {str(card) for card in catalog.LandscapeCards}
+        for rule in catalog.SetupRules:
+            landscapes.update(rule.landscapes)
+        _shareIds = (
+            names,
+            shareIds,
+            landscapes,
+            [shareIds.get(str(card)) for card in AllCards],
+        )
+    return _shareIds
+
+
+def GetShareDictionary():
+    # What the share IDs in structured results stand for, for clients to
+    # cache: entries[shareId] is [name, index in sets or None, whether it is
+    # listed with the landscapes]. Entries are only ever added.
+    names, _, landscapes, _ = _ShareIds()
+    LoadCatalog()
+    setNames = sorted(AllSets)
+    setIndexes = {name: index for index, name in enumerate(setNames)}
+    cardSets = {str(card): card.set.name for card in AllCards}
+    return {
+        "sets": setNames,
+        "entries": [
+            [name, setIndexes.get(cardSets.get(name)), name in landscapes]
+            for name in names
+        ],
+    }
+
+
+def BuildShareIds(path=None):
+    # Build step: give share IDs to catalog entries that don't have one yet
+    global _shareIds
+    path = path or ShareIdsPath
+    try:
+        with open(path, encoding="utf-8") as shareIdsFile:
+            known = set(shareIdsFile.read().splitlines())
+    except FileNotFoundError:
+        known = set()
+    added = [name for name in _ShareNames() if name not in known]
+    with open(path, "a", encoding="utf-8") as shareIdsFile:
+        shareIdsFile.writelines(name + "\n" for name in added)
+    _shareIds = None
+    return added
+
+
+def _Varints(values):
+    data = bytearray()
+    for value in values:
+        while value > 0x7F:
+            data.append(value & 0x7F | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def _ReadVarints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("Truncated share code")
+    return values
+
+
+def _Differences(ids):
+    ids = sorted(ids)
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])] if ids else []
+
+
+def ShareCode(kingdom):
+    # Code for a kingdom as returned by RandomizeDominion
+    _, shareIds, landscapeNames, _ = _ShareIds()
+    bane = mouse = None
+    cards = []
+    landscapes = []
+    try:
+        for name in kingdom:
+            if name.startswith("Bane is "):
+                bane = shareIds[name[8:]]
+            elif name.startswith("Mouse is "):
+                mouse = shareIds[name[9:]]
+            elif name in landscapeNames:
+                landscapes.append(shareIds[name])
+            else:
+                cards.append(shareIds[name])
+    except KeyError as error:
+        raise ValueError(
+            "No share ID for {} (rebuild with --build-snapshot)".format(error.args[0])
+        )
 
-    includeBat = Nocturne.cards("Vampire") & resultSet
+    return _EncodeShareCode(cards, landscapes, bane, mouse)
+
+
+def _EncodeShareCode(cards, landscapes, bane, mouse):
+    values = [ShareCodeVersion, (bane is not None) | (mouse is not None) << 1]
+    values.extend(value for value in (bane, mouse) if value is not None)
+    values.append(len(cards))
+    values.extend(_Differences(cards))
+    values.extend(_Differences(landscapes))
+    return base64.urlsafe_b64encode(_Varints(values)).rstrip(b"=").decode()
+
+
+def _Structured(resultMask, landscapeList, baneCard, mouseCard, rules):
+    # The structured form of a kingdom: share IDs grouped by what they are,
+    # and the share code
+    _, shareIds, _, cardIds = _ShareIds()
+    setupCards = {shareIds[name] for rule in rules for name in rule.cards}
+    setupLandscapes = {shareIds[name] for rule in rules for name in rule.landscapes}
+    if baneCard is not None:
+        resultMask &= ~baneCard.mask
+    kingdom = [cardIds[card.id] for card in _SparseMaskCards(resultMask)]
+    landscapes = sorted(cardIds[card.id] for card in landscapeList)
+    bane = None if baneCard is None else cardIds[baneCard.id]
+    mouse = None if mouseCard is None else cardIds[mouseCard.id]
+    return {
+        "kingdom": sorted(kingdom),
+        "landscapes": landscapes,
+        "bane": bane,
+        "mouse": mouse,
+        "setup": sorted(setupCards | setupLandscapes),
+        "code": _EncodeShareCode(
+            list(setupCards.union(kingdom)),
+            list(setupLandscapes.union(landscapes)),
+            bane,
+            mouse,
+        ),
+    }
+
+
+def DecodeShareCode(code):
+    # The formatted kingdom for a share code, without randomizing anything.
+    # Raises ValueError for codes that aren't valid.
+    names = _ShareIds()[0]
+    if not isinstance(code, str):
+        raise ValueError("A share code must be a string")
+    try:
+        values = _ReadVarints(base64.urlsafe_b64decode(code + "=" * (-len(code) % 4)))
+    except ValueError:
+        raise ValueError("Malformed share code")
+    if not values or values[0] != ShareCodeVersion:
+        raise ValueError("Unsupported share code version")
+
+    try:
+        flags = values[1]
+        position = 2
+        bane = mouse = None
+        if flags & 1:
+            bane = values[position]
+            position += 1
+        if flags & 2:
+            mouse = values[position]
+            position += 1
+        count = values[position]
+    except IndexError:
+        raise ValueError("Truncated share code")
+    cards = values[position + 1 : position + 1 + count]
+    landscapes = values[position + 1 + count :]
+    if len(cards) < count:
+        raise ValueError("Truncated share code")
+
+    def Name(shareId):
+        if shareId >= len(names):
+            raise ValueError("Unknown entry in share code")
+        return names[shareId]
+
+    def Names(differences):
+        return sorted(Name(shareId) for shareId in accumulate(differences))
+
+    result = Names(cards)
+    if bane is not None:
+        result.append("Bane is {}".format(Name(bane)))
+    result.extend(Names(landscapes))
+    if mouse is not None:
+        result.append("Mouse is {}".format(Name(mouse)))
+    return result
+
+
+def _GenerateChunk(args):
+    return RandomizeDominionBatch(*args)
+
+
+def _Chunks(
+    setNames,
+    options,
+    count,
+    seed,
+    chunkSize,
+    constraints,
+    collection,
+    structured,
+    weights=None,
+):
+    # Arguments for _GenerateChunk, one tuple per chunk of chunkSize kingdoms
+    for index, start in enumerate(_Starts(count, chunkSize)):
+        yield (
+            setNames,
+            options,
+            chunkSize if count is None else min(chunkSize, count - start),
+            "{}/{}".format(seed, index),
+            constraints,
+            collection,
+            structured,
+            None,
+            weights,
+        )
 
-    includeImp = resultSet & Nocturne.cards("Devil's Workshop", "Exorcist", "Tormentor")
 
-    includeWish = resultSet & Nocturne.cards(
-        "Leprechaun", "Secret Cave + Magic Lamp (Heirloom)"
+def GenerateKingdoms(
+    setNames=None,
+    options=None,
+    count=1,
+    seed=None,
+    workers=None,
+    chunkSize=1000,
+    constraints=None,
+    collection=None,
+    structured=False,
+    weights=None,
+):
+    # Generate many kingdoms across a process pool, yielding them in order.
+    # Work is split into chunks of chunkSize kingdoms and each chunk gets its
+    # own random stream derived from the master seed, so the output only
+    # depends on (seed, chunkSize) and not on the number of workers. With
+    # count None there is no end; memory stays flat either way.
+    if seed is None:
+        seed = NewSeed()
+    chunks = _Chunks(
+        setNames,
+        options,
+        count,
+        seed,
+        chunkSize,
+        constraints,
+        collection,
+        structured,
+        weights,
     )
 
-    # Check for Horses
-    includeHorse = HorseCards & (fullResults | mouseSet)
-
-    # Check for Boulder traps
-    includeBoulderTraps = Antiquities in sets and TrapLove.intersection(
-        random.sample(fullResults, 1)
+    if workers == 1:
+        for chunk in chunks:
+            for kingdom in _GenerateChunk(chunk):
+                yield kingdom
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        # Keep a bounded number of chunks in flight so memory stays flat
+        # however many kingdoms are asked for
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_GenerateChunk, chunk))
+            if len(pending) > 2 * workers:
+                for kingdom in pending.popleft().result():
+                    yield kingdom
+        while pending:
+            for kingdom in pending.popleft().result():
+                yield kingdom
+
+
+def _ParseOption(value):
+    name, _, setting = value.partition("=")
+    return name, setting.lower() not in ("0", "false", "no", "off")
+
+
+def _Main():
+    import argparse
+    import sys
+
+    LoadCatalog()
+    parser = argparse.ArgumentParser(description="Randomize a Dominion kingdom")
+    parser.add_argument("--sets", nargs="+", metavar="SET", choices=list(AllSets))
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        type=_ParseOption,
+        metavar="NAME[=false]",
+        help="e.g. base-first-edition or enforce-alchemy-rule=false",
     )
-
-    # Create final list
-    additionalCards = set()
-
-    if includePotions:
-        additionalCards.add("Alchemy: Potions")
-    if includeShelters:
-        additionalCards.add("Dark Ages: Shelters")
-    if includeRuins:
-        additionalCards.add("Dark Ages: Ruins")
-    if includeColoniesAndPlatinum:
-        additionalCards.update(("Prosperity: Colony", "Prosperity: Platinum"))
-    if includeBoulderTraps:
-        # Technically this is not a landscape card, but it is set up
-        # differently than other Kingdom cards
-        landscapeList.append("(Antiquities Trap): Boulder Traps")
-    if includeMadman:
-        additionalCards.add("Dark Ages: Madman")
-    if includeMercenary:
-        additionalCards.add("Dark Ages: Mercenary")
-    if includeSpoils:
-        additionalCards.add("Dark Ages: Spoils")
-    if includePrizes:
-        additionalCards.update(
-            (
-                "Cornucopia: Bag of Gold",
-                "Cornucopia: Diadem",
-                "Cornucopia: Followers",
-                "Cornucopia: Princess",
-                "Cornucopia: Trusty Steed",
+    parser.add_argument(
+        "--constraint",
+        action="append",
+        type=json.loads,
+        metavar="JSON",
+        help='e.g. {"set": "Antiquities", "min": 2} or {"card": "Chapel"}',
+    )
+    parser.add_argument(
+        "--profile", metavar="ID", help="stored collection to use instead of --sets"
+    )
+    parser.add_argument(
+        "--history",
+        metavar="GROUP",
+        help="make the cards this game group played recently less likely",
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="record the kingdom as played by the --history group",
+    )
+    parser.add_argument(
+        "--weights",
+        type=json.loads,
+        metavar="JSON",
+        help='e.g. {"sets": {"Antiquities": 2}, "cards": {"Alchemy: Possession": 0.1}}',
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        metavar="N",
+        help="draw this many kingdoms and print the one with the best synergy "
+        "score (see synergy.txt)",
+    )
+    parser.add_argument("--seed")
+    parser.add_argument(
+        "--count", type=int, default=1, help="kingdoms to generate (0 for no end)"
+    )
+    parser.add_argument(
+        "--tables",
+        type=int,
+        help="kingdoms for this many tables at once, with no card at two tables "
+        "(0 prints the most the selection allows)",
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="write each kingdom as a line of JSON as soon as it is generated",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes to generate with (default: one per CPU when --count > 1)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument(
+        "--build-snapshot",
+        action="store_true",
+        help="compile catalog.py into catalog.snapshot, give new cards share IDs "
+        "and exit",
+    )
+    parser.add_argument(
+        "--decode", metavar="CODE", help="print the kingdom for a share code and exit"
+    )
+    args = parser.parse_args()
+
+    if args.build_snapshot:
+        BuildSnapshot()
+        BuildShareIds()
+        return
+    if args.decode:
+        try:
+            print("\n".join(DecodeShareCode(args.decode)))
+        except ValueError as error:
+            parser.error(str(error))
+        return
+
+    options = dict(args.option)
+    collection = None
+    if args.profile:
+        import profiles
+
+        try:
+            collection = profiles.LoadProfile(args.profile)
+        except (KeyError, ValueError) as error:
+            parser.error(error.args[0])
+    if args.constraint:
+        # Report unsatisfiable constraints before starting any workers
+        try:
+            GetConstraints(*_Pools(args.sets, options, collection), args.constraint)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.count < 0:
+        parser.error("--count must be 0 or more")
+    if args.weights is not None:
+        if args.constraint:
+            parser.error("--weights can't be combined with --constraint")
+        try:
+            _ParseWeights(args.weights)
+        except ValueError as error:
+            parser.error(str(error))
+    history = None
+    if args.history:
+        import history as playHistory
+
+        if args.constraint:
+            parser.error("--history can't be combined with --constraint")
+        if args.record and args.count != 1:
+            parser.error("--record needs a single kingdom")
+        try:
+            history = playHistory.LoadHistory(args.history)
+        except (ValueError, playHistory.StoreError) as error:
+            parser.error(str(error))
+    elif args.record:
+        parser.error("--record needs --history")
+    if args.candidates is not None:
+        if args.candidates < 1:
+            parser.error("--candidates must be 1 or more")
+        if args.count != 1 or args.tables is not None:
+            parser.error("--candidates needs a single kingdom")
+    if args.tables == 0:
+        print(MaxTables(args.sets, options, collection))
+        return
+    if args.tables is not None:
+        if args.constraint or history is not None or args.weights is not None:
+            parser.error(
+                "--tables can't be combined with --constraint, --history or --weights"
             )
-        )
-    if includeGhost:
-        additionalCards.add("Nocturne: Ghost")
-    if includeBoons:
-        landscapeList.append("(Nocturne: Boons Deck)")
-    if includeHexes:
-        landscapeList.append("(Nocturne: Hexes Deck)")
-    if includeWisp:
-        additionalCards.add("Nocturne: Will-o'-wisp")
-    if includeBat:
-        additionalCards.add("Nocturne: Bat")
-    if includeImp:
-        additionalCards.add("Nocturne: Imp")
-    if includeWish:
-        additionalCards.add("Nocturne: Wish")
-    if includeHorse:
-        additionalCards.add("Menagerie: Horse")
-
-    # Create final card list
-    if includeBane:
-        # Append Bane Card to end of list
-        resultSet.remove(baneCard)
-        finalResult = sorted(resultSet | additionalCards)
-        finalResult.append("Bane is {}".format(baneCard))
+        try:
+            kingdoms = RandomizeTables(
+                args.sets, options, args.tables, args.seed, collection
+            )
+        except ValueError as error:
+            parser.error(str(error))
+    elif history is not None:
+        if not args.count:
+            parser.error("--history needs a --count")
+        if args.candidates is not None:
+            kingdoms = [
+                RandomizeDominion(
+                    args.sets,
+                    options,
+                    args.seed,
+                    None,
+                    collection,
+                    history=history,
+                    weights=args.weights,
+                    candidates=args.candidates,
+                )
+            ]
+        else:
+            kingdoms = RandomizeDominionBatch(
+                args.sets,
+                options,
+                args.count,
+                args.seed,
+                None,
+                collection,
+                history=history,
+                weights=args.weights,
+            )
+        if args.record:
+            try:
+                playHistory.RecordPlay(args.history, kingdoms[0])
+            except playHistory.StoreError as error:
+                parser.error(str(error))
+    elif args.count == 1 and (args.workers is None or args.candidates is not None):
+        kingdoms = [
+            RandomizeDominion(
+                args.sets,
+                options,
+                args.seed,
+                args.constraint,
+                collection,
+                weights=args.weights,
+                candidates=args.candidates,
+            )
+        ]
     else:
-        finalResult = sorted(resultSet | additionalCards)
-
-    # Add non-kingdom cards
-    finalResult.extend(sorted(landscapeList))
-    if includeMouse:
-        finalResult.append("Mouse is {}".format(mouseCard))
-
-    return [str(card) for card in finalResult]
+        kingdoms = GenerateKingdoms(
+            args.sets,
+            options,
+            args.count or None,
+            args.seed,
+            args.workers,
+            args.chunk_size,
+            args.constraint,
+            collection,
+            weights=args.weights,
+        )
+    try:
+        for index, kingdom in enumerate(kingdoms):
+            if args.ndjson:
+                sys.stdout.write(json.dumps(kingdom) + "\n")
+                continue
+            if index:
+                print()
+            print("\n".join(kingdom))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader stopped early, as with | head. Python would complain
+        # about the pipe again when flushing at exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 
 if __name__ == "__main__":
-    print("\n".join(RandomizeDominion()))
+    # Run through the importable module so catalog.py, which imports
+    # randomizer, and worker processes share it with this script
+    import randomizer
+
+    randomizer._Main()
@@ -0,0 +1,465 @@
+# Self-hosted HTTP server with the same JSON contract as lambda_handler, for
+# running in a container behind a load balancer instead of on Lambda:
+#
+#   python3 server.py --port 8080 --processes 4
+#
+# Each request is turned into a Lambda proxy event and answered by
+# lambda_handler, so both entry points share validation, headers (CORS, ETag)
+# and logging. Requests that draw more than InlineCount kingdoms (batches,
+# tables and best-of-N candidates) and probability requests run in a process
+# pool so the event loop keeps answering. SIGTERM
+# or SIGINT stops accepting connections, lets requests in flight finish (up to
+# ShutdownTimeout seconds) and closes idle keep-alive connections.
+#
+# POST .../stream takes the same body as POST, apart from history, candidates
+# and tables, but streams the kingdoms as newline-delimited JSON, without end
+# when there is no "count". Chunks of
+# StreamChunkSize kingdoms are generated in the pool one ahead of the one
+# being sent, so memory stays flat and a slow reader slows generation down.
+# The kingdoms are the ones randomizer.py --count N --ndjson prints for the
+# same seed.
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+import lambda_handler
+import randomizer
+from profiles import LoadProfile
+
+# Requests that draw up to this many kingdoms are cheap enough to answer on
+# the loop
+InlineCount = int(os.environ.get("RANDOMIZER_INLINE_COUNT", 10))
+
+MaxBodySize = int(os.environ.get("RANDOMIZER_MAX_BODY_SIZE", 1 << 20))
+KeepAliveTimeout = float(os.environ.get("RANDOMIZER_KEEP_ALIVE_TIMEOUT", 5))
+ShutdownTimeout = float(os.environ.get("RANDOMIZER_SHUTDOWN_TIMEOUT", 10))
+StreamChunkSize = int(os.environ.get("RANDOMIZER_STREAM_CHUNK_SIZE", 1000))
+
+Methods = ("GET", "POST", "OPTIONS")
+
+# POST fields that only single responses support
+StreamUnsupported = ("history", "candidates", "tables")
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _Event(method, path, headers, body):
+    return {
+        "httpMethod": method,
+        "path": path,
+        "headers": headers,
+        "body": body,
+        "requestContext": {"httpMethod": method, "requestId": uuid.uuid4().hex},
+    }
+
+
+def _Heavy(event):
+    # Whether answering event may take long enough to hold up other requests
+    if event["httpMethod"] != "POST":
+        return False
+    if event["path"].rstrip("/").endswith("/probabilities"):
+        return True
+    body = lambda_handler.JsonBody(event)
+    if body is None:
+        return False
+    # Each kingdom in a batch, each table and each candidate costs about a
+    # kingdom to draw
+    for field in ("count", "tables", "candidates"):
+        value = body.get(field)
+        if isinstance(value, int) and value > InlineCount:
+            return True
+    return False
+
+
+def _InternalError():
+    # lambda_handler answers every bad request itself, so anything it raises
+    # is a bug. It is logged and answered with a 500, as on Lambda.
+    traceback.print_exc()
+    return {
+        "statusCode": 500,
+        "headers": dict(lambda_handler.Headers),
+        "body": json.dumps({"error": "Internal server error"}),
+    }
+
+
+def _Handle(event):
+    try:
+        return lambda_handler.lambda_handler(event, None)
+    except Exception:
+        return _InternalError()
+
+
+def _Head(status, headers, keepAlive):
+    lines = ["HTTP/1.1 {} {}".format(status, HTTPStatus(status).phrase)]
+    for name, value in headers.items():
+        lines.append("{}: {}".format(name, value))
+    lines.append("Connection: {}".format("keep-alive" if keepAlive else "close"))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _Response(status, headers, body, keepAlive):
+    body = (body or "").encode()
+    return (
+        _Head(status, dict(headers, **{"Content-Length": len(body)}), keepAlive) + body
+    )
+
+
+def _StreamChunks(body):
+    # (seed, structured, chunks for randomizer._GenerateChunk) for a POST
+    # .../stream body
+    body = lambda_handler.JsonBody({"body": body})
+    if body is None:
+        raise HttpError(400, "The body must be a JSON object")
+    sets = body.get("sets") or None
+    options = body.get("options")
+    count = body.get("count")
+    constraints = body.get("constraints")
+    profile = body.get("profile")
+    weights = body.get("weights")
+    responseFormat = body.get("format", "strings")
+    seed = body.get("seed")
+    if seed is None:
+        seed = randomizer.NewSeed()
+
+    error = lambda_handler.InvalidRequest(
+        seed, responseFormat, constraints, count, None
+    ) or lambda_handler.InvalidSelection(sets, options)
+    if error:
+        raise HttpError(400, error)
+    # Rather than streaming kingdoms that ignore them
+    unsupported = [field for field in StreamUnsupported if body.get(field) is not None]
+    if unsupported:
+        raise HttpError(400, "Streams don't support {}".format(", ".join(unsupported)))
+    try:
+        collection = None if profile is None else LoadProfile(profile)
+    except KeyError as error:
+        raise HttpError(404, error.args[0])
+    except ValueError as error:
+        raise HttpError(400, str(error))
+    structured = responseFormat == "structured"
+    chunks = randomizer._Chunks(
+        sets,
+        options,
+        count,
+        seed,
+        StreamChunkSize,
+        constraints,
+        collection,
+        structured,
+        weights,
+    )
+    return seed, structured, chunks
+
+
+def _StreamChunk(chunk, structured):
+    # One chunk of kingdoms as NDJSON, serialized in the worker. Structured
+    # kingdoms are compact, as in POST responses.
+    separators = (",", ":") if structured else None
+    return "".join(
+        json.dumps(kingdom, separators=separators) + "\n"
+        for kingdom in randomizer._GenerateChunk(chunk)
+    ).encode()
+
+
+async def _ReadRequest(reader):
+    # (method, path, headers, body, keepAlive), or None when the client closed
+    # the connection between requests
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    if not version.startswith("HTTP/1."):
+        raise HttpError(505, "Only HTTP/1.x is supported")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n"):
+            break
+        if not line:
+            return None
+        name, separator, value = line.decode("latin-1").partition(":")
+        if not separator:
+            raise HttpError(400, "Malformed header")
+        headers[name.strip()] = value.strip()
+    lowerHeaders = {name.lower(): value for name, value in headers.items()}
+
+    if "chunked" in lowerHeaders.get("transfer-encoding", "").lower():
+        raise HttpError(411, "Send a Content-Length instead of chunks")
+    try:
+        length = int(lowerHeaders.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Malformed Content-Length")
+    if length > MaxBodySize:
+        raise HttpError(413, "The body is larger than {} bytes".format(MaxBodySize))
+    body = (await reader.readexactly(length)).decode() if length else None
+
+    connection = lowerHeaders.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        keepAlive = connection == "keep-alive"
+    else:
+        keepAlive = connection != "close"
+    return method, target.partition("?")[0], headers, body, keepAlive
+
+
+class Server(object):
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.executor = None
+        self.connections = {}
+        self.closing = False
+
+    def _Executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers or os.cpu_count() or 1)
+        return self.executor
+
+    async def _Answer(self, event):
+        if _Heavy(event) and self.workers != 0:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._Executor(), _Handle, event)
+        return _Handle(event)
+
+    async def _Stream(self, writer, body, keepAlive):
+        # Answers POST .../stream with chunked transfer encoding. Returns
+        # whether the connection can be kept alive.
+        loop = asyncio.get_running_loop()
+
+        def Submit(chunk):
+            if self.workers == 0:
+                future = loop.create_future()
+                try:
+                    future.set_result(_StreamChunk(chunk, structured))
+                except (KeyError, ValueError) as error:
+                    future.set_exception(error)
+                return future
+            return loop.run_in_executor(
+                self._Executor(), _StreamChunk, chunk, structured
+            )
+
+        # The first chunk is ready before the 200 goes out, so errors such as
+        # unsatisfiable constraints still get an error status
+        try:
+            seed, structured, chunks = _StreamChunks(body)
+            data = await Submit(next(chunks))
+        except (HttpError, KeyError, ValueError) as error:
+            if isinstance(error, HttpError):
+                status = error.status
+            else:
+                status = 404 if isinstance(error, KeyError) else 400
+            writer.write(
+                _Response(
+                    status,
+                    lambda_handler.Headers,
+                    json.dumps({"error": error.args[0]}),
+                    keepAlive,
+                )
+            )
+            await writer.drain()
+            return keepAlive
+        except Exception:
+            response = _InternalError()
+            writer.write(
+                _Response(500, response["headers"], response["body"], keepAlive)
+            )
+            await writer.drain()
+            return keepAlive
+
+        headers = dict(lambda_handler.Headers)
+        headers["Content-Type"] = "application/x-ndjson"
+        headers["X-Randomizer-Seed"] = str(seed)
+        headers["Transfer-Encoding"] = "chunked"
+        writer.write(_Head(200, headers, keepAlive))
+
+        # The next chunk is generated while this one is sent. Draining waits
+        # while the client is behind, and raises once it has gone.
+        future = None
+        try:
+            for chunk in chunks:
+                if self.closing:
+                    # End endless streams cleanly on shutdown
+                    break
+                future = Submit(chunk)
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+                data = await future
+            future = None
+        except (KeyError, ValueError):
+            # Too late for an error status. Without the last chunk the client
+            # can tell the stream is incomplete.
+            writer.transport.abort()
+            return False
+        finally:
+            if future is not None:
+                future.cancel()
+        writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        await writer.drain()
+        return keepAlive and not self.closing
+
+    async def HandleConnection(self, reader, writer):
+        task = asyncio.current_task()
+        # The writer, and whether a request is being answered so shutdown
+        # waits for it
+        self.connections[task] = [writer, False]
+        try:
+            while not self.closing:
+                try:
+                    request = await asyncio.wait_for(
+                        _ReadRequest(reader), KeepAliveTimeout
+                    )
+                except HttpError as error:
+                    writer.write(
+                        _Response(
+                            error.status,
+                            lambda_handler.Headers,
+                            json.dumps({"error": str(error)}),
+                            False,
+                        )
+                    )
+                    break
+                if request is None:
+                    break
+                method, path, headers, body, keepAlive = request
+
+                self.connections[task][1] = True
+                if method == "POST" and path.rstrip("/").endswith("/stream"):
+                    keepAlive = await self._Stream(writer, body, keepAlive)
+                    self.connections[task][1] = False
+                    if not keepAlive:
+                        break
+                    continue
+                if method in Methods:
+                    response = await self._Answer(_Event(method, path, headers, body))
+                else:
+                    response = {
+                        "statusCode": 405,
+                        "headers": dict(
+                            lambda_handler.Headers, Allow=", ".join(Methods)
+                        ),
+                        "body": json.dumps({"error": "Method not allowed"}),
+                    }
+                keepAlive = keepAlive and not self.closing
+                writer.write(
+                    _Response(
+                        response["statusCode"],
+                        response["headers"],
+                        response.get("body"),
+                        keepAlive,
+                    )
+                )
+                await writer.drain()
+                self.connections[task][1] = False
+                if not keepAlive:
+                    break
+        except (
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+        ):
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def Serve(self, host, port, reusePort=False, ready=None):
+        server = await asyncio.start_server(
+            self.HandleConnection, host, port, reuse_port=reusePort or None
+        )
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signalNumber in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signalNumber, stopping.set)
+        if ready is not None:
+            ready(server.sockets[0].getsockname())
+
+        await stopping.wait()
+        await self.Shutdown(server)
+
+    async def Shutdown(self, server):
+        # Stop accepting, close idle connections and give busy ones
+        # ShutdownTimeout seconds to finish. Closing a connection ends its
+        # read, so its task finishes on its own.
+        self.closing = True
+        server.close()
+        for writer, busy in list(self.connections.values()):
+            if not busy:
+                writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=ShutdownTimeout)
+        for writer, _ in list(self.connections.values()):
+            writer.transport.abort()
+        await server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def _Run(host, port, workers, reusePort):
+    asyncio.run(
+        Server(workers).Serve(
+            host,
+            port,
+            reusePort,
+            lambda address: print(
+                "Listening on {}:{}".format(*address[:2]), flush=True
+            ),
+        )
+    )
+
+
+def _Main():
+    parser = argparse.ArgumentParser(description="Serve the randomizer over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="event loop processes sharing the port with SO_REUSEPORT",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes for heavy requests in each event loop process (default: "
+        "one per CPU, 0 answers them on the loop)",
+    )
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        _Run(args.host, args.port, args.workers, False)
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=_Run, args=(args.host, args.port, args.workers, True)
+        )
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def Stop(signalNumber, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, Stop)
+    signal.signal(signal.SIGINT, Stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    _Main()
@@ -0,0 +1,152 @@
+# Synergy scores for picking the best of several candidate kingdoms, from
+# synergy.txt: a score for each card and one for each pair of cards, matched
+# by name or by the types and keywords in cardinfo.txt. They are compiled on
+# first use into an array and a matrix indexed by Card.id, so scoring a batch
+# of candidates is a NumPy gather over a candidates x cards matrix of card IDs.
+# Without NumPy the same sums run in Python, which is much slower.
+import os
+import threading
+import cardinfo
+from randomizer import AllCards, _Numpy
+
+SynergyPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synergy.txt")
+
+
+def _MaskIds(mask):
+    ids = []
+    while mask:
+        lowest = mask & -mask
+        ids.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return ids
+
+
+def _Selector(index, cards, text):
+    # Mask of the cards a selector in synergy.txt matches
+    if text.startswith("type:"):
+        mask = index.typeMasks.get(text[len("type:") :])
+    elif text.startswith("keyword:"):
+        mask = index.keywordMasks.get(text[len("keyword:") :])
+    else:
+        mask = cards[text].mask if text in cards else None
+    if not mask:
+        raise ValueError("Unknown synergy selector: {}".format(text))
+    return mask
+
+
+class SynergyScores(object):
+    def __init__(self, lines):
+        index = cardinfo.LoadCardInfo()
+        cards = {str(card): card for card in AllCards}
+        # Padding ID for kingdoms with fewer cards than the widest one, with a
+        # score of 0 and no synergy with anything
+        self.padding = len(AllCards)
+        scores = [0.0] * (self.padding + 1)
+        pairs = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.split("|")]
+            try:
+                score = float(fields[-1])
+            except ValueError:
+                raise ValueError("Malformed synergy: {}".format(line))
+            selectors = [_Selector(index, cards, field) for field in fields[:-1]]
+            if len(selectors) == 1:
+                for cardId in _MaskIds(selectors[0]):
+                    scores[cardId] += score
+            elif len(selectors) == 2:
+                pairs.append((selectors[0], selectors[1], score))
+            else:
+                raise ValueError("Malformed synergy: {}".format(line))
+
+        numpy = _Numpy()
+        if numpy:
+            self.scores = numpy.array(scores)
+            self.matrix = numpy.zeros((self.padding + 1, self.padding + 1))
+            for first, second, score in pairs:
+                # Each pair of different cards counts once, whichever of them
+                # matches which selector
+                matches = numpy.outer(self._Matches(first), self._Matches(second))
+                matches |= matches.T
+                numpy.fill_diagonal(matches, False)
+                self.matrix += score * matches
+        else:
+            self.scores = scores
+            self.matrix = [[0.0] * (self.padding + 1) for _ in scores]
+            for first, second, score in pairs:
+                matched = set()
+                for a in _MaskIds(first):
+                    for b in _MaskIds(second):
+                        if a != b:
+                            matched.add((min(a, b), max(a, b)))
+                for a, b in matched:
+                    self.matrix[a][b] += score
+                    self.matrix[b][a] += score
+
+    def _Matches(self, mask):
+        # Boolean vector over the card IDs and the padding ID
+        numpy = _Numpy()
+        bits = bin(mask)[:1:-1].ljust(self.padding + 1, "0").encode()
+        return numpy.frombuffer(bits, dtype=numpy.uint8) == ord("1")
+
+    def Scores(self, masks):
+        # Score of the kingdom in each mask of card IDs: its cards' scores plus
+        # the scores of each pair of its cards
+        numpy = _Numpy()
+        if not numpy:
+            kingdoms = [_MaskIds(mask) for mask in masks]
+            matrix = self.matrix
+            return [
+                sum(self.scores[a] for a in kingdom)
+                + sum(
+                    matrix[a][b]
+                    for position, a in enumerate(kingdom)
+                    for b in kingdom[position + 1 :]
+                )
+                for kingdom in kingdoms
+            ]
+
+        # The set bits of each mask become a row of card IDs, padded on the
+        # right to the widest kingdom
+        size = (self.padding + 7) // 8
+        bits = numpy.unpackbits(
+            numpy.frombuffer(
+                b"".join(mask.to_bytes(size, "little") for mask in masks),
+                dtype=numpy.uint8,
+            ).reshape(len(masks), size),
+            axis=1,
+            bitorder="little",
+        )
+        rows, columns = numpy.nonzero(bits)
+        counts = bits.sum(axis=1, dtype=numpy.intp)
+        starts = numpy.cumsum(counts) - counts
+        ids = numpy.full((len(masks), counts.max(initial=0)), self.padding)
+        ids[rows, numpy.arange(len(rows)) - starts[rows]] = columns
+        # The matrix is symmetric with a zero diagonal, so the sum over all
+        # ordered pairs counts each pair twice
+        pairs = self.matrix[ids[:, :, None], ids[:, None, :]].sum(axis=(1, 2))
+        return self.scores[ids].sum(axis=1) + pairs / 2
+
+    def Best(self, masks):
+        # Index of the highest scoring mask, the first one on a tie
+        scores = self.Scores(masks)
+        if _Numpy():
+            return int(scores.argmax())
+        return max(range(len(scores)), key=scores.__getitem__)
+
+
+_synergyLock = threading.Lock()
+_synergy = None
+
+
+def LoadSynergy():
+    # The SynergyScores, read from synergy.txt on first use
+    global _synergy
+    if _synergy is None:
+        with _synergyLock:
+            if _synergy is None:
+                with open(SynergyPath, encoding="utf-8") as synergyFile:
+                    _synergy = SynergyScores(synergyFile.read().splitlines())
+    return _synergy
@@ -0,0 +1,338 @@
+# Seeded checks of the randomizer's probability model and the guarantees its
+# options make. Run with: python3 -m pytest test_randomizer.py
+import math
+import random
+from collections import Counter
+import pytest
+import cardinfo
+from randomizer import (
+    AllCards,
+    BalanceOptions,
+    CardWeights,
+    CardTypes,
+    DecodeShareCode,
+    GenerateKingdoms,
+    GetCardPools,
+    GetProbabilities,
+    LoadCatalog,
+    MaxAttacks,
+    MaxTables,
+    RandomizeDominion,
+    RandomizeDominionBatch,
+    RandomizeTables,
+    ShareCode,
+    MaxWeight,
+    _DrawCards,
+    _ParseWeights,
+    _PartialShuffle,
+)
+
+Draws = 20000
+
+
+def _Critical(degrees, z=3.09):
+    # Upper 0.1% point of the chi-square distribution (Wilson-Hilferty)
+    scale = 2 / (9 * degrees)
+    return degrees * (1 - scale + z * math.sqrt(scale)) ** 3
+
+
+def _ChiSquare(first, second):
+    # Two-sample chi-square statistic and degrees of freedom for counts drawn
+    # the same number of times
+    keys = set(first) | set(second)
+    statistic = sum(
+        (first[key] - second[key]) ** 2 / (first[key] + second[key]) for key in keys
+    )
+    return statistic, len(keys) - 1
+
+
+def _Ids(mask):
+    return [index for index, bit in enumerate(bin(mask)[:1:-1]) if bit == "1"]
+
+
+def _Frequencies(pools, shuffle, seed):
+    rng = random.Random(seed)
+    cards = Counter()
+    landscapes = Counter()
+    for _ in range(Draws):
+        resultMask, landscapeList = _DrawCards(pools, None, shuffle(rng), rng)
+        cards.update(_Ids(resultMask))
+        cards.update(card.id for card in landscapeList)
+        landscapes[len(landscapeList)] += 1
+    return cards, landscapes
+
+
+def _Pools():
+    # Few Kingdom cards against many landscapes, where the landscape count
+    # depends most on how the pile is dealt
+    return GetCardPools(["Adventures", "Empires", "Menagerie"])
+
+
+def testPartialShuffleIsAPermutation():
+    population = list(range(50))
+    for seed in range(100):
+        shuffled = list(_PartialShuffle(population, random.Random(seed)))
+        assert sorted(shuffled) == population
+
+
+def testPartialShuffleMatchesFullShuffle():
+    pools = _Pools()
+    size = len(pools.complete)
+    partial = _Frequencies(pools, lambda rng: _PartialShuffle(pools.complete, rng), 1)
+    full = _Frequencies(pools, lambda rng: rng.sample(pools.complete, size), 2)
+    for first, second in zip(partial, full):
+        statistic, degrees = _ChiSquare(first, second)
+        assert statistic < _Critical(degrees), (statistic, degrees)
+
+
+def _Cards(kingdom, mouse=False):
+    # The Kingdom and landscape cards of a formatted kingdom, Bane included.
+    # The Mouse isn't in the kingdom unless mouse is set, and setup
+    # components aren't cards.
+    LoadCatalog()
+    names = {str(card): card for card in AllCards}
+    cards = []
+    for line in kingdom:
+        if line.startswith("Mouse is "):
+            if not mouse:
+                continue
+            line = line[len("Mouse is ") :]
+        if line.startswith("Bane is "):
+            line = line[len("Bane is ") :]
+        if line in names:
+            cards.append(names[line])
+    return cards
+
+
+def testConstrainedKingdomsMeetTheirConstraints():
+    setNames = ["Base", "Intrigue", "Adventures", "Cornucopia"]
+    constraints = [
+        {"set": "Base", "min": 3, "max": 4},
+        {"type": "Event", "max": 0},
+        {"card": "Chapel"},
+    ]
+    for seed in range(300):
+        cards = _Cards(RandomizeDominion(setNames, seed=seed, constraints=constraints))
+        names = [str(card) for card in cards]
+        assert 3 <= sum(card.set.name == "Base" for card in cards) <= 4, names
+        assert not any(CardTypes["Event"] in card.types for card in cards), names
+        assert "Base: Chapel" in names
+
+
+@pytest.mark.parametrize(
+    "setNames, constraints, message",
+    [
+        (None, [{"type": "Way", "min": 2}], "type Way"),
+        (["Base"], [{"set": "Intrigue"}], "set Intrigue"),
+        (["Base"], [{"set": "Base", "max": 3}], "set Base"),
+        (
+            None,
+            [{"set": "Base", "min": 6}, {"set": "Intrigue", "min": 6}],
+            "set Base, set Intrigue",
+        ),
+    ],
+)
+def testImpossibleConstraintsRaise(setNames, constraints, message):
+    with pytest.raises(ValueError, match=message):
+        RandomizeDominion(setNames, constraints=constraints)
+
+
+@pytest.mark.parametrize(
+    "options, weights",
+    [({"guarantee-buy": True}, None), (None, {"sets": {"Base": 2}})],
+)
+def testConstraintsRejectBalanceAndWeights(options, weights):
+    constraints = [{"set": "Base", "min": 2}]
+    with pytest.raises(ValueError, match="Constraints can't be combined"):
+        RandomizeDominionBatch(None, options, 5, 1, constraints, weights=weights)
+    with pytest.raises(ValueError, match="Constraints can't be combined"):
+        list(GenerateKingdoms(None, options, 5, 1, 1, 10, constraints, weights=weights))
+
+
+def testShareCodesRoundTrip():
+    for seed in range(200):
+        kingdom = RandomizeDominion(seed=seed)
+        code = ShareCode(kingdom)
+        assert DecodeShareCode(code) == kingdom
+        assert RandomizeDominion(seed=seed, structured=True)["code"] == code
+
+
+@pytest.mark.parametrize(
+    "code, kingdom",
+    [
+        (
+            "AQALBwUeVQULMVSPAUsF9QE9Cg",
+            [
+                "Antiquities: Grave Watcher",
+                "Base: Poacher",
+                "Base: Vassal",
+                "Cornucopia: Hamlet",
+                "Cornucopia: Remake",
+                "Dark Ages: Graverobber",
+                "Dark Ages: Shelters",
+                "Empires: Sacrifice",
+                "Hinterlands: Develop",
+                "Intrigue: Conspirator",
+                "Menagerie: Mastermind",
+                "(Adventures Event): Borrow",
+                "(Empires Landmark): Battlefield",
+                "(Empires Landmark): Palace",
+            ],
+        ),
+        (
+            "AQGAAQ8BAgcBBAEGbAMB8AIBAQEB",
+            [
+                "Base: Bandit",
+                "Base: Chapel",
+                "Base: Harbinger",
+                "Base: Militia",
+                "Base: Mine",
+                "Base: Moneylender",
+                "Base: Throne Room",
+                "Cornucopia: Bag of Gold",
+                "Cornucopia: Diadem",
+                "Cornucopia: Farming Village",
+                "Cornucopia: Followers",
+                "Cornucopia: Princess",
+                "Cornucopia: Tournament",
+                "Cornucopia: Trusty Steed",
+                "Cornucopia: Young Witch",
+                "Bane is Cornucopia: Fortune Teller",
+            ],
+        ),
+    ],
+)
+def testShareCodesAreStable(code, kingdom):
+    # Codes already shared must keep decoding to the same kingdom
+    assert DecodeShareCode(code) == kingdom
+    assert ShareCode(kingdom) == code
+
+
+@pytest.mark.parametrize("code", ["", "!!", "AA", None])
+def testBadShareCodesRaise(code):
+    with pytest.raises(ValueError):
+        DecodeShareCode(code)
+
+
+@pytest.mark.parametrize("setNames", [None, ["Base", "Cornucopia"], ["Base"]])
+def testTablesShareNoCards(setNames):
+    # At the most tables the pool allows, where the deal runs out first
+    tables = MaxTables(setNames)
+    for seed in range(100):
+        seen = set()
+        for kingdom in RandomizeTables(setNames, tables=tables, seed=seed):
+            cards = _Cards(kingdom, mouse=True)
+            assert not seen & set(cards), [str(card) for card in seen & set(cards)]
+            seen.update(cards)
+
+
+@pytest.mark.parametrize("setNames", [None, ["Base", "Cornucopia"], ["Base"]])
+def testTablesAboveMaxTablesRaise(setNames):
+    tables = MaxTables(setNames)
+    assert len(RandomizeTables(setNames, tables=tables, seed=1)) == tables
+    for count in (0, tables + 1):
+        with pytest.raises(
+            ValueError, match="enough cards for 1 to {} tables".format(tables)
+        ):
+            RandomizeTables(setNames, tables=count)
+
+
+@pytest.mark.parametrize(
+    "weights, message",
+    [
+        ({"sets": {"Base": -1}}, "Weights must be numbers"),
+        ({"sets": {"Base": float("nan")}}, "Weights must be numbers"),
+        ({"sets": {"Base": float("inf")}}, "Weights must be numbers"),
+        ({"sets": {"Base": 1e308}}, "Weights must be numbers"),
+        ({"cards": {"Chapel": MaxWeight * 2}}, "Weights must be numbers"),
+        ({"cards": {"Chapel": True}}, "Weights must be numbers"),
+        ({"cards": {"Chapel": "2"}}, "Weights must be numbers"),
+        ({"sets": {"Nowhere": 2}}, "Unknown set: Nowhere"),
+        ({"cards": {"Nothing": 2}}, "Unknown card: Nothing"),
+        ({"sets": ["Base"]}, "weights sets must be an object"),
+        ({"set": {"Base": 2}}, "weights must be an object"),
+    ],
+)
+def testBadWeightsRaise(weights, message):
+    with pytest.raises(ValueError, match=message):
+        _ParseWeights(weights)
+
+
+def testLargestWeightsStayFinite():
+    weights = {"sets": {"Base": MaxWeight}, "cards": {"Chapel": MaxWeight}}
+    kingdom = RandomizeDominion(seed=1, weights=weights)
+    assert "Base: Chapel" in kingdom
+
+
+def testDoubleSetWeightDoublesItsShare():
+    # The first card drawn is picked in proportion to its weight, so Base
+    # cards come up twice as often as each Intrigue card
+    pools = GetCardPools(["Base", "Intrigue"])
+    weights = CardWeights(pools, {"sets": {"Base": 2}})
+    rng = random.Random(1)
+    counts = Counter(next(weights.Shuffled(rng)) for _ in range(Draws))
+    base = [card for card in pools.complete if card.set.name == "Base"]
+    total = 2 * len(base) + len(pools.complete) - len(base)
+    statistic = sum(
+        (counts[card] - Draws * weights.Weight(card) / total) ** 2
+        / (Draws * weights.Weight(card) / total)
+        for card in pools.complete
+    )
+    assert statistic < _Critical(len(pools.complete) - 1), statistic
+    share = sum(counts[card] for card in base) / Draws
+    assert share == pytest.approx(2 * len(base) / total, abs=0.02)
+
+
+def _Balanced(option, cards):
+    # Whether the Kingdom cards meet a balance option, checked card by card
+    # against cardinfo.txt
+    index = cardinfo.LoadCardInfo()
+    infos = [
+        index.Info(card)
+        for card in cards
+        if not card.mask & LoadCatalog().LandscapeCards.mask
+    ]
+    if option == "guarantee-buy":
+        return any("+Buy" in info.keywords for info in infos)
+    if option == "guarantee-trasher":
+        return any("Trasher" in info.keywords for info in infos)
+    if option == "village-for-draw":
+        draw = any(
+            "Action" in info.types
+            and "+Card" in info.keywords
+            and not info.keywords & {"+Action", "Village"}
+            for info in infos
+        )
+        return not draw or any("Village" in info.keywords for info in infos)
+    if option == "cost-spread":
+        costs = {
+            "$5+" if info.debt or info.coins >= 5 else max(info.coins, 2)
+            for info in infos
+        }
+        return costs >= {2, 3, 4, "$5+"}
+    if option == "limit-attacks":
+        return sum("Attack" in info.types for info in infos) <= MaxAttacks
+
+
+@pytest.mark.parametrize("option", BalanceOptions)
+def testBalanceOptionsHold(option):
+    for seed in range(300):
+        cards = _Cards(RandomizeDominion(options={option: True}, seed=seed))
+        assert _Balanced(option, cards), [str(card) for card in cards]
+
+
+def testBalanceOptionsHoldTogether():
+    options = dict.fromkeys(BalanceOptions, True)
+    setNames = ["Base", "Intrigue", "Seaside", "Prosperity"]
+    for seed in range(300):
+        cards = _Cards(RandomizeDominion(setNames, options, seed=seed))
+        for option in BalanceOptions:
+            assert _Balanced(option, cards), (option, [str(card) for card in cards])
+
+
+def testBalanceOptionsRejectProbabilitiesAndTables():
+    options = {"guarantee-buy": True}
+    with pytest.raises(ValueError, match="balance options"):
+        GetProbabilities(None, options)
+    with pytest.raises(ValueError, match="balance options"):
+        RandomizeTables(None, options, tables=2)
@@ -4,6 +4,77 @@ document.addEventListener("DOMContentLoaded", function (event) {
     const url =
         "https://nv1gwscvf9.execute-api.us-west-2.amazonaws.com/default/DominionRandomizer/";
 
+    // The parsed body, or an Error with the API's message for an error status
+    function readResponse(response) {
+        return response.json().then(
+            (body) => {
+                if (!response.ok) {
+                    throw new Error(body.error || response.statusText);
+                }
+                return body;
+            },
+            () => {
+                throw new Error(
+                    "The randomizer answered with status " + response.status
+                );
+            }
+        );
+    }
+
+    // What the share IDs in structured responses stand for. It only changes
+    // with a deploy, so it is fetched once and the browser caches it. A
+    // deploy can add IDs that a cached copy doesn't have yet, so reload
+    // skips the browser cache.
+    var dictionary = null;
+
+    function getDictionary(reload) {
+        if (dictionary === null || reload) {
+            dictionary = fetch(url + "dictionary", {
+                mode: "cors",
+                cache: reload ? "reload" : "default",
+            })
+                .then(readResponse)
+                .catch((error) => {
+                    // Try again with the next kingdom
+                    dictionary = null;
+                    throw error;
+                });
+        }
+        return dictionary;
+    }
+
+    // Whether the kingdom has share IDs newer than the dictionary
+    function hasUnknownIds(kingdom, entries) {
+        return kingdom.kingdom
+            .concat(kingdom.landscapes, kingdom.setup, [
+                kingdom.bane,
+                kingdom.mouse,
+            ])
+            .some((id) => id !== null && entries[id] === undefined);
+    }
+
+    // The same lines the plain string format has
+    function formatKingdom(kingdom, entries) {
+        let cards = kingdom.kingdom.slice();
+        let landscapes = kingdom.landscapes.slice();
+        for (const id of kingdom.setup) {
+            (entries[id][2] ? landscapes : cards).push(id);
+        }
+
+        const byName = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+        let lines = cards.map((id) => entries[id][0]).sort(byName);
+        if (kingdom.bane !== null) {
+            lines.push("Bane is " + entries[kingdom.bane][0]);
+        }
+        lines = lines.concat(
+            landscapes.map((id) => entries[id][0]).sort(byName)
+        );
+        if (kingdom.mouse !== null) {
+            lines.push("Mouse is " + entries[kingdom.mouse][0]);
+        }
+        return lines;
+    }
+
     form.addEventListener(
         "submit",
         (event) => {
@@ -16,6 +87,7 @@ document.addEventListener("DOMContentLoaded", function (event) {
             var data = {
                 sets: [],
                 options: {},
+                format: "structured",
             };
 
             for (var i = 0; i < form.sets.elements.length; i++) {
@@ -34,16 +106,27 @@ document.addEventListener("DOMContentLoaded", function (event) {
                 data.options[checkbox.name] = checkbox.checked;
             }
 
-            fetch(url, {
-                method: "POST",
-                mode: "cors",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify(data),
-            })
-                .then((response) => response.json())
-                .then((data) => {
+            Promise.all([
+                fetch(url, {
+                    method: "POST",
+                    mode: "cors",
+                    headers: {
+                        "Content-Type": "application/json",
+                    },
+                    body: JSON.stringify(data),
+                }).then(readResponse),
+                getDictionary(),
+            ])
+                .then(([kingdom, dictionary]) =>
+                    hasUnknownIds(kingdom, dictionary.entries)
+                        ? getDictionary(true).then((dictionary) => [
+                              kingdom,
+                              dictionary,
+                          ])
+                        : [kingdom, dictionary]
+                )
+                .then(([kingdom, dictionary]) => {
+                    let data = formatKingdom(kingdom, dictionary.entries);
                     let ul = document.createElement("ul");
                     for (var i = 0; i < data.length; i++) {
                         let li = document.createElement("li");
@@ -53,6 +136,14 @@ document.addEventListener("DOMContentLoaded", function (event) {
                     }
                     cards.appendChild(ul);
                     cards.scrollIntoView({ behavior: "smooth" });
+                })
+                .catch((error) => {
+                    // Such as options the selected sets can't satisfy
+                    let p = document.createElement("p");
+                    p.className = "error";
+                    p.appendChild(document.createTextNode(error.message));
+                    cards.appendChild(p);
+                    cards.scrollIntoView({ behavior: "smooth" });
                 });
         },
         false